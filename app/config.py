@@ -1,6 +1,6 @@
 # app/config.py
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Deep Agents API"
@@ -12,9 +12,9 @@ class Settings(BaseSettings):
     LANGSMITH_PROJECT: Optional[str] = None
     LANGSMITH_API_KEY: Optional[str] = None
 
-    # Keys
-    GOOGLE_GENAI_API_KEY: str
-    TAVILY_API_KEY: str
+    # Keys (not needed with LLM_PROVIDER=scripted)
+    GOOGLE_GENAI_API_KEY: Optional[str] = None
+    TAVILY_API_KEY: Optional[str] = None
 
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = [
@@ -24,6 +24,105 @@ class Settings(BaseSettings):
 
     # Flags
     ENABLE_BACKGROUND_TASKS: bool = True
+    WARMUP_ON_STARTUP: bool = True  # load models/collections/agents before /health/ready turns green
+
+    # Supervisor: "parallel" sends both subagents out in one turn for notes with diagnoses and procedures
+    SUBAGENT_DISPATCH: Literal["parallel", "sequential"] = "parallel"
+
+    # Concurrency
+    RETRIEVAL_MAX_WORKERS: int = 4  # threads for query embedding + Chroma search
+    # Vector search: "chroma" queries Chroma's HNSW index per call; "numpy" exports every collection
+    # into memory at startup (warm-up) and answers with an exact brute-force search
+    RETRIEVAL_BACKEND: Literal["chroma", "numpy"] = "chroma"
+    # numpy backend storage: "int8"/"float16" keep a quantized copy on the heap and memory-map the float32
+    # vectors from RETRIEVAL_VECTORS_DIR to rescore the RETRIEVAL_RESCORE_FACTOR * k best candidates
+    RETRIEVAL_QUANTIZATION: Literal["none", "float16", "int8"] = "none"
+    RETRIEVAL_RESCORE_FACTOR: int = 10
+    RETRIEVAL_VECTORS_DIR: str = "state/vectors"
+    # Speculative retrieval: run icd10_query / icd10pcs_procedure_query on the raw message while the
+    # supervisor's first turn is in flight; a subagent query with this much word overlap reuses the result
+    RETRIEVAL_PREFETCH: bool = False
+    RETRIEVAL_PREFETCH_MIN_OVERLAP: float = 0.8
+    # Query embedding LRU shared by the retrieval tools (0 = off); EMBED_CACHE_PATH adds a SQLite tier
+    EMBED_CACHE_MAX_ENTRIES: int = 4096
+    EMBED_CACHE_PATH: Optional[str] = None  # e.g. "state/embed_cache.sqlite3"
+    EMBED_CACHE_MAX_DISK_ENTRIES: int = 100_000
+
+    # LLM provider: "scripted" replays canned tool-calling turns offline (load tests, profiling)
+    LLM_PROVIDER: Literal["google_genai", "scripted"] = "google_genai"
+    LLM_SCRIPT_PATH: Optional[str] = None  # JSON rules / recorded conversations; unset = built-in ICD-10 script
+    LLM_SCRIPTED_LATENCY: str = "lognormal:0.8,0.4"  # time to first token: fixed|uniform|normal|lognormal|exponential
+    LLM_SCRIPTED_TOKEN_SECONDS: float = 0.004  # per output token
+    LLM_SCRIPTED_SEED: Optional[int] = None
+
+    # Gemini rate limits, shared by every agent (0 = unlimited) + retry on 429/5xx
+    LLM_RPM: int = 1000
+    LLM_TPM: int = 1_000_000
+    LLM_RATE_LIMIT_PATH: Optional[str] = None  # e.g. "state/ratelimit.sqlite3": share budgets across processes
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_SECONDS: float = 1.0
+    LLM_RETRY_MAX_SECONDS: float = 30.0
+    LLM_BATCH_CONCURRENCY: int = 8  # default in-flight calls for LLM.batch / LLM.abatch
+
+    # Outbound HTTP (Gemini, Tavily): one shared keep-alive pool per upstream, HTTP/2 when `h2` is installed
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_KEEPALIVE_SECONDS: float = 60.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    HTTP_TIMEOUT_SECONDS: float = 120.0  # whole Gemini call; read timeout elsewhere
+    HTTP2_ENABLED: bool = True
+
+    # LLM call cache (temperature 0: repeated turns are replayed from disk instead of calling Gemini)
+    LLM_CACHE_PATH: Optional[str] = None  # e.g. "state/llm_cache.sqlite3"; unset = off
+    LLM_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # Retrieval tool output: "compact" prints one pipe-separated line per candidate (far fewer prompt tokens)
+    TOOL_OUTPUT_FORMAT: Literal["verbose", "compact"] = "verbose"
+
+    # Token budgets per request / per thread (0 = unlimited): the run stops before the call that
+    # would overrun; tool results are cut to TOOL_OUTPUT_MAX_TOKENS and to a share of what is left
+    TOKEN_BUDGET_PER_REQUEST: int = 0
+    TOKEN_BUDGET_PER_THREAD: int = 0
+    TOOL_OUTPUT_MAX_TOKENS: int = 0
+    TOOL_OUTPUT_BUDGET_SHARE: float = 0.25
+
+    # Session + checkpoint state (pending approvals and LangGraph checkpoints)
+    STATE_BACKEND: Literal["memory", "sqlite"] = "memory"
+    STATE_SQLITE_PATH: str = "state/agent_state.sqlite3"
+    STATE_TTL_SECONDS: int = 3600
+    STATE_MAX_THREADS: int = 5000
+    STATE_MAX_BYTES: int = 256 * 1024 * 1024
+    STATE_MAX_CHECKPOINTS_PER_THREAD: int = 4
+
+    # Admission control (concurrent agent runs; the excess waits in a bounded queue, then gets 429)
+    ADMISSION_MAX_CONCURRENCY: int = 16
+    ADMISSION_PER_CLIENT_CONCURRENCY: int = 8  # per X-Client-Id header, else per client IP
+    ADMISSION_BATCH_MAX_CONCURRENCY: int = 10  # batch/job/eval share; the rest stays free for interactive
+    ADMISSION_QUEUE_SIZE: int = 64  # waiters per lane
+    ADMISSION_MAX_WAIT_SECONDS: float = 20.0
+
+    # Batch coding
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_DEFAULT_CONCURRENCY: int = 8
+    BATCH_MAX_CONCURRENCY: int = 32
+    BATCH_RATE_PER_SEC: float = 5.0  # item starts/sec shared by all batches in this process (0 = unlimited)
+    BATCH_RATE_BURST: int = 10
+
+    # Async jobs
+    JOB_QUEUE_BACKEND: Literal["memory", "redis"] = "memory"
+    JOB_REDIS_URL: Optional[str] = None
+    JOB_WORKERS: int = 4
+    JOB_RESULT_TTL_SECONDS: int = 3600  # counted from when the job finishes
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 60  # redis: a running job whose worker stops renewing this long is requeued
+
+    # Response cache (completed answers of new conversations; temperature is 0)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: int = 24 * 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    RESPONSE_CACHE_PATH: Optional[str] = None  # e.g. "state/response_cache.sqlite3": shared on-disk tier
+    RESPONSE_CACHE_MAX_DISK_ENTRIES: int = 100_000
+
+    # Streaming
+    STREAM_HEARTBEAT_SECONDS: float = 10.0  # SSE keep-alive comment interval while the agent is busy
 
     class Config:
         env_file = ".env"
@@ -1,12 +1,60 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 import uvicorn
 from app.routers.chat import router as chat_router
+from app.routers.health import router as health_router
+from app.routers.jobs import router as jobs_router
+from app.routers.metrics import router as metrics_router
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings  # or wherever your Settings class is
+from src.http_pool import close_pools
+from src.main import STARTUP, job_pool, warm_up
+from src.metrics import histogram
 
+logger = logging.getLogger(__name__)
+
+_request_latency = histogram(
+    "http_request_duration_seconds", "API latency per endpoint (to response headers for streams)",
+    ["method", "route", "status"],
+)
+
+
+async def _warm_up():
+    t0 = time.perf_counter()
+    try:
+        timings = await asyncio.to_thread(warm_up)
+    except Exception as e:
+        STARTUP["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("Warm-up failed; /health/ready stays 503")
+        return
+    logger.info("Warm-up done in %.0f ms: %s", (time.perf_counter() - t0) * 1000, timings)
 
 
-app = FastAPI(title="Digital Twin API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pending approvals must be visible to whichever worker receives /chat/decision
+    if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1 and settings.STATE_BACKEND == "memory":
+        logger.warning("WEB_CONCURRENCY > 1 with STATE_BACKEND=memory: set STATE_BACKEND=sqlite "
+                       "so interrupted threads can be resumed on any worker")
+    # Warm up in the background so /health/live answers at once; /health/ready flips when done
+    warmup = asyncio.create_task(_warm_up()) if settings.WARMUP_ON_STARTUP else None
+    if warmup is None:
+        STARTUP["ready"] = True
+    # Background job workers live for the whole process, independent of any request
+    if settings.ENABLE_BACKGROUND_TASKS:
+        job_pool.start()
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await job_pool.stop()
+    await close_pools()
+
+
+app = FastAPI(title="Digital Twin API", lifespan=lifespan)
 
 # ✅ Add CORS middleware
 app.add_middleware(
@@ -18,8 +66,25 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, so /jobs/{job_id} stays one series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        _request_latency.observe(time.perf_counter() - t0, method=request.method, route=route, status=str(status))
+
+
 # Include routers
 app.include_router(chat_router)
+app.include_router(health_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
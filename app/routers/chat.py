@@ -1,21 +1,150 @@
 # app/routers/chat.py
-from fastapi import APIRouter, HTTPException
+import asyncio
+import functools
+import json
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timezone
-from app.schemas.chat import ChatRequest, StartResponse, DecisionRequest, DecisionResponse
-from src.main import chat, decide
+from app.config import settings
+from app.schemas.chat import BatchRequest, ChatRequest, StartResponse, DecisionRequest, DecisionResponse
+from src.admission import AdmissionRejected
+from src.main import abatch, achat, adecide, admission, astream
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+def _client_id(request: Request) -> str:
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+def _lane(request: Request) -> str:
+    # Eval scripts and other bulk callers of the interactive endpoints mark themselves as batch
+    return "batch" if request.headers.get("X-Traffic-Class", "").lower() == "batch" else "interactive"
+
+def _too_many(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 @router.post("/message", response_model=StartResponse)
-async def chat_message(payload: ChatRequest):
+async def chat_message(payload: ChatRequest, request: Request, response: Response,
+                       cache_control: Optional[str] = Header(None)):
+    # `Cache-Control: no-cache` skips the response cache lookup (the fresh answer still refreshes it)
+    use_cache = "no-cache" not in (cache_control or "").lower()
+    # The slot is only taken if the agent actually runs (not for cache hits or coalesced followers)
+    admit = functools.partial(admission.slot, _lane(request), _client_id(request))
     try:
-        return chat(payload.message, payload.thread_id)
+        result = await achat(payload.message, payload.thread_id, use_cache, admit)
+    except AdmissionRejected as e:
+        raise _too_many(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if "cache" in result:
+        response.headers["X-Cache"] = result["cache"].upper()
+    return result
 
 @router.post("/decision", response_model=DecisionResponse)
-async def chat_decision(payload: DecisionRequest):
+async def chat_decision(payload: DecisionRequest, request: Request):
     try:
-        return decide(payload.thread_id, payload.action_name, payload.decision, payload.args)
+        async with admission.slot(_lane(request), _client_id(request)):
+            return await adecide(payload.thread_id, payload.action_name, payload.decision, payload.args)
+    except AdmissionRejected as e:
+        raise _too_many(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def chat_stream(payload: ChatRequest, request: Request):
+    """Server-sent events: subagent dispatch, tool calls with timings, tokens, then `final` or `interrupt`."""
+    lane, client = _lane(request), _client_id(request)
+    # Admit before the 200 goes out so a full queue is still a plain 429
+    try:
+        await admission.acquire(lane, client)
+    except AdmissionRejected as e:
+        raise _too_many(e)
+    return _SlotStreamingResponse(
+        _sse(astream(payload.message, payload.thread_id)), lane, client,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/batch")
+async def chat_batch(payload: BatchRequest, request: Request):
+    """Code many texts concurrently; one NDJSON line (BatchItemResult) per item, in completion order."""
+    if len(payload.messages) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"batch exceeds {settings.BATCH_MAX_ITEMS} items")
+    try:
+        admission.check("batch")
+    except AdmissionRejected as e:
+        raise _too_many(e)
+    return StreamingResponse(
+        _ndjson(abatch(payload.messages, payload.concurrency, client=_client_id(request))),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """
+    Streams `content` while holding the admission slot acquired before the response was built.
+    The slot is released when the body finishes and, failing that, when the response ends: a
+    client that disconnects before the body is ever iterated never runs the generator's finally.
+    """
+
+    def __init__(self, content: AsyncIterator[str], lane: str, client: str, **kwargs):
+        self._slot: Optional[Tuple[str, str]] = (lane, client)
+        super().__init__(self._holding_slot(content), **kwargs)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+    async def _holding_slot(self, content: AsyncIterator[str]) -> AsyncIterator[str]:
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._slot is not None:
+            lane, client = self._slot
+            self._slot = None
+            admission.release(lane, client)
+
+
+async def _ndjson(items: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for item in items:
+        yield json.dumps(item, default=str) + "\n"
+
+
+async def _sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Encode agent events as SSE, with keep-alive comments so idle proxies don't cut the stream."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _pump():
+        try:
+            # Closed here, in the task that ran it, so the agent's context blocks unwind in their own context
+            async with aclosing(events):
+                async for event in events:
+                    await queue.put(event)
+        except Exception as e:
+            await queue.put({"event": "error", "data": {"error": str(e)}})
+        finally:
+            await queue.put(None)
+
+    pump = asyncio.create_task(_pump())
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    finally:
+        pump.cancel()
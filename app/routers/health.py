@@ -0,0 +1,19 @@
+# app/routers/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from src.main import STARTUP
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live")
+async def live():
+    """The process is up and the event loop is serving requests."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def ready():
+    """200 once the lifespan warm-up has finished, 503 while it runs or if it failed."""
+    if STARTUP["ready"]:
+        return {"status": "ready", "timings_ms": STARTUP["timings_ms"]}
+    status = "failed" if STARTUP["error"] else "starting"
+    return JSONResponse({"status": status, "error": STARTUP["error"]}, status_code=503)
@@ -0,0 +1,46 @@
+# app/routers/jobs.py
+import time
+from fastapi import APIRouter, HTTPException
+from app.schemas.chat import ChatRequest
+from app.schemas.jobs import JobResult, JobStats, JobStatus, JobSubmitted
+from src.jobs import TERMINAL_STATUSES
+from src.main import job_pool
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+@router.post("", response_model=JobSubmitted, status_code=202)
+async def submit_job(payload: ChatRequest):
+    try:
+        record = await job_pool.submit(payload.message, payload.thread_id)
+        return {"job_id": record["job_id"], "status": record["status"], "queue_depth": await job_pool.queue.depth()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats", response_model=JobStats)
+async def job_stats():
+    return await job_pool.stats()
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    record = await _get_or_404(job_id)
+    now = time.time() * 1000.0
+    started, finished = record.get("started_at"), record.get("finished_at")
+    return {
+        **record,
+        "wait_ms": (started or now) - record["submitted_at"],
+        "run_ms": ((finished or now) - started) if started else None,
+        "queue_depth": await job_pool.queue.depth(),
+    }
+
+@router.get("/{job_id}/result", response_model=JobResult)
+async def job_result(job_id: str):
+    record = await _get_or_404(job_id)
+    if record["status"] not in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"job is {record['status']}")
+    return record
+
+async def _get_or_404(job_id: str):
+    record = await job_pool.queue.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job_id")
+    return record
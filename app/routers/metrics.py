@@ -0,0 +1,11 @@
+# app/routers/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from src.metrics import REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of every metric registered in src.metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,17 +1,32 @@
 # app/schemas/chat.py
 from datetime import datetime
 from typing import Dict, Any, List, Union, Literal, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class ChatRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
 
 class StartResponse(BaseModel):
-    status: Literal["completed", "pending_approval"]
+    status: Literal["completed", "pending_approval", "budget_exceeded"]
     answer: Optional[str] = None
     thread_id: Optional[str] = None
     actions: Optional[List[Dict[str, Any]]] = None
+    usage: Optional[Dict[str, Any]] = None  # {"request": {...tokens by agent/tool}, "thread": {...running totals}}
+
+class BatchRequest(BaseModel):
+    messages: List[str] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: Literal["completed", "pending_approval", "budget_exceeded", "failed"]
+    latency_ms: float
+    thread_id: Optional[str] = None
+    answer: Optional[str] = None
+    actions: Optional[List[Dict[str, Any]]] = None
+    usage: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
 class DecisionRequest(BaseModel):
     thread_id: str
@@ -20,9 +35,12 @@ class DecisionRequest(BaseModel):
     args: Optional[Dict[str, Any]] = None
 
 class DecisionResponse(BaseModel):
-    status: Literal["completed", "failed"]
+    status: Literal["completed", "pending_approval", "budget_exceeded", "failed"]
     answer: Optional[str] = None
+    thread_id: Optional[str] = None
+    actions: Optional[List[Dict[str, Any]]] = None  # set when the resumed run stopped on another approval
     error: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
 
 class ConversationResponse(BaseModel):
     messages: Union[List[Dict[str, Any]], Dict[str, Any]]
@@ -0,0 +1,33 @@
+# app/schemas/jobs.py
+from typing import Dict, Any, Literal, Optional
+from pydantic import BaseModel
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: Literal["queued"]
+    queue_depth: int
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "completed", "failed", "cancelled"]
+    thread_id: Optional[str] = None
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    wait_ms: float
+    run_ms: Optional[float] = None
+    queue_depth: int
+    error: Optional[str] = None
+
+class JobStats(BaseModel):
+    queue_depth: int
+    running: int
+    workers: int
+    recent_wait_ms_p50: Optional[float] = None
+    recent_wait_ms_max: Optional[float] = None
+
+class JobResult(BaseModel):
+    job_id: str
+    status: Literal["completed", "failed", "cancelled"]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
@@ -0,0 +1,70 @@
+"""
+Batch coding benchmark for POST /chat/batch.
+
+Sends the discharge notes from data/test_csv.csv ("Nota de Alta") as one batch,
+reads the NDJSON results as they complete, and compares the batch wall time with
+the sum of per-item latencies (what N sequential /chat/message calls would cost).
+
+Usage:
+    python -m benchmarks.batch_coding --url http://127.0.0.1:8000 --limit 100 --concurrency 16
+"""
+
+import argparse
+import csv
+import json
+import time
+from collections import Counter
+
+import httpx
+
+
+def load_notes(path: str, limit: int) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    notes = [row[2] for row in rows[1:] if len(row) > 2 and row[2].strip()]
+    return notes[:limit] if limit else notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--csv", default="data/test_csv.csv")
+    parser.add_argument("--limit", type=int, default=0, help="max notes to send (0 = all)")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    notes = load_notes(args.csv, args.limit)
+    body = {"messages": notes}
+    if args.concurrency:
+        body["concurrency"] = args.concurrency
+
+    statuses = Counter()
+    latencies = []
+    t0 = time.perf_counter()
+    first = None
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        with client.stream("POST", "/chat/batch", json=body) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if first is None:
+                    first = time.perf_counter() - t0
+                statuses[item["status"]] += 1
+                latencies.append(item["latency_ms"])
+                print(f"  #{item['index']:>4} {item['status']:<16} {item['latency_ms']:>9.1f} ms")
+    wall = time.perf_counter() - t0
+
+    sequential = sum(latencies) / 1000.0
+    print("-" * 50)
+    print(f"items:              {len(latencies)} {dict(statuses)}")
+    print(f"first result after: {first or 0:.2f} s")
+    print(f"batch wall time:    {wall:.2f} s")
+    print(f"sum of latencies:   {sequential:.2f} s (sequential estimate)")
+    if wall > 0:
+        print(f"speedup:            {sequential / wall:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
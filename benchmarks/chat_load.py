@@ -0,0 +1,101 @@
+"""
+Concurrent load benchmark for POST /chat/message.
+
+Fires the same batch of coding requests at a running API with increasing
+concurrency and reports throughput and latency percentiles per level. With the
+async chat path a single uvicorn worker should scale close to linearly until
+Gemini / the retrieval pool become the bottleneck.
+
+By default every request bypasses the response cache (`Cache-Control:
+no-cache`) and carries a per-level request tag, so no level is served from the
+cache or coalesced with an identical in-flight request. `--cache` sends the
+plain descriptions instead, to measure the cached / coalesced path.
+
+Usage:
+    uvicorn app.main:app --workers 1
+    LLM_PROVIDER=scripted uvicorn app.main:app --workers 1   # or offline, with simulated Gemini latency
+    python -m benchmarks.chat_load --url http://127.0.0.1:8000 --levels 1,2,4,8,16 --requests 32
+    python -m benchmarks.chat_load --cache
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+
+from tests.test_cases import TEST_CASES
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _one(client: httpx.AsyncClient, sem: asyncio.Semaphore, message: str, latencies: List[float], errors: List[str]):
+    async with sem:
+        t0 = time.perf_counter()
+        try:
+            r = await client.post("/chat/message", json={"message": message})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run_level(url: str, concurrency: int, messages: List[str], timeout: float, cache: bool = False) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: List[str] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {} if cache else {"Cache-Control": "no-cache"}
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits, headers=headers) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_one(client, sem, m, latencies, errors) for m in messages))
+        wall = time.perf_counter() - t0
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "mean_ms": statistics.fmean(latencies) if latencies else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per level")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--cache", action="store_true",
+                        help="repeat the plain descriptions and allow cache hits / coalescing")
+    args = parser.parse_args()
+
+    descriptions = [c["description"] for c in TEST_CASES]
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+
+    print(f"{'conc':>5} {'ok':>4} {'err':>4} {'wall_s':>8} {'req/s':>7} {'p50_ms':>9} {'p95_ms':>9} {'speedup':>8}")
+    baseline = None
+    for level in levels:
+        messages = [descriptions[i % len(descriptions)] for i in range(args.requests)]
+        if not args.cache:
+            messages = [f"{m} [load c{level} #{i}]" for i, m in enumerate(messages)]
+        res = asyncio.run(run_level(args.url, level, messages, args.timeout, args.cache))
+        if baseline is None:
+            baseline = res["throughput_rps"] or None
+        speedup = res["throughput_rps"] / baseline if baseline else float("nan")
+        print(f"{res['concurrency']:>5} {res['ok']:>4} {res['errors']:>4} {res['wall_s']:>8.2f} "
+              f"{res['throughput_rps']:>7.2f} {res['p50_ms']:>9.1f} {res['p95_ms']:>9.1f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
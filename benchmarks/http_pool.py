@@ -0,0 +1,140 @@
+"""
+Connection reuse check for the pooled Gemini and Tavily clients, against a local stub server.
+
+Starts an HTTP/1.1 keep-alive stub that answers Gemini generateContent and
+Tavily /search calls, points both SDKs at it and fires --requests calls with
+--concurrency in flight: from threads (sync invoke / search) and from the event
+loop (ainvoke). Reports, per client, the requests sent and the connections the
+stub accepted, so a pool that reconnects per call (or per TLS session) shows up
+as connections ~= requests. `--baseline` also runs Gemini without the shared
+pool (the SDK's own clients) for comparison.
+
+Usage:
+    python -m benchmarks.http_pool
+    python -m benchmarks.http_pool --requests 400 --concurrency 32 --baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from app.config import settings
+
+GEMINI_REPLY = {
+    "candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]}, "finishReason": "STOP"}],
+    "usageMetadata": {"promptTokenCount": 8, "candidatesTokenCount": 1, "totalTokenCount": 9},
+}
+TAVILY_REPLY = {"query": "stub", "results": [], "response_time": 0.0}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, delay: float):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.delay = delay
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.connections = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.server.delay)
+        body = json.dumps(TAVILY_REPLY if self.path.endswith("/search") else GEMINI_REPLY).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _threaded(call: Callable[[], object], n: int, concurrency: int) -> float:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: call(), range(n)))
+    return time.perf_counter() - t0
+
+
+async def _gathered(call, n: int, concurrency: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def _one():
+        async with gate:
+            await call()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(n)))
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.02, help="stub response time (s)")
+    parser.add_argument("--baseline", action="store_true", help="also run Gemini on the SDK's own clients")
+    args = parser.parse_args()
+
+    server = StubServer(args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["GOOGLE_GEMINI_BASE_URL"] = server.url
+    settings.GOOGLE_GENAI_API_KEY = settings.GOOGLE_GENAI_API_KEY or "stub"
+
+    from langchain.chat_models import init_chat_model
+    from tavily import TavilyClient
+    from src.http_pool import pool_stats, requests_session
+    from src.llms import GoogleGenAILLM
+
+    pooled = GoogleGenAILLM(model_name="gemini-2.5-flash").llm
+    runs: Dict[str, Callable[[], float]] = {
+        "gemini sync": lambda: _threaded(lambda: pooled.invoke("hi"), args.requests, args.concurrency),
+        "gemini async": lambda: asyncio.run(_gathered(lambda: pooled.ainvoke("hi"), args.requests, args.concurrency)),
+    }
+    tavily = TavilyClient(api_key="stub", api_base_url=server.url, session=requests_session("tavily"))
+    runs["tavily sync"] = lambda: _threaded(lambda: tavily.search("stub"), args.requests, args.concurrency)
+    if args.baseline:
+        plain = init_chat_model(model_provider="google_genai", model="gemini-2.5-flash",
+                                api_key=settings.GOOGLE_GENAI_API_KEY, max_retries=1)
+        runs["baseline sync"] = lambda: _threaded(lambda: plain.invoke("hi"), args.requests, args.concurrency)
+        runs["baseline async"] = lambda: asyncio.run(
+            _gathered(lambda: plain.ainvoke("hi"), args.requests, args.concurrency))
+
+    print(f"{args.requests} requests per run, {args.concurrency} in flight, "
+          f"per-host limit {settings.HTTP_MAX_CONNECTIONS_PER_HOST}\n")
+    print(f"{'run':>15} {'seconds':>8} {'req/s':>7} {'connections':>12}")
+    for name, run in runs.items():
+        server.reset()
+        elapsed = run()
+        print(f"{name:>15} {elapsed:8.2f} {args.requests / elapsed:7.0f} {server.connections:12d}")
+    print(f"\npool stats: {json.dumps(pool_stats())}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
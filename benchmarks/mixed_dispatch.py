@@ -0,0 +1,87 @@
+"""
+End-to-end latency benchmark for notes with both diagnoses and procedures.
+
+Builds mixed cases by pairing common diagnoses with the tests/test_cases.py
+procedure descriptions, then runs each one through an in-process AgentManager
+twice: with SUBAGENT_DISPATCH=sequential (diagnosis_agent, then procedures_agent)
+and with SUBAGENT_DISPATCH=parallel (both task calls in the same turn). Reports
+latency percentiles, model calls per case and how many answers carry both code
+types. The response and LLM caches are disabled so every case runs the graph.
+
+Usage:
+    python -m benchmarks.mixed_dispatch --cases 20
+    LLM_PROVIDER=scripted python -m benchmarks.mixed_dispatch --cases 50   # offline, simulated latency
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+from app.config import settings
+from benchmarks.chat_load import _percentile
+from tests.test_cases import TEST_CASES
+
+DIAGNOSES = [
+    "type 2 diabetes mellitus without complications",
+    "community-acquired pneumonia",
+    "acute non-ST elevation myocardial infarction",
+    "acute kidney failure",
+    "urinary tract infection",
+]
+
+
+def mixed_cases(n: int) -> List[str]:
+    procedures = list(dict.fromkeys(case["description"] for case in TEST_CASES))
+    return [
+        f"Patient admitted with {DIAGNOSES[i % len(DIAGNOSES)]}. "
+        f"Procedure performed: {procedures[i % len(procedures)]}."
+        for i in range(n)
+    ]
+
+
+async def run_mode(mode: str, messages: List[str]) -> Dict[str, float]:
+    from src.llms import make_llm
+    from src.models.agent_model import AgentManager, extract_codes
+
+    settings.SUBAGENT_DISPATCH = mode
+    manager = AgentManager(llm=make_llm())
+    latencies, calls, both = [], [], 0
+    for message in messages:
+        t0 = time.perf_counter()
+        result = await manager.achat(message, use_cache=False)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        calls.append(((result.get("usage") or {}).get("request") or {}).get("calls", 0))
+        codes = extract_codes(result.get("answer") or "")
+        both += bool(codes["icd10_cm"] and codes["icd10_pcs"])
+    return {
+        "mode": mode,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "mean_ms": statistics.mean(latencies),
+        "model_calls": statistics.mean(calls),
+        "both_code_types": both / len(messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=20)
+    args = parser.parse_args()
+
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.LLM_CACHE_PATH = None
+    messages = mixed_cases(args.cases)
+    rows = [asyncio.run(run_mode(mode, messages)) for mode in ("sequential", "parallel")]
+
+    print(f"{len(messages)} mixed cases, provider={settings.LLM_PROVIDER}\n")
+    print(f"{'dispatch':>10} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'calls':>6} {'both types':>11}")
+    for r in rows:
+        print(f"{r['mode']:>10} {r['p50_ms']:9.0f} {r['p95_ms']:9.0f} {r['mean_ms']:9.0f} "
+              f"{r['model_calls']:6.1f} {r['both_code_types']:11.0%}")
+    print(f"\nparallel / sequential mean latency: {rows[1]['mean_ms'] / rows[0]['mean_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
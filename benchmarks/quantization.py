@@ -0,0 +1,73 @@
+"""
+Memory, latency and recall of the quantized NumPy backend (RETRIEVAL_QUANTIZATION).
+
+Embeds every tests/test_cases.py description once, then searches each
+collection at the top_k its tool uses with the NumPy engine in every storage
+mode: none (float32 on the heap), float16 and int8 (quantized scan, float32
+rescoring of the RETRIEVAL_RESCORE_FACTOR * k best candidates read from the
+memory-mapped copy). Reports the resident vector memory, the mean search time
+and recall@k against the float32 result, per mode.
+
+Usage:
+    python -m benchmarks.quantization
+    python -m benchmarks.quantization --repeat 20 --rescore-factor 4
+"""
+
+import argparse
+import statistics
+import time
+
+from llama_index.core import Settings
+
+from app.config import settings
+from src import tools
+from tests.test_cases import TEST_CASES
+
+COLLECTIONS = {
+    tools._COLLECTION_NAME: 5,
+    tools._COLLECTION_NAME_PARENTS: 3,
+    tools._COLLECTION_NAME_PCS: 15,
+    tools._COLLECTION_NAME_PCS_GUIDELINES: 5,
+}
+MODES = ("none", "float16", "int8")
+
+
+def _mean_us(engine, vectors, k: int, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for vector in vectors:
+            engine.search(vector, k)
+    return (time.perf_counter() - t0) * 1e6 / (repeat * len(vectors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the descriptions per mode")
+    parser.add_argument("--rescore-factor", type=int, default=settings.RETRIEVAL_RESCORE_FACTOR)
+    args = parser.parse_args()
+    settings.RETRIEVAL_RESCORE_FACTOR = args.rescore_factor
+
+    queries = list(dict.fromkeys(case["description"] for case in TEST_CASES))
+    tools.warm_up(queries[0])
+    vectors = [Settings.embed_model.get_query_embedding(q) for q in queries]
+
+    print(f"{len(queries)} descriptions x {args.repeat}, rescore factor {args.rescore_factor}, mean us per search\n")
+    print(f"{'collection':>26} {'rows':>7} {'k':>3} {'mode':>8} {'MB':>6} {'us':>8} {'recall@k':>9}")
+    for name, k in COLLECTIONS.items():
+        try:
+            index = tools._get_index_for_collection(name)
+        except Exception as e:
+            print(f"{name:>26} skipped: {e}")
+            continue
+        truth = None
+        for mode in MODES:
+            engine = tools.NumpyRetrievalEngine(name, index, quantization=mode)
+            found = [[hit.id for hit in engine.search(vector, k)] for vector in vectors]
+            truth = truth or found
+            recall = statistics.mean(len(set(t) & set(f)) / len(t) if t else 1.0 for t, f in zip(truth, found))
+            print(f"{name:>26} {len(engine.ids):7d} {k:3d} {mode:>8} {engine.resident_bytes() / 2**20:6.1f} "
+                  f"{_mean_us(engine, vectors, k, args.repeat):8.0f} {recall:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Per-call overhead of the retrieval paths over a raw Chroma query (no embedding, no model).
+
+For each collection at the top_k its tool uses, runs the same precomputed query
+vector --iterations times through:
+  as_retriever   index.as_retriever(k).retrieve(QueryBundle)  (the old per-call path)
+  prebuilt       RetrievalEngine.retriever(k).retrieve(QueryBundle)
+  engine.search  RetrievalEngine.search(vector, k) -> Hit tuples (what the tools use)
+  chroma         collection.query(...) alone, the floor every path pays
+and reports microseconds per call and the overhead above the floor.
+
+Usage:
+    python -m benchmarks.retrieval_engine
+    python -m benchmarks.retrieval_engine --iterations 2000
+"""
+
+import argparse
+import time
+from typing import Callable
+
+from llama_index.core import QueryBundle, Settings
+
+from src import tools
+
+COLLECTIONS = {
+    tools._COLLECTION_NAME: 5,
+    tools._COLLECTION_NAME_PARENTS: 3,
+    tools._COLLECTION_NAME_PCS: 15,
+    tools._COLLECTION_NAME_PCS_GUIDELINES: 5,
+}
+
+
+def _per_call_us(fn: Callable[[], object], iterations: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--query", default="Resection of appendix, percutaneous endoscopic approach")
+    args = parser.parse_args()
+
+    tools.warm_up(args.query)
+    vector = Settings.embed_model.get_query_embedding(args.query)
+    bundle = QueryBundle(query_str=args.query, embedding=vector)
+
+    print(f"{args.iterations} calls per path, us per call (overhead above chroma)\n")
+    print(f"{'collection':>26} {'k':>3} {'as_retriever':>18} {'prebuilt':>18} {'engine.search':>18} {'chroma':>8}")
+    for name, k in COLLECTIONS.items():
+        try:
+            engine = tools._get_engine(name)
+        except Exception as e:
+            print(f"{name:>26} skipped: {e}")
+            continue
+        floor = _per_call_us(lambda: engine.collection.query(
+            query_embeddings=[vector], n_results=k, include=["documents", "metadatas", "distances"]), args.iterations)
+        paths = [
+            _per_call_us(lambda: engine.index.as_retriever(similarity_top_k=k).retrieve(bundle), args.iterations),
+            _per_call_us(lambda: engine.retriever(k).retrieve(bundle), args.iterations),
+            _per_call_us(lambda: engine.search(vector, k), args.iterations),
+        ]
+        cells = " ".join(f"{us:9.0f} ({us - floor:+6.0f})" for us in paths)
+        print(f"{name:>26} {k:3d} {cells} {floor:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
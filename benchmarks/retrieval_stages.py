@@ -0,0 +1,57 @@
+"""
+Stage timings of the retrieval tools (no model calls).
+
+Runs every tests/test_cases.py description through icd10_query,
+icd10pcs_procedure_query and icd10pcs_guidelines_query, then reports the mean
+wall time per call and the per-call time spent in each stage recorded by
+tool_stage_duration_seconds (embedding, search, format). A stage that runs
+concurrently within one call (icd10_query searches two collections at once)
+can add up to more than the wall time.
+
+Usage:
+    python -m benchmarks.retrieval_stages
+    python -m benchmarks.retrieval_stages --repeat 5
+"""
+
+import argparse
+import statistics
+import time
+
+from src import tools
+from tests.test_cases import TEST_CASES
+
+TOOLS = {
+    "icd10_query": tools._icd10_query,
+    "icd10pcs_procedure_query": tools._icd10pcs_procedure_query,
+    "icd10pcs_guidelines_query": tools._icd10pcs_guidelines_query,
+}
+STAGES = ("embedding", "search", "format")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the descriptions")
+    args = parser.parse_args()
+
+    queries = list(dict.fromkeys(case["description"] for case in TEST_CASES))
+    tools.warm_up(queries[0])
+    before = {(name, stage): tools._tool_stage.summary(tool=name, stage=stage) for name in TOOLS for stage in STAGES}
+
+    print(f"{len(queries)} descriptions x {args.repeat}, mean ms per call\n")
+    print(f"{'tool':>26} {'wall':>7} " + " ".join(f"{s:>9}" for s in STAGES))
+    for name, func in TOOLS.items():
+        walls = []
+        for _ in range(args.repeat):
+            for query in queries:
+                t0 = time.perf_counter()
+                func(query)
+                walls.append((time.perf_counter() - t0) * 1000.0)
+        cells = []
+        for stage in STAGES:
+            _, total = tools._tool_stage.summary(tool=name, stage=stage)
+            cells.append(f"{(total - before[name, stage][1]) * 1000.0 / len(walls):9.2f}")
+        print(f"{name:>26} {statistics.mean(walls):7.2f} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Token-count benchmark for the retrieval tool output formats.
+
+Runs every tests/test_cases.py description through icd10pcs_procedure_query,
+icd10pcs_guidelines_query and icd10_query in both the verbose and the compact
+layout (same hits, only the formatting differs) and reports how many prompt
+tokens each layout hands to the next model turn.
+
+Tokens are estimated at ~4 characters per token (the rate limiter's heuristic);
+--gemini counts them with the Gemini tokenizer instead (needs the API key).
+
+Usage:
+    python -m benchmarks.tool_tokens
+    python -m benchmarks.tool_tokens --limit 20 --gemini
+"""
+
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+from src import tools
+from src.usage import estimate_tokens
+from tests.test_cases import TEST_CASES
+
+TOOLS = {
+    "icd10pcs_procedure_query": tools._icd10pcs_procedure_query,
+    "icd10pcs_guidelines_query": tools._icd10pcs_guidelines_query,
+    "icd10_query": tools._icd10_query,
+}
+
+
+def _gemini_counter() -> Callable[[str], int]:
+    from src.llms import GoogleGenAILLM
+    model = GoogleGenAILLM(model_name="gemini-2.5-flash").llm
+    return model.get_num_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=0, help="only the first N distinct descriptions")
+    parser.add_argument("--gemini", action="store_true", help="count with the Gemini tokenizer")
+    args = parser.parse_args()
+
+    count = _gemini_counter() if args.gemini else estimate_tokens
+    queries = list(dict.fromkeys(case["description"] for case in TEST_CASES))
+    if args.limit:
+        queries = queries[:args.limit]
+
+    print(f"{len(queries)} queries, tokens {'(Gemini)' if args.gemini else '(~4 chars/token)'}\n")
+    print(f"{'tool':28} {'verbose':>9} {'compact':>9} {'saved':>7}   (mean tokens per call)")
+    totals: Dict[str, List[int]] = {"verbose": [], "compact": []}
+    for name, fn in TOOLS.items():
+        sizes: Dict[str, List[int]] = {"verbose": [], "compact": []}
+        for query in queries:
+            for fmt in sizes:
+                sizes[fmt].append(count(fn(query, fmt=fmt)))
+        verbose, compact = statistics.mean(sizes["verbose"]), statistics.mean(sizes["compact"])
+        print(f"{name:28} {verbose:9.0f} {compact:9.0f} {1 - compact / verbose:7.0%}")
+        for fmt in totals:
+            totals[fmt].extend(sizes[fmt])
+    verbose, compact = sum(totals["verbose"]), sum(totals["compact"])
+    print(f"\n{'all calls':28} {verbose:9d} {compact:9d} {1 - compact / verbose:7.0%}   (total tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Latency and recall of the retrieval backends (RETRIEVAL_BACKEND=chroma vs numpy).
+
+Embeds every tests/test_cases.py description once, then searches each
+collection at the top_k its tool uses with both engines: Chroma's HNSW index
+and the in-memory exact NumPy search. Reports the mean search time per
+backend and Chroma's recall@k against the exact result (the share of the
+exact top-k ids Chroma also returned), plus the NumPy export time and size.
+
+Usage:
+    python -m benchmarks.vector_backend
+    python -m benchmarks.vector_backend --repeat 20
+"""
+
+import argparse
+import statistics
+import time
+
+from llama_index.core import Settings
+
+from src import tools
+from tests.test_cases import TEST_CASES
+
+COLLECTIONS = {
+    tools._COLLECTION_NAME: 5,
+    tools._COLLECTION_NAME_PARENTS: 3,
+    tools._COLLECTION_NAME_PCS: 15,
+    tools._COLLECTION_NAME_PCS_GUIDELINES: 5,
+}
+
+
+def _mean_us(engine, vectors, k: int, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for vector in vectors:
+            engine.search(vector, k)
+    return (time.perf_counter() - t0) * 1e6 / (repeat * len(vectors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the descriptions per backend")
+    args = parser.parse_args()
+
+    queries = list(dict.fromkeys(case["description"] for case in TEST_CASES))
+    tools.warm_up(queries[0])
+    vectors = [Settings.embed_model.get_query_embedding(q) for q in queries]
+
+    print(f"{len(queries)} descriptions x {args.repeat}, mean us per search\n")
+    print(f"{'collection':>26} {'rows':>7} {'k':>3} {'chroma':>8} {'numpy':>8} {'recall@k':>9} {'export ms':>10} {'MB':>6}")
+    for name, k in COLLECTIONS.items():
+        try:
+            index = tools._get_index_for_collection(name)
+        except Exception as e:
+            print(f"{name:>26} skipped: {e}")
+            continue
+        chroma = tools.RetrievalEngine(name, index)
+        t0 = time.perf_counter()
+        exact = tools.NumpyRetrievalEngine(name, index)
+        export_ms = (time.perf_counter() - t0) * 1000.0
+
+        recalls = []
+        for vector in vectors:
+            truth = {hit.id for hit in exact.search(vector, k)}
+            found = {hit.id for hit in chroma.search(vector, k)}
+            recalls.append(len(truth & found) / len(truth) if truth else 1.0)
+        chroma_us = _mean_us(chroma, vectors, k, args.repeat)
+        numpy_us = _mean_us(exact, vectors, k, args.repeat)
+        print(f"{name:>26} {exact.matrix.shape[0]:7d} {k:3d} {chroma_us:8.0f} {numpy_us:8.0f} "
+              f"{statistics.mean(recalls):9.3f} {export_ms:10.0f} {exact.resident_bytes() / 2**20:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# src/admission.py
+
+import asyncio
+import math
+import time
+from collections import Counter as _Tally, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Tuple
+
+from src.metrics import counter, gauge
+
+# Lanes in priority order: a freed slot goes to interactive waiters before batch ones
+LANES = ("interactive", "batch")
+
+_admitted = counter("admission_admitted_total", "Requests given an agent slot", ["lane"])
+_rejected = counter("admission_rejections_total", "Requests shed by admission control", ["lane", "reason"])
+
+
+class AdmissionRejected(Exception):
+    """No slot could be granted; the API maps this to 429 with Retry-After."""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        super().__init__(f"{lane} lane {reason.replace('_', ' ')}; retry in {retry_after}s")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps concurrent agent runs globally, per client, and for the batch lane (so batch, job and
+    eval traffic can never take the slots interactive users need). Requests that can't start
+    wait in a bounded FIFO per lane for at most `max_wait_seconds`; beyond that they are shed.
+    """
+
+    def __init__(self, max_concurrency: int, per_client: int, batch_max_concurrency: int,
+                 queue_size: int, max_wait_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.per_client = per_client
+        self.lane_limits = {"interactive": max_concurrency, "batch": min(batch_max_concurrency, max_concurrency)}
+        self.queue_size = queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self._active = 0
+        self._by_lane: _Tally = _Tally()
+        self._by_client: _Tally = _Tally()
+        self._waiters: Dict[str, Deque[Tuple[str, asyncio.Future]]] = {lane: deque() for lane in LANES}
+        self._avg_hold = 5.0  # EWMA of slot hold time (s), feeds Retry-After
+
+        gauge("admission_active", "Agent slots in use", ["lane"]).set_function(
+            lambda: {(lane,): self._by_lane[lane] for lane in LANES})
+        gauge("admission_queue_depth", "Requests waiting for an agent slot", ["lane"]).set_function(
+            lambda: {(lane,): len(self._waiters[lane]) for lane in LANES})
+
+    @asynccontextmanager
+    async def slot(self, lane: str, client: str, patient: bool = False) -> AsyncIterator[None]:
+        """
+        Hold one agent slot for the body. `patient` callers (batch items, job workers) already
+        have their own back-pressure: they skip the queue-size bound and wait without a deadline.
+        """
+        await self.acquire(lane, client, patient)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - t0)
+            self.release(lane, client)
+
+    def check(self, lane: str) -> None:
+        """Shed up front when `lane` already has a full queue (used before accepting a whole batch)."""
+        if len(self._waiters[lane]) >= self.queue_size:
+            _rejected.inc(lane=lane, reason="queue_full")
+            raise AdmissionRejected(lane, "queue_full", self.retry_after(lane))
+
+    async def acquire(self, lane: str, client: str, patient: bool = False) -> None:
+        if self._can_start(lane, client) and not self._has_priority_waiters(lane):
+            self._grant(lane, client)
+            return
+        if not patient:
+            self.check(lane)
+        fut = asyncio.get_running_loop().create_future()
+        entry = (client, fut)
+        self._waiters[lane].append(entry)
+        self._wake()  # waiters ahead may be blocked only by their own per-client cap
+        if fut.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=None if patient else self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self._drop_waiter(lane, entry)
+            if not fut.done():
+                _rejected.inc(lane=lane, reason="timeout")
+                raise AdmissionRejected(lane, "wait_timeout", self.retry_after(lane))
+        except asyncio.CancelledError:
+            self._drop_waiter(lane, entry)
+            if fut.done() and not fut.cancelled():
+                self.release(lane, client)  # granted just as the caller went away
+            raise
+
+    def release(self, lane: str, client: str) -> None:
+        self._active -= 1
+        self._by_lane[lane] -= 1
+        self._by_client[client] -= 1
+        if self._by_client[client] <= 0:
+            del self._by_client[client]
+        self._wake()
+
+    def retry_after(self, lane: str) -> int:
+        """Seconds until a queued request would likely start, from queue depth and mean hold time."""
+        ahead = sum(len(self._waiters[l]) for l in LANES[:LANES.index(lane) + 1])
+        slots = max(1, self.lane_limits[lane])
+        return max(1, min(60, math.ceil(self._avg_hold * (ahead + 1) / slots)))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {lane: {"active": self._by_lane[lane], "waiting": len(self._waiters[lane])} for lane in LANES}
+
+    def _can_start(self, lane: str, client: str) -> bool:
+        return (self._active < self.max_concurrency
+                and self._by_lane[lane] < self.lane_limits[lane]
+                and self._by_client[client] < self.per_client)
+
+    def _has_priority_waiters(self, lane: str) -> bool:
+        # FIFO within a lane; a higher-priority lane's waiters also go first
+        return any(self._waiters[l] for l in LANES[:LANES.index(lane) + 1])
+
+    def _grant(self, lane: str, client: str) -> None:
+        self._active += 1
+        self._by_lane[lane] += 1
+        self._by_client[client] += 1
+        _admitted.inc(lane=lane)
+
+    def _wake(self) -> None:
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            for entry in list(waiters):
+                if self._active >= self.max_concurrency:
+                    return
+                client, fut = entry
+                if fut.done():
+                    waiters.remove(entry)
+                elif self._can_start(lane, client):
+                    waiters.remove(entry)
+                    self._grant(lane, client)
+                    fut.set_result(None)
+
+    def _drop_waiter(self, lane: str, entry) -> None:
+        try:
+            self._waiters[lane].remove(entry)
+        except ValueError:
+            pass
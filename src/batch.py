@@ -0,0 +1,87 @@
+# src/batch.py
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket shared by every batch run in the process: at most `rate` item starts
+    per second on average, with bursts of up to `burst` items.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                delay = (1.0 - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+async def run_batch(
+    run: Callable[[str], Awaitable[Dict[str, Any]]],
+    messages: List[str],
+    concurrency: int,
+    limiter: Optional[AsyncRateLimiter] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run `run(message)` for every message with at most `concurrency` in flight and yield
+    one result per item in completion order:
+      {"index", "status", "latency_ms", "thread_id", "answer", "actions", "usage", "error"}
+    Closing the iterator early (client went away) cancels the remaining work.
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+    for item in enumerate(messages):
+        pending.put_nowait(item)
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def _worker():
+        while True:
+            try:
+                index, message = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if limiter is not None:
+                await limiter.acquire()
+            t0 = time.perf_counter()
+            try:
+                result = await run(message)
+                item = {
+                    "index": index,
+                    "status": result.get("status", "completed"),
+                    "thread_id": result.get("thread_id"),
+                    "answer": result.get("answer"),
+                    "actions": result.get("actions"),
+                    "usage": result.get("usage"),
+                    "error": result.get("error"),
+                }
+            except Exception as e:
+                item = {"index": index, "status": "failed", "error": str(e)}
+            item["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            await done.put(item)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(max(1, min(concurrency, len(messages))))]
+    try:
+        for _ in range(len(messages)):
+            yield await done.get()
+    finally:
+        for w in workers:
+            w.cancel()
@@ -0,0 +1,186 @@
+# src/cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+from src.metrics import counter, gauge
+from src.store import _open_sqlite
+
+_requests = counter(
+    "agent_response_cache_requests_total", "Response cache lookups by outcome", ["result"]
+)
+_invalidations = counter(
+    "agent_response_cache_invalidations_total", "Response cache flushes after prompts/tools/Chroma changed"
+)
+
+
+def _hit_ratio() -> float:
+    hits = _requests.value(result="hit_memory") + _requests.value(result="hit_disk")
+    lookups = hits + _requests.value(result="miss")
+    return hits / lookups if lookups else 0.0
+
+
+gauge("agent_response_cache_hit_ratio", "Share of response cache lookups served from cache").set_function(_hit_ratio)
+
+
+def normalize_message(message: str) -> str:
+    """Case, width and whitespace insensitive form of a chat message."""
+    return " ".join(unicodedata.normalize("NFKC", message).split()).casefold()
+
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def source_fingerprint(static: Iterable[str], files: Iterable[str]) -> Callable[[], str]:
+    """
+    Fingerprint of everything a cached answer depends on besides the message:
+    `static` (model name, prompt texts, tool schemas) is hashed once, `files`
+    (src/prompts.py, the Chroma sqlite file) are re-checked by mtime/size on every call.
+    """
+    base = hashlib.sha256("\x00".join(static).encode("utf-8")).hexdigest()
+    files = list(files)
+
+    def _fingerprint() -> str:
+        sigs = json.dumps([_stat_signature(p) for p in files])
+        return hashlib.sha256(f"{base}:{sigs}".encode("utf-8")).hexdigest()[:16]
+
+    return _fingerprint
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of completed answers keyed on (normalized message, fingerprint),
+    with an optional SQLite tier shared by every worker process and kept across restarts.
+    When the fingerprint changes both tiers drop the stale entries.
+    """
+
+    def __init__(self, fingerprint: Callable[[], str], ttl_seconds: float, max_entries: int,
+                 path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.fingerprint = fingerprint
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._current: Optional[str] = None
+        self.conn = None
+        if path:
+            self.conn = _open_sqlite(path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_last_access ON response_cache(last_access)"
+            )
+
+    def key(self, message: str) -> str:
+        fp = self._check_fingerprint()
+        digest = hashlib.sha256(normalize_message(message).encode("utf-8")).hexdigest()
+        return f"{fp}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] >= time.monotonic():
+                    self._data.move_to_end(key)
+                    _requests.inc(result="hit_memory")
+                    return entry[1]
+                del self._data[key]
+            if self.conn is not None:
+                now = time.time()
+                row = self.conn.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key=? AND expires_at>=?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute("UPDATE response_cache SET last_access=? WHERE key=?", (now, key))
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1] - now)
+                    _requests.inc(result="hit_disk")
+                    return value
+        _requests.inc(result="miss")
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, value, self.ttl_seconds)
+            if self.conn is not None:
+                now = time.time()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO response_cache(key, fingerprint, value, expires_at, last_access)"
+                    " VALUES (?,?,?,?,?)",
+                    (key, key.split(":", 1)[0], json.dumps(value, default=str), now + self.ttl_seconds, now),
+                )
+                self._evict_disk(now)
+
+    def bypass(self) -> None:
+        """Record a lookup skipped on request (Cache-Control: no-cache); the fresh answer is still stored."""
+        _requests.inc(result="bypass")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM response_cache")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            disk = 0
+            if self.conn is not None:
+                disk = self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            return {"entries": len(self._data), "disk_entries": disk}
+
+    def _remember(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        self.conn.execute("DELETE FROM response_cache WHERE expires_at<?", (now,))
+        n = self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        if n > self.max_disk_entries:
+            self.conn.execute(
+                "DELETE FROM response_cache WHERE key IN"
+                " (SELECT key FROM response_cache ORDER BY last_access LIMIT ?)",
+                (n - self.max_disk_entries,),
+            )
+
+    def _check_fingerprint(self) -> str:
+        fp = self.fingerprint()
+        if fp != self._current:
+            with self._lock:
+                if self._current is not None and fp != self._current:
+                    _invalidations.inc()
+                self._current = fp
+                self._data.clear()
+                if self.conn is not None:
+                    self.conn.execute("DELETE FROM response_cache WHERE fingerprint<>?", (fp,))
+        return fp
+
+
+def make_response_cache(fingerprint: Callable[[], str]) -> Optional[ResponseCache]:
+    """Build the response cache from settings, or None when RESPONSE_CACHE_ENABLED is off."""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    return ResponseCache(
+        fingerprint,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+        path=settings.RESPONSE_CACHE_PATH,
+        max_disk_entries=settings.RESPONSE_CACHE_MAX_DISK_ENTRIES,
+    )
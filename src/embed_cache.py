@@ -0,0 +1,142 @@
+# src/embed_cache.py
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.config import settings
+from src.cache import normalize_message
+from src.metrics import counter, gauge
+from src.store import _open_sqlite
+
+_requests = counter("embedding_cache_requests_total", "Query embedding lookups by outcome", ["result"])
+
+
+def _hit_ratio() -> float:
+    hits = _requests.value(result="hit_memory") + _requests.value(result="hit_disk")
+    lookups = hits + _requests.value(result="miss")
+    return hits / lookups if lookups else 0.0
+
+
+gauge("embedding_cache_hit_ratio", "Share of query embeddings served without running the model").set_function(_hit_ratio)
+
+
+def normalize_query(query: str) -> str:
+    """Case, width, whitespace and punctuation insensitive form of a retrieval query."""
+    return " ".join(re.findall(r"\w+", normalize_message(query)))
+
+
+class EmbeddingCache:
+    """
+    LRU of query embeddings for one model, keyed on the normalized query. Vectors live in one
+    preallocated float32 matrix (a row per entry) rather than as Python float lists; an optional
+    SQLite tier keeps them across restarts and shares them between worker processes.
+    """
+
+    def __init__(self, model: str, max_entries: int, path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.model = model
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._rows: "OrderedDict[str, int]" = OrderedDict()  # key -> row in _matrix, LRU order
+        self._matrix: Optional[np.ndarray] = None  # allocated on the first insert, when the dimension is known
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.conn = None
+        if path:
+            self.conn = _open_sqlite(path)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS embedding_cache_last_access ON embedding_cache(last_access)"
+            )
+
+    def key(self, query: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def get_or_embed(self, query: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """The cached embedding of `query`, or `embed(query)` stored for next time."""
+        key = self.key(query)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._rows.move_to_end(key)
+                _requests.inc(result="hit_memory")
+                return self._matrix[row].tolist()
+            if self.conn is not None:
+                hit = self.conn.execute("SELECT vector FROM embedding_cache WHERE key=?", (key,)).fetchone()
+                if hit is not None:
+                    self.conn.execute("UPDATE embedding_cache SET last_access=? WHERE key=?", (time.time(), key))
+                    vector = np.frombuffer(hit[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    _requests.inc(result="hit_disk")
+                    return vector.tolist()
+        _requests.inc(result="miss")
+        vector = np.asarray(embed(query), dtype=np.float32)  # outside the lock: other queries keep being served meanwhile
+        with self._lock:
+            self._remember(key, vector)
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache(key, vector, last_access) VALUES (?,?,?)",
+                    (key, vector.tobytes(), time.time()),
+                )
+                self._writes += 1
+                if self._writes % 64 == 0:
+                    self._evict_disk()
+        return vector.tolist()  # the float32 values a hit returns, so scores never depend on cache state
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM embedding_cache")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            disk = 0
+            if self.conn is not None:
+                disk = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            return {"entries": len(self._rows), "disk_entries": disk,
+                    "bytes": 0 if self._matrix is None else self._matrix.nbytes}
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._rows.clear()
+        if key in self._rows:
+            row = self._rows[key]
+            self._rows.move_to_end(key)
+        elif len(self._rows) < self.max_entries:
+            row = len(self._rows)
+            self._rows[key] = row
+        else:
+            _, row = self._rows.popitem(last=False)  # reuse the least recently used row
+            self._rows[key] = row
+        self._matrix[row] = vector
+
+    def _evict_disk(self) -> None:
+        n = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        if n > self.max_disk_entries:
+            self.conn.execute(
+                "DELETE FROM embedding_cache WHERE key IN"
+                " (SELECT key FROM embedding_cache ORDER BY last_access LIMIT ?)",
+                (n - self.max_disk_entries,),
+            )
+
+
+def make_embedding_cache(model: str) -> Optional[EmbeddingCache]:
+    """Build the query embedding cache from settings, or None when EMBED_CACHE_MAX_ENTRIES is 0."""
+    if settings.EMBED_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return EmbeddingCache(
+        model,
+        max_entries=settings.EMBED_CACHE_MAX_ENTRIES,
+        path=settings.EMBED_CACHE_PATH,
+        max_disk_entries=settings.EMBED_CACHE_MAX_DISK_ENTRIES,
+    )
@@ -0,0 +1,176 @@
+# src/http_pool.py
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any, Dict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+from src.metrics import counter, gauge
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); without it the pools speak keep-alive HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_requests_sent = counter("http_client_requests_total", "Outbound HTTP requests by pooled client", ["client"])
+_connections = counter(
+    "http_client_connections_opened_total", "New TCP connections opened by pooled client (the rest reused one)", ["client"]
+)
+_handshakes = counter("http_client_tls_handshakes_total", "TLS handshakes by pooled client", ["client"])
+
+_POOLS: Dict[str, Any] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _reuse_ratio() -> Dict[tuple, float]:
+    ratios = {}
+    for name, pool in list(_POOLS.items()):
+        sent, opened = pool.counts()
+        ratios[(name,)] = 1.0 - opened / sent if sent else 0.0
+    return ratios
+
+
+gauge("http_client_connection_reuse_ratio", "Share of requests sent on an already open connection", ["client"]
+      ).set_function(_reuse_ratio)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+def default_timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+class PooledTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    One keep-alive connection pool per upstream client (each talks to a single host, so the pool
+    size is the per-host limit), usable from both `httpx.Client` and `httpx.AsyncClient`. The async
+    pool is kept per event loop: its connections cannot outlive the loop that opened them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.http2 = settings.HTTP2_ENABLED and HTTP2_AVAILABLE
+        self._sync = httpx.HTTPTransport(http2=self.http2, limits=_limits())
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = (
+            weakref.WeakKeyDictionary())
+        self._lock = threading.Lock()
+
+    def counts(self):
+        return _requests_sent.value(client=self.name), _connections.value(client=self.name)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": self._trace}
+        _requests_sent.inc(client=self.name)
+        return self._sync.handle_request(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": self._atrace}
+        _requests_sent.inc(client=self.name)
+        return await self._loop_transport().handle_async_request(request)
+
+    def close(self) -> None:
+        pass  # a client closing (or being collected) must not tear down the shared pool
+
+    async def aclose(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._sync.close()
+        with self._lock:
+            transport = self._async.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+    def _loop_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._async.get(loop)
+            if transport is None:
+                transport = self._async[loop] = httpx.AsyncHTTPTransport(http2=self.http2, limits=_limits())
+            return transport
+
+    def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.complete":
+            _connections.inc(client=self.name)
+        elif event == "connection.start_tls.complete":
+            _handshakes.inc(client=self.name)
+
+    async def _atrace(self, event: str, info: Dict[str, Any]) -> None:
+        self._trace(event, info)
+
+
+class _PooledAdapter(HTTPAdapter):
+    """requests adapter with a bounded per-host pool, no retries (callers own them) and a default timeout."""
+
+    def __init__(self, name: str):
+        self.name = name
+        size = settings.HTTP_MAX_CONNECTIONS_PER_HOST
+        super().__init__(pool_connections=size, pool_maxsize=size, pool_block=True, max_retries=0)
+
+    def send(self, request, timeout=None, **kwargs):
+        _requests_sent.inc(client=self.name)
+        if timeout is None:
+            timeout = (settings.HTTP_CONNECT_TIMEOUT_SECONDS, settings.HTTP_TIMEOUT_SECONDS)
+        return super().send(request, timeout=timeout, **kwargs)
+
+    def counts(self):
+        # urllib3 keeps one pool per host and counts the connections each one opened
+        pools = self.poolmanager.pools
+        opened = sum(pools[key].num_connections for key in pools.keys())
+        return _requests_sent.value(client=self.name), opened
+
+
+def pooled_transport(name: str) -> PooledTransport:
+    """The process-wide httpx transport for upstream `name` (e.g. "gemini")."""
+    with _POOLS_LOCK:
+        if name not in _POOLS:
+            _POOLS[name] = PooledTransport(name)
+        return _POOLS[name]
+
+
+def httpx_client_args(name: str) -> Dict[str, Any]:
+    """Keyword arguments for `httpx.Client` / `httpx.AsyncClient` that route through the shared pool."""
+    return {"transport": pooled_transport(name), "timeout": default_timeout()}
+
+
+def requests_session(name: str) -> requests.Session:
+    """A `requests.Session` on a shared keep-alive pool (HTTP/1.1: requests has no HTTP/2)."""
+    session = requests.Session()
+    with _POOLS_LOCK:
+        adapter = _POOLS.get(name)
+        if adapter is None:
+            adapter = _POOLS[name] = _PooledAdapter(name)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Requests sent and connections opened per pooled client."""
+    stats = {}
+    for name, pool in list(_POOLS.items()):
+        sent, opened = pool.counts()
+        stats[name] = {"requests": int(sent), "connections_opened": int(opened),
+                       "http2": bool(getattr(pool, "http2", False))}
+    return stats
+
+
+async def close_pools() -> None:
+    """Close every pool's connections (API shutdown)."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        if isinstance(pool, PooledTransport):
+            await pool.shutdown()
+        else:
+            pool.close()
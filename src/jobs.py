@@ -0,0 +1,349 @@
+# src/jobs.py
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def _now_ms() -> float:
+    return time.time() * 1000.0
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class JobQueue(ABC):
+    """
+    Storage + FIFO for coding jobs. A job record is a plain dict:
+      {job_id, status: queued|running|completed|failed|cancelled, message, thread_id,
+       submitted_at, started_at, finished_at (epoch ms), result, error}
+
+    Backends shared between processes set `visibility_timeout_seconds`: a popped job stays
+    claimed only while its worker keeps calling `touch`, `requeue_orphans` puts the jobs of
+    dead workers back in the queue and `requeue` hands back the job of a worker shutting down.
+    """
+
+    visibility_timeout_seconds: Optional[float] = None
+
+    @abstractmethod
+    async def put(self, record: Dict[str, Any]) -> None:
+        """Persist a new record and enqueue its id."""
+
+    @abstractmethod
+    async def next(self, timeout: float) -> Optional[str]:
+        """Pop the next queued job id, waiting up to `timeout` seconds."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def save(self, record: Dict[str, Any]) -> None:
+        """Overwrite an existing record (status transitions)."""
+
+    @abstractmethod
+    async def depth(self) -> int:
+        """Number of jobs waiting to be picked up."""
+
+    async def touch(self, job_id: str) -> None:
+        """Extend the claim on a popped job (heartbeat while it runs)."""
+
+    async def ack(self, job_id: str) -> None:
+        """Release the claim on a popped job once it is finished or skipped."""
+
+    async def requeue_orphans(self) -> int:
+        """Requeue claimed jobs whose worker stopped heartbeating; returns how many."""
+        return 0
+
+    async def requeue(self, record: Dict[str, Any]) -> None:
+        """Save a claimed job as queued again and put it at the front of the queue."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessJobQueue(JobQueue):
+    """Default backend: asyncio.Queue + dict. Jobs outlive the HTTP request, not the process."""
+
+    def __init__(self, result_ttl_seconds: float = 3600.0):
+        self.result_ttl_seconds = result_ttl_seconds
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._records: Dict[str, Dict[str, Any]] = {}
+
+    async def put(self, record: Dict[str, Any]) -> None:
+        self._purge()
+        self._records[record["job_id"]] = dict(record)
+        self._queue.put_nowait(record["job_id"])
+
+    async def next(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        record = self._records.get(job_id)
+        return dict(record) if record else None
+
+    async def save(self, record: Dict[str, Any]) -> None:
+        self._records[record["job_id"]] = dict(record)
+
+    async def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _purge(self) -> None:
+        cutoff = _now_ms() - self.result_ttl_seconds * 1000.0
+        expired = [k for k, r in self._records.items() if r.get("finished_at") and r["finished_at"] < cutoff]
+        for k in expired:
+            del self._records[k]
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redis-backed queue (LPUSH + BRPOPLPUSH onto a processing list, one JSON string per job), so
+    jobs survive API restarts and can be drained by workers in other processes. A popped job
+    holds a lease key for `visibility_timeout_seconds` that its worker keeps renewing; ids left
+    in the processing list without a lease are requeued. Records expire `result_ttl_seconds`
+    after the job finishes, never while it is waiting or running. `client` is any object with
+    the redis.asyncio API, e.g. fakeredis in tests.
+    """
+
+    def __init__(self, client: Any, prefix: str = "deepagents:jobs", result_ttl_seconds: float = 3600.0,
+                 visibility_timeout_seconds: float = 60.0):
+        self.client = client
+        self.prefix = prefix
+        self.result_ttl_seconds = result_ttl_seconds
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self._queue_key = f"{prefix}:queue"
+        self._processing_key = f"{prefix}:processing"
+        self._unleased: Set[str] = set()  # claimed ids seen without a lease on the previous sweep
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisJobQueue":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis requires the `redis` package (pip install .[redis]).") from e
+        return cls(redis_asyncio.from_url(url, decode_responses=True), **kwargs)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{self.prefix}:lease:{job_id}"
+
+    async def put(self, record: Dict[str, Any]) -> None:
+        await self.save(record)
+        await self.client.lpush(self._queue_key, record["job_id"])
+
+    async def next(self, timeout: float) -> Optional[str]:
+        job_id = await self.client.brpoplpush(self._queue_key, self._processing_key, timeout=max(1, int(timeout)))
+        if job_id is None:
+            return None
+        job_id = _decode(job_id)
+        await self.touch(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def save(self, record: Dict[str, Any]) -> None:
+        ttl = int(self.result_ttl_seconds) if record["status"] in TERMINAL_STATUSES else None
+        await self.client.set(self._key(record["job_id"]), json.dumps(record, default=str), ex=ttl)
+
+    async def depth(self) -> int:
+        return int(await self.client.llen(self._queue_key))
+
+    async def touch(self, job_id: str) -> None:
+        await self.client.set(self._lease_key(job_id), "1", ex=max(1, int(self.visibility_timeout_seconds)))
+
+    async def ack(self, job_id: str) -> None:
+        await self.client.lrem(self._processing_key, 1, job_id)
+        await self.client.delete(self._lease_key(job_id))
+
+    async def requeue(self, record: Dict[str, Any]) -> None:
+        await self.save(record)
+        await self.client.rpush(self._queue_key, record["job_id"])  # BRPOP end: picked up next
+        await self.ack(record["job_id"])
+
+    async def requeue_orphans(self) -> int:
+        """
+        An id counts as orphaned once it has been without a lease on two consecutive sweeps: a
+        single sweep could fall between a worker's pop and its first lease write.
+        """
+        unleased = set()
+        for job_id in map(_decode, await self.client.lrange(self._processing_key, 0, -1)):
+            if not await self.client.exists(self._lease_key(job_id)):
+                unleased.add(job_id)
+        orphans, self._unleased = unleased & self._unleased, unleased - self._unleased
+        requeued = 0
+        for job_id in orphans:
+            if not await self.client.lrem(self._processing_key, 1, job_id):
+                continue  # acked meanwhile, or another process's sweep got it first
+            record = await self.get(job_id)
+            if record is None or record["status"] in TERMINAL_STATUSES:
+                continue
+            record.update(status="queued", started_at=None)
+            await self.save(record)
+            await self.client.rpush(self._queue_key, job_id)  # BRPOP end: picked up next
+            requeued += 1
+        if requeued:
+            logger.warning("RedisJobQueue: requeued %d job(s) abandoned by their worker", requeued)
+        return requeued
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            res = close()
+            if asyncio.iscoroutine(res):
+                await res
+
+
+def make_job_queue(backend: str, redis_url: Optional[str] = None, result_ttl_seconds: float = 3600.0,
+                   visibility_timeout_seconds: float = 60.0) -> JobQueue:
+    if backend == "memory":
+        return InProcessJobQueue(result_ttl_seconds=result_ttl_seconds)
+    if backend == "redis":
+        if not redis_url:
+            raise RuntimeError("JOB_REDIS_URL must be set when JOB_QUEUE_BACKEND=redis.")
+        return RedisJobQueue.from_url(redis_url, result_ttl_seconds=result_ttl_seconds,
+                                      visibility_timeout_seconds=visibility_timeout_seconds)
+    raise ValueError(f"Unknown job queue backend: {backend!r}")
+
+
+class JobWorkerPool:
+    """Fixed set of asyncio workers draining a JobQueue through `run(message, thread_id)`."""
+
+    def __init__(self, queue: JobQueue, run: Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]],
+                 workers: int = 4, poll_seconds: float = 1.0):
+        self.queue = queue
+        self.run = run
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self.running = 0
+        self._tasks: list = []
+        self._reaper: Optional[asyncio.Task] = None
+        self._waits_ms: deque = deque(maxlen=200)  # recent queue wait times
+
+    async def submit(self, message: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+        record = {
+            "job_id": str(uuid.uuid4()),
+            "status": "queued",
+            "message": message,
+            "thread_id": thread_id,
+            "submitted_at": _now_ms(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        await self.queue.put(record)
+        return record
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info("JobWorkerPool: started %d workers", self.workers)
+        if self._reaper is None and self.queue.visibility_timeout_seconds:
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self) -> None:
+        tasks = self._tasks + ([self._reaper] if self._reaper else [])
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._reaper = None
+        await self.queue.close()
+
+    async def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits_ms)
+        return {
+            "queue_depth": await self.queue.depth(),
+            "running": self.running,
+            "workers": len(self._tasks),
+            "recent_wait_ms_p50": waits[len(waits) // 2] if waits else None,
+            "recent_wait_ms_max": waits[-1] if waits else None,
+        }
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            try:
+                job_id = await self.queue.next(self.poll_seconds)
+                if job_id is None:
+                    continue
+                record = await self.queue.get(job_id)
+                if record is None or record["status"] != "queued":
+                    await self.queue.ack(job_id)
+                    continue  # expired or already picked up
+                await self._execute(record)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("JobWorkerPool: worker %d failed to process a job", n)
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout_seconds / 2)
+            try:
+                await self.queue.requeue_orphans()
+            except Exception:
+                logger.exception("JobWorkerPool: orphaned job sweep failed")
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.queue.visibility_timeout_seconds / 3)
+            try:
+                await self.queue.touch(job_id)
+            except Exception:
+                logger.warning("JobWorkerPool: could not renew the claim on job %s", job_id, exc_info=True)
+
+    async def _execute(self, record: Dict[str, Any]) -> None:
+        record["status"] = "running"
+        record["started_at"] = _now_ms()
+        self._waits_ms.append(record["started_at"] - record["submitted_at"])
+        await self.queue.save(record)
+        self.running += 1
+        heartbeat = None
+        if self.queue.visibility_timeout_seconds:
+            heartbeat = asyncio.create_task(self._heartbeat(record["job_id"]))
+        try:
+            result = await self.run(record["message"], record.get("thread_id"))
+            record["status"] = "completed"
+            record["result"] = result
+            record["thread_id"] = result.get("thread_id") or record.get("thread_id")
+        except Exception as e:
+            logger.exception("Job %s failed", record["job_id"])
+            record["status"] = "failed"
+            record["error"] = str(e)
+        except asyncio.CancelledError:
+            if self.queue.visibility_timeout_seconds:
+                # Worker shut down mid-run (e.g. a rolling restart): another worker runs it again
+                record.update(status="queued", started_at=None)
+            else:
+                record["status"] = "cancelled"  # the in-process queue dies with us: terminal, not left "running"
+                record["error"] = "cancelled before completion"
+            raise
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            self.running -= 1
+            if record["status"] == "queued":
+                await self.queue.requeue(record)
+            else:
+                record["finished_at"] = _now_ms()
+                await self.queue.save(record)
+                await self.queue.ack(record["job_id"])
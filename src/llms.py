@@ -1,21 +1,439 @@
 # src/llms.py
 
+import asyncio
+import contextvars
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import warnings
+import zlib
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
 from app.config import settings
+from src.http_pool import httpx_client_args
+from src.metrics import counter, histogram
+from src.ratelimit import TokenBucketLimiter, backoff_delay, retry_reason, shared_rate_limiter
+from src.store import _open_sqlite
+from src.usage import current_ledger
 
 load_dotenv()
 
+_llm_calls = counter("llm_calls_total", "Chat model calls", ["agent", "status"])
+_llm_latency = histogram("llm_call_duration_seconds", "Chat model call latency", ["agent"])
+_llm_tokens = counter("llm_tokens_total", "Tokens sent to / received from the model", ["agent", "direction"])
+_throttle_wait = histogram("llm_throttle_wait_seconds", "Time model calls waited on the RPM/TPM budget", ["agent"])
+_retries = counter("llm_retries_total", "Model calls retried after a 429 or 5xx", ["agent", "reason"])
+# Reading cached generations back goes through langchain_core.load.loads, flagged beta
+warnings.filterwarnings("ignore", message="The function `loads` is in beta")
+
+_cache_requests = counter("llm_cache_requests_total", "LLM call cache lookups", ["result"])
+_cache_evictions = counter("llm_cache_evictions_total", "LLM call cache rows evicted for size")
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Call count, latency and token usage of one agent's model calls."""
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        usages = [getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                  for generations in response.generations for gen in generations]
+        # LangChain zeroes `total_cost` on generations served from the LLM cache
+        if usages and all(u.get("total_cost") == 0 for u in usages):
+            self._finish(run_id, "cached", observe=False)
+            return
+        self._finish(run_id, "ok")
+        for usage in usages:
+            _llm_tokens.inc(usage.get("input_tokens", 0), agent=self.agent, direction="input")
+            _llm_tokens.inc(usage.get("output_tokens", 0), agent=self.agent, direction="output")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id: UUID, status: str, observe: bool = True) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None and observe:
+            _llm_latency.observe(time.perf_counter() - started, agent=self.agent)
+        _llm_calls.inc(agent=self.agent, status=status)
+
+
+_UNSEEN_MESSAGE_FIELDS = ("id", "usage_metadata", "response_metadata")
+
+
+def _stable_prompt(prompt: str) -> str:
+    """
+    The serialized message list minus what the model never sees: message ids (LangGraph
+    assigns fresh uuids every run) and usage/response metadata (cache hits rewrite usage),
+    so a replayed conversation maps to the same cache key turn after turn.
+    """
+    def _strip(node):
+        if isinstance(node, dict):
+            if node.get("type") == "constructor" and isinstance(node.get("kwargs"), dict):
+                for field in _UNSEEN_MESSAGE_FIELDS:
+                    node["kwargs"].pop(field, None)
+            for value in node.values():
+                _strip(value)
+        elif isinstance(node, list):
+            for value in node:
+                _strip(value)
+        return node
+
+    try:
+        return json.dumps(_strip(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        return prompt
+
+
+class SqliteLLMCache(BaseCache):
+    """
+    On-disk cache of chat model generations, plugged into the models' `cache` field.
+    The key hashes LangChain's llm_string (model, temperature and other identifying params
+    plus bound tool schemas) with the id-stripped message list. Values are zlib-compressed;
+    once they exceed `max_bytes` the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int, evict_every: int = 32):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.conn = _open_sqlite(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache(last_access)")
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{_stable_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self.key(prompt, llm_string)
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM llm_cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                _cache_requests.inc(result="miss")
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access=? WHERE key=?", (time.time(), key))
+        _cache_requests.inc(result="hit")
+        return loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        blob = zlib.compress(dumps(return_val).encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, value, size, last_access) VALUES (?,?,?,?)",
+                (self.key(prompt, llm_string), blob, len(blob), time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size),0) FROM llm_cache").fetchone()
+        return {"entries": n, "bytes": size}
+
+    def _evict(self) -> None:
+        excess = self.conn.execute("SELECT COALESCE(SUM(size),0) FROM llm_cache").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM llm_cache WHERE key=?", victims)
+        _cache_evictions.inc(len(victims))
+
+
+_LLM_CACHE: Optional[SqliteLLMCache] = None
+_LLM_CACHE_LOCK = threading.Lock()
+
+
+def shared_llm_cache() -> Optional[SqliteLLMCache]:
+    """The process-wide LLM call cache, or None unless LLM_CACHE_PATH is set."""
+    global _LLM_CACHE
+    if not settings.LLM_CACHE_PATH:
+        return None
+    with _LLM_CACHE_LOCK:
+        if _LLM_CACHE is None:
+            _LLM_CACHE = SqliteLLMCache(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_BYTES)
+        return _LLM_CACHE
+
+
+def _estimate_tokens(messages: List[BaseMessage]) -> int:
+    """Rough prompt size (~4 chars per token) to reserve before the real usage is known."""
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+class GuardedChatModel(BaseChatModel):
+    """
+    One agent's view of the provider chat model: every call first checks the request's token
+    budget and waits on the shared RPM/TPM budget, and 429/5xx failures are retried with
+    jittered exponential backoff. Streaming calls are retried only until the first chunk arrives.
+    """
+
+    inner: BaseChatModel
+    agent: str = "default"
+    limiter: Optional[Any] = None
+    max_retries: int = 4
+    retry_base_seconds: float = 1.0
+    retry_max_seconds: float = 30.0
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # Let the provider format the tools, then bind the result to this wrapper
+        bound = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(bound, "kwargs", {}))
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs: Any) -> bool:
+        inner = type(self.inner)
+        if inner._stream == BaseChatModel._stream and (not async_api or inner._astream == BaseChatModel._astream):
+            return False
+        if self.inner.disable_streaming is True or (self.inner.disable_streaming == "tool_calling" and kwargs.get("tools")):
+            return False
+        return super()._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        estimate = _estimate_tokens(messages)
+        self._check_budget(estimate)
+        for attempt in range(self.max_retries + 1):
+            self._waited(self.limiter.acquire(estimate) if self.limiter else 0.0)
+            try:
+                result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self._refund(estimate)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._settle(estimate, [g.message for g in result.generations])
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        estimate = _estimate_tokens(messages)
+        self._check_budget(estimate)
+        for attempt in range(self.max_retries + 1):
+            self._waited(await self.limiter.aacquire(estimate) if self.limiter else 0.0)
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                await self._arefund(estimate)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            await self._asettle(estimate, [g.message for g in result.generations])
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        estimate = _estimate_tokens(messages)
+        self._check_budget(estimate)
+        for attempt in range(self.max_retries + 1):
+            self._waited(self.limiter.acquire(estimate) if self.limiter else 0.0)
+            chunks = self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self._refund(estimate)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            break
+        seen = []
+        if first is not None:
+            seen.append(first.message)
+            yield first
+        for chunk in chunks:
+            seen.append(chunk.message)
+            yield chunk
+        self._settle(estimate, seen)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        estimate = _estimate_tokens(messages)
+        self._check_budget(estimate)
+        for attempt in range(self.max_retries + 1):
+            self._waited(await self.limiter.aacquire(estimate) if self.limiter else 0.0)
+            chunks = self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs).__aiter__()
+            try:
+                first = await anext(chunks, None)
+            except Exception as e:
+                await self._arefund(estimate)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            break
+        seen = []
+        if first is not None:
+            seen.append(first.message)
+            yield first
+        async for chunk in chunks:
+            seen.append(chunk.message)
+            yield chunk
+        await self._asettle(estimate, seen)
+
+    def _check_budget(self, estimate: int) -> None:
+        ledger = current_ledger()
+        if ledger is not None:
+            ledger.check(estimate)
+
+    def _waited(self, seconds: float) -> None:
+        _throttle_wait.observe(seconds, agent=self.agent)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        reason = retry_reason(error)
+        if reason is None or attempt >= self.max_retries:
+            return None
+        _retries.inc(agent=self.agent, reason=reason)
+        return backoff_delay(attempt, self.retry_base_seconds, self.retry_max_seconds)
+
+    def _refund(self, estimate: int) -> None:
+        # A failed attempt keeps its request slot but gives its estimated tokens back,
+        # so a run of 429/5xx retries doesn't drain the TPM budget for everyone else
+        if self.limiter:
+            self.limiter.charge(-estimate)
+
+    async def _arefund(self, estimate: int) -> None:
+        if self.limiter:
+            await self.limiter.acharge(-estimate)
+
+    def _settle(self, estimate: int, messages: List[Any]) -> None:
+        used = self._record_usage(messages)
+        if used is not None and self.limiter:
+            self.limiter.charge(used - estimate)
+
+    async def _asettle(self, estimate: int, messages: List[Any]) -> None:
+        used = self._record_usage(messages)
+        if used is not None and self.limiter:
+            await self.limiter.acharge(used - estimate)
+
+    def _record_usage(self, messages: List[Any]) -> Optional[int]:
+        """Add the call's usage to the request ledger; returns its total tokens, or None if unreported."""
+        # Streamed chunks each carry part of the usage; generate() carries it once
+        usages = [m.usage_metadata for m in messages if getattr(m, "usage_metadata", None)]
+        if not usages:
+            return None
+        input_tokens = sum(u.get("input_tokens", 0) for u in usages)
+        output_tokens = sum(u.get("output_tokens", 0) for u in usages)
+        ledger = current_ledger()
+        if ledger is not None:
+            ledger.record_call(self.agent, input_tokens, output_tokens)
+        return input_tokens + output_tokens
+
+
 class LLM(ABC):
-    def __init__(self, model_name: str, temperature: float = 0.3):
+    def __init__(self, model_name: str, temperature: float = 0.3,
+                 rate_limiter: Optional[TokenBucketLimiter] = None, cache: Optional[BaseCache] = None):
         self.model_name = model_name
         self.temperature = temperature
+        # Shared by every LLM in the process (and across processes with LLM_RATE_LIMIT_PATH)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else shared_rate_limiter()
+        self.cache = cache if cache is not None else shared_llm_cache()
 
     @abstractmethod
     def invoke(self, messages: list) -> dict:
         pass
 
+    async def ainvoke(self, messages: list) -> dict:
+        # Providers without a native async client fall back to a worker thread.
+        return await asyncio.to_thread(self.invoke, messages)
+
+    def batch(self, inputs: List[list], max_concurrency: Optional[int] = None,
+              return_exceptions: bool = False) -> List[Any]:
+        """`invoke` over many message lists, at most `max_concurrency` at a time; results keep input order."""
+        if not inputs:
+            return []
+
+        def _one(messages: list) -> Any:
+            try:
+                return self.invoke(messages)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        with ThreadPoolExecutor(max_workers=self._batch_limit(max_concurrency, len(inputs)),
+                                thread_name_prefix="llm-batch") as pool:
+            # Each call keeps the caller's context (token ledger, tracing)
+            futures = [pool.submit(contextvars.copy_context().run, _one, m) for m in inputs]
+            return [f.result() for f in futures]
+
+    async def abatch(self, inputs: List[list], max_concurrency: Optional[int] = None,
+                     return_exceptions: bool = False) -> List[Any]:
+        """`ainvoke` over many message lists on the event loop, at most `max_concurrency` in flight."""
+        sem = asyncio.Semaphore(self._batch_limit(max_concurrency, len(inputs)))
+
+        async def _one(messages: list) -> Any:
+            async with sem:
+                return await self.ainvoke(messages)
+
+        return list(await asyncio.gather(*(_one(m) for m in inputs), return_exceptions=return_exceptions))
+
+    @staticmethod
+    def _batch_limit(max_concurrency: Optional[int], n: int) -> int:
+        return max(1, min(max_concurrency or settings.LLM_BATCH_CONCURRENCY, n))
+
+    def for_agent(self, agent: str) -> BaseChatModel:
+        """
+        The chat model (`self.llm`) as used by one agent of the graph: shares the client, answers
+        repeated calls from the LLM cache, sends the rest through the process-wide rate limiter
+        and retry policy, and carries that agent's metrics.
+        """
+        return GuardedChatModel(
+            inner=self.llm,
+            agent=agent,
+            limiter=self.rate_limiter,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_base_seconds=settings.LLM_RETRY_BASE_SECONDS,
+            retry_max_seconds=settings.LLM_RETRY_MAX_SECONDS,
+            callbacks=list(self.llm.callbacks or []) + [LLMMetricsCallback(agent)],
+            profile=self.llm.profile,
+            cache=self.cache,
+        )
+
 class GoogleGenAILLM(LLM):
     def __init__(self, model_name: str, temperature: float = 0.0):
         super().__init__(model_name, temperature)
@@ -27,7 +445,273 @@ class GoogleGenAILLM(LLM):
             model=self.model_name,
             api_key=api_key,
             temperature=temperature,
+            max_retries=1,  # retries are owned by GuardedChatModel, in step with the rate limiter
+            timeout=settings.HTTP_TIMEOUT_SECONDS,
+            client_args=httpx_client_args("gemini"),  # shared keep-alive pool, sync and async
+        )
+
+    def invoke(self, messages: list) -> dict:
+        return self.for_agent("direct").invoke(messages)
+
+    async def ainvoke(self, messages: list) -> dict:
+        return await self.for_agent("direct").ainvoke(messages)
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution, in seconds: "fixed:0.5", "uniform:0.2,1.5",
+    "normal:0.8,0.2", "lognormal:0.8,0.5" (median, sigma) or "exponential:0.8" (mean).
+    """
+    kind, _, raw = spec.partition(":")
+    try:
+        params = [float(p) for p in raw.split(",") if p.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec {spec!r}") from None
+    samplers = {
+        "fixed": (1, lambda rng, s: s),
+        "uniform": (2, lambda rng, a, b: rng.uniform(a, b)),
+        "normal": (2, lambda rng, mu, sd: rng.gauss(mu, sd)),
+        "lognormal": (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+        "exponential": (1, lambda rng, mean: rng.expovariate(1.0 / mean)),
+    }
+    if kind not in samplers or len(params) != samplers[kind][0]:
+        raise ValueError(f"Invalid latency spec {spec!r}; expected one of {', '.join(samplers)} with its parameters")
+    sample = samplers[kind][1]
+    return lambda rng: max(0.0, sample(rng, *params))
+
+
+# Drives supervisor -> subagent -> retrieval tool -> answer with the real prompts, tools and graphs.
+# Rules are tried in order; the first whose `match` holds produces the reply.
+_PROCEDURE_WORDS = r"procedure|surgery|resection|ectomy|otomy|plasty"
+_DIAGNOSIS_WORDS = r"diagnos|disease|infection|fracture|pain|diabetes|pneumonia|cholera|infarction|failure|syndrome"
+_MIXED = rf"(?is)^(?=.*(?:{_PROCEDURE_WORDS}))(?=.*(?:{_DIAGNOSIS_WORDS}))"
+
+DEFAULT_SCRIPT: List[Dict[str, Any]] = [
+    # Notes with both diagnoses and procedures follow the supervisor prompt's dispatch mode
+    {"match": {"last": "human", "tools": ["task"], "contains": _MIXED, "system": "BOTH subagents in parallel"},
+     "reply": {"tool_calls": [{"name": "task", "args": {"subagent_type": "diagnosis_agent", "description": "{last}"}},
+                              {"name": "task", "args": {"subagent_type": "procedures_agent", "description": "{last}"}}]}},
+    {"match": {"last": "human", "tools": ["task"], "contains": _MIXED, "system": "BOTH subagents sequentially"},
+     "reply": {"tool_calls": [{"name": "task", "args": {"subagent_type": "diagnosis_agent", "description": "{last}"}}]}},
+    {"match": {"last": "tool", "tools": ["task"], "human": _MIXED, "system": "BOTH subagents sequentially",
+               "contains": "Retrieved passages|ICD-10-CM candidates"},
+     "reply": {"tool_calls": [{"name": "task", "args": {"subagent_type": "procedures_agent", "description": "{human}"}}]}},
+    {"match": {"last": "human", "tools": ["task"], "contains": rf"(?i){_PROCEDURE_WORDS}"},
+     "reply": {"tool_calls": [{"name": "task", "args": {"subagent_type": "procedures_agent", "description": "{last}"}}]}},
+    {"match": {"last": "human", "tools": ["task"]},
+     "reply": {"tool_calls": [{"name": "task", "args": {"subagent_type": "diagnosis_agent", "description": "{last}"}}]}},
+    {"match": {"last": "human", "tools": ["icd10pcs_procedure_query"]},
+     "reply": {"tool_calls": [{"name": "icd10pcs_procedure_query", "args": {"query": "{last}"}},
+                              {"name": "icd10pcs_guidelines_query", "args": {"query": "{last}"}}]}},
+    {"match": {"last": "human", "tools": ["icd10_query"]},
+     "reply": {"tool_calls": [{"name": "icd10_query", "args": {"query": "{last}"}}]}},
+    {"match": {"last": "tool"}, "reply": {"content": "{tool}"}},
+    {"match": {}, "reply": {"content": "No scripted reply matched: {last}"}},
+]
+
+_ROLES = {"human": "human", "ai": "ai", "tool": "tool", "system": "system"}
+
+
+def script_from_messages(messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+    """
+    Turn a recorded conversation (e.g. `result["messages"]` of a live run, or `messages_from_dict`
+    of an export) into rules that replay each AI turn after the exact message that preceded it.
+    """
+    rules = []
+    for prev, msg in zip(messages, messages[1:]):
+        if msg.type != "ai":
+            continue
+        calls = [{"name": c["name"], "args": c["args"]} for c in getattr(msg, "tool_calls", None) or []]
+        rules.append({"match": {"last": prev.type, "after": _message_text(prev)},
+                      "reply": {"content": _message_text(msg), "tool_calls": calls}})
+    return rules
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    """
+    Read a script file: a JSON list of rules, or an object with "rules" and/or "conversations"
+    (lists of `messages_to_dict` dumps). Recorded turns go first, then the rules, then the defaults.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"rules": data}
+    rules = []
+    for conversation in data.get("conversations", []):
+        rules.extend(script_from_messages(messages_from_dict(conversation)))
+    return rules + list(data.get("rules", [])) + DEFAULT_SCRIPT
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = "\n".join(p if isinstance(p, str) else str(p.get("text", "")) for p in content)
+    return str(content or "")
+
+
+def _tool_messages_since_human(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Tool results gathered since the last user message (one or more rounds of tool calls)."""
+    out = []
+    for m in reversed(messages):
+        if m.type == "human":
+            break
+        if m.type == "tool":
+            out.append(m)
+    return out[::-1]
+
+
+def _fill(template: Any, values: Dict[str, str]) -> Any:
+    """Substitute {last} (last message), {human} (last user message) and {tool} (tool results since then)."""
+    if isinstance(template, str):
+        for name, value in values.items():
+            template = template.replace("{" + name + "}", value)
+        return template
+    if isinstance(template, dict):
+        return {k: _fill(v, values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [_fill(v, values) for v in template]
+    return template
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Offline chat model that answers from a script of rules instead of a provider. A rule matches
+    on the last message (`last` role, `contains` regex, exact `after` text), the last user
+    message (`human` regex), the bound `tools` and the `system` prompt (regex, to tell agents
+    apart); its reply is text and/or tool calls. Every call sleeps a sampled time to first
+    token plus `token_seconds` per output token.
+    """
+
+    script: List[Dict[str, Any]]
+    latency: Callable[[random.Random], float] = lambda rng: 0.0
+    token_seconds: float = 0.0
+    rng: random.Random = Field(default_factory=random.Random)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "scripted", "rules": len(self.script)}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._reply(messages, kwargs.get("tools"))
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, delay = self._reply(messages, kwargs.get("tools"))
+        await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        message, delay = self._reply(messages, kwargs.get("tools"))
+        for chunk, seconds in self._chunks(message, delay):
+            time.sleep(seconds)
+            yield chunk
+            if run_manager and chunk.text:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        message, delay = self._reply(messages, kwargs.get("tools"))
+        for chunk, seconds in self._chunks(message, delay):
+            await asyncio.sleep(seconds)
+            yield chunk
+            if run_manager and chunk.text:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]]):
+        """The scripted AIMessage for this prompt and the total delay to simulate."""
+        tool_names = {t.get("function", {}).get("name") for t in tools or []}
+        last = messages[-1] if messages else HumanMessage("")
+        system = next((_message_text(m) for m in messages if m.type == "system"), "")
+        values = {
+            "last": _message_text(last),
+            "human": next((_message_text(m) for m in reversed(messages) if m.type == "human"), ""),
+            "tool": "\n\n".join(_message_text(m) for m in _tool_messages_since_human(messages)),
+        }
+        rule = next((r for r in self.script if self._matches(r.get("match", {}), last, tool_names, system, values)),
+                    DEFAULT_SCRIPT[-1])
+        reply = _fill(rule.get("reply", {}), values)
+        calls = [{"name": c["name"], "args": c.get("args", {}), "id": f"call_{uuid.uuid4().hex[:12]}",
+                  "type": "tool_call"}
+                 for c in reply.get("tool_calls", []) if not tool_names or c["name"] in tool_names]
+        content = reply.get("content", "")
+        output_tokens = max(1, len(content) // 4 + 8 * len(calls))
+        input_tokens = _estimate_tokens(messages)
+        message = AIMessage(
+            content=content,
+            tool_calls=calls,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens},
+        )
+        return message, self.latency(self.rng) + self.token_seconds * output_tokens
+
+    @staticmethod
+    def _matches(match: Dict[str, Any], last: BaseMessage, tool_names, system: str, values: Dict[str, str]) -> bool:
+        if "last" in match and _ROLES.get(match["last"]) != last.type:
+            return False
+        if not set(match.get("tools", [])) <= tool_names:
+            return False
+        if "contains" in match and not re.search(match["contains"], values["last"]):
+            return False
+        if "human" in match and not re.search(match["human"], values["human"]):
+            return False
+        if "after" in match and match["after"].strip() != values["last"].strip():
+            return False
+        if "system" in match and not re.search(match["system"], system):
+            return False
+        return True
+
+    def _chunks(self, message: AIMessage, delay: float):
+        """Word-sized chunks; the time to first token goes before the first, the rest is spread evenly."""
+        words = re.findall(r"\S+\s*", message.content) or [""]
+        first_delay = max(0.0, delay - self.token_seconds * message.usage_metadata["output_tokens"])
+        per_chunk = (delay - first_delay) / len(words)
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            chunk = AIMessageChunk(
+                content=word,
+                tool_call_chunks=[{"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": n}
+                                  for n, c in enumerate(message.tool_calls)] if last else [],
+                usage_metadata=message.usage_metadata if last else None,
+            )
+            yield ChatGenerationChunk(message=chunk), (first_delay if i == 0 else 0.0) + per_chunk
+
+
+class ScriptedLLM(LLM):
+    """
+    Stand-in for GoogleGenAILLM that needs no key or network: AgentManager, the subagents and
+    the retrieval tools run unchanged while the model turns come from a script
+    (`LLM_SCRIPT_PATH`, else DEFAULT_SCRIPT) with simulated latency.
+    """
+
+    def __init__(self, model_name: str = "scripted", temperature: float = 0.0,
+                 script: Optional[List[Dict[str, Any]]] = None, latency: Optional[str] = None,
+                 token_seconds: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(model_name, temperature)
+        if script is None:
+            script = load_script(settings.LLM_SCRIPT_PATH) if settings.LLM_SCRIPT_PATH else DEFAULT_SCRIPT
+        self.llm = ScriptedChatModel(
+            script=script,
+            latency=parse_latency(latency or settings.LLM_SCRIPTED_LATENCY),
+            token_seconds=settings.LLM_SCRIPTED_TOKEN_SECONDS if token_seconds is None else token_seconds,
+            rng=random.Random(settings.LLM_SCRIPTED_SEED if seed is None else seed),
         )
 
     def invoke(self, messages: list) -> dict:
-        return self.llm.invoke({"messages": messages})
+        return self.for_agent("direct").invoke(messages)
+
+    async def ainvoke(self, messages: list) -> dict:
+        return await self.for_agent("direct").ainvoke(messages)
+
+
+def make_llm(model_name: str = "gemini-2.5-flash", temperature: float = 0.0) -> LLM:
+    """The LLM selected by LLM_PROVIDER."""
+    if settings.LLM_PROVIDER == "scripted":
+        return ScriptedLLM(temperature=temperature)
+    return GoogleGenAILLM(model_name=model_name, temperature=temperature)
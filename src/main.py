@@ -1,33 +1,163 @@
 # src/services/agent.py
 
-from typing import Optional, Dict, Any
+import functools
+import threading
+import time
+from contextlib import aclosing
+from typing import AsyncContextManager, AsyncIterator, Callable, List, Optional, Dict, Any
 from app.config import settings
-from src.llms import GoogleGenAILLM
+from src.admission import AdmissionController
+from src.batch import AsyncRateLimiter, run_batch
+from src.cache import normalize_message
+from src.jobs import JobWorkerPool, make_job_queue
+from src.metrics import gauge
+from src.llms import make_llm
 from src.models.agent_model import AgentManager
+from src.singleflight import AsyncSingleFlight, SingleFlight
+from src.store import make_checkpointer, make_session_store
+from src import tools
 
-SESSIONS: Dict[str, Any] = {}
+# Pending approvals and per-thread token totals (shared across worker processes when STATE_BACKEND=sqlite)
+SESSIONS = make_session_store()
+USAGE = make_session_store("thread_usage")
 
-llm = GoogleGenAILLM(model_name="gemini-2.5-flash", temperature=0.0)
-agent_manager = AgentManager(llm=llm)
+def _discard_threads(thread_ids) -> None:
+    SESSIONS.discard(thread_ids)
+    USAGE.discard(thread_ids)
 
-def chat(user_message: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
-    result = agent_manager.chat(user_message, thread_id)
-    if result["status"] == "pending_approval":
-        # store session state, messages, etc.
-        SESSIONS[result["thread_id"]] = result
-    return result
+CHECKPOINTER = make_checkpointer(on_evict=_discard_threads)
+
+# The LLM client and the agent graphs are built on first use, normally by warm_up() in the
+# API lifespan, so importing this module stays cheap.
+_agent_manager: Optional[AgentManager] = None
+_agent_lock = threading.Lock()
+
+def get_agent_manager() -> AgentManager:
+    global _agent_manager
+    if _agent_manager is None:
+        with _agent_lock:
+            if _agent_manager is None:
+                llm = make_llm(model_name="gemini-2.5-flash", temperature=0.0)
+                _agent_manager = AgentManager(llm=llm, checkpointer=CHECKPOINTER, sessions=SESSIONS, usage=USAGE)
+    return _agent_manager
+
+# Filled in by warm_up(); served by /health/ready
+STARTUP: Dict[str, Any] = {"ready": False, "error": None, "timings_ms": {}}
+
+def warm_up() -> Dict[str, float]:
+    """Load models, open and query every collection, build the agent graphs; returns timings in ms."""
+    t0 = time.perf_counter()
+    timings = {f"tools.{k}": v for k, v in tools.warm_up().items()}
+    t = time.perf_counter()
+    get_agent_manager()
+    timings["agent_graph"] = round((time.perf_counter() - t) * 1000, 1)
+    timings["total"] = round((time.perf_counter() - t0) * 1000, 1)
+    STARTUP.update(ready=True, error=None, timings_ms=timings)
+    return timings
+
+gauge("agent_checkpoint_threads", "Threads held by the checkpointer").set_function(
+    lambda: CHECKPOINTER.stats()["threads"])
+gauge("agent_checkpoint_bytes", "Serialized bytes held by the checkpointer").set_function(
+    lambda: CHECKPOINTER.stats()["bytes"])
+if "file_bytes" in CHECKPOINTER.stats():
+    gauge("agent_checkpoint_file_bytes", "Size of the on-disk state file").set_function(
+        lambda: CHECKPOINTER.stats()["file_bytes"])
+gauge("agent_pending_sessions", "Threads waiting on a /chat/decision").set_function(
+    lambda: SESSIONS.stats()["sessions"])
+gauge("agent_pending_sessions_bytes", "Serialized bytes of pending sessions").set_function(
+    lambda: SESSIONS.stats()["bytes"])
+gauge("app_startup_phase_seconds", "Duration of each warm-up phase", ["phase"]).set_function(
+    lambda: {(phase,): ms / 1000 for phase, ms in STARTUP["timings_ms"].items()})
+
+# Identical new-conversation requests in flight at the same time share one agent run
+_chat_flight = SingleFlight("chat")
+_achat_flight = AsyncSingleFlight("achat")
+gauge("agent_inflight_requests", "Distinct new-conversation requests currently executing", ["api"]).set_function(
+    lambda: {("chat",): len(_chat_flight), ("achat",): len(_achat_flight)})
+
+# Caps concurrent agent runs; interactive requests go ahead of batch, job and eval work
+admission = AdmissionController(
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    per_client=settings.ADMISSION_PER_CLIENT_CONCURRENCY,
+    batch_max_concurrency=settings.ADMISSION_BATCH_MAX_CONCURRENCY,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    max_wait_seconds=settings.ADMISSION_MAX_WAIT_SECONDS,
+)
+
+# Shared by every /chat/batch request so concurrent batches can't multiply the load on Gemini
+batch_limiter = AsyncRateLimiter(settings.BATCH_RATE_PER_SEC, settings.BATCH_RATE_BURST)
+
+def _flight_key(user_message: str, use_cache: bool) -> str:
+    # no-cache callers only ever join other no-cache runs, never one that may have been a cache hit
+    return f"{'cache' if use_cache else 'no-cache'}:{normalize_message(user_message)}"
+
+def _coalesced(forked: Dict[str, Any]) -> Dict[str, Any]:
+    # The follower's answer came from the leader's run, not from the cache lookup the leader did
+    if "cache" in forked:
+        forked["cache"] = "coalesced"
+    return {**forked, "coalesced": True}
+
+def chat(user_message: str, thread_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+    manager = get_agent_manager()
+    if thread_id is not None:
+        return manager.chat(user_message, thread_id, use_cache)
+    result, shared = _chat_flight.do(
+        _flight_key(user_message, use_cache), lambda: manager.chat(user_message, None, use_cache))
+    if not shared:
+        return result
+    if result["status"] != "completed":
+        # An interrupt belongs to the leader's thread; this caller needs its own run
+        return manager.chat(user_message, None, use_cache)
+    return _coalesced(manager.fork_thread(user_message, result))
 
 def decide(thread_id: str, action_name: str, decision: str, args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    session = SESSIONS.get(thread_id)
-    if not session:
-        return {"status": "failed", "error": "invalid thread_id"}
-    
-    config = {"configurable": {"thread_id": thread_id}}
-    answer = agent_manager.decide(thread_id, action_name, decision, args, config)
+    return get_agent_manager().decide(thread_id, action_name, decision, args)
+
+async def achat(user_message: str, thread_id: Optional[str] = None, use_cache: bool = True,
+                admit: Optional[Callable[[], AsyncContextManager[None]]] = None) -> Dict[str, Any]:
+    """
+    `admit()` is the caller's admission slot. Only runs of the agent hold it: cache hits and
+    single-flight followers never do, so a burst of identical requests is not shed.
+    """
+    manager = get_agent_manager()
+    if thread_id is not None:
+        return await manager.achat(user_message, thread_id, use_cache, admit)
+    result, shared = await _achat_flight.do(
+        _flight_key(user_message, use_cache), lambda: manager.achat(user_message, None, use_cache, admit))
+    if not shared:
+        return result
+    if result["status"] != "completed":
+        return await manager.achat(user_message, None, use_cache, admit)
+    return _coalesced(await manager.afork_thread(user_message, result))
+
+async def astream(user_message: str, thread_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    async with aclosing(get_agent_manager().astream(user_message, thread_id)) as events:
+        async for event in events:
+            yield event
+
+# Long-running coding jobs: submitted over HTTP, executed by background workers
+async def _run_job(message: str, thread_id: Optional[str]) -> Dict[str, Any]:
+    return await achat(message, thread_id, admit=functools.partial(admission.slot, "batch", "jobs", patient=True))
+
+job_pool = JobWorkerPool(
+    make_job_queue(settings.JOB_QUEUE_BACKEND, settings.JOB_REDIS_URL, settings.JOB_RESULT_TTL_SECONDS,
+                   settings.JOB_VISIBILITY_TIMEOUT_SECONDS),
+    run=_run_job,
+    workers=settings.JOB_WORKERS,
+)
+
+async def abatch(messages: List[str], concurrency: Optional[int] = None, client: str = "batch") -> AsyncIterator[Dict[str, Any]]:
+    concurrency = min(concurrency or settings.BATCH_DEFAULT_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY)
+
+    async def _run(message: str) -> Dict[str, Any]:
+        # Batch items wait for a batch-lane slot instead of being shed one by one
+        return await achat(message, admit=functools.partial(admission.slot, "batch", client, patient=True))
 
-    del SESSIONS[thread_id]
-    return answer
+    async for item in run_batch(_run, messages, concurrency, batch_limiter):
+        yield item
 
+async def adecide(thread_id: str, action_name: str, decision: str, args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return await get_agent_manager().adecide(thread_id, action_name, decision, args)
 
 if __name__ == "__main__":
     a=chat("Cholera due to Vibrio cholerae 01, biovar cholerae")
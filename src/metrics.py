@@ -0,0 +1,189 @@
+# src/metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{n}="{str(v)}"'.replace("\n", " ") for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v: float) -> str:
+    v = float(v)
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_fmt_labels(self.labelnames, labels)} {_fmt_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [("", k, v) for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Settable gauge; `set_function` makes it read a live value (or {labels: value}) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._fn: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], Union[float, Dict[LabelValues, float]]]) -> None:
+        self._fn = fn
+
+    def samples(self):
+        if self._fn is not None:
+            try:
+                live = self._fn()
+            except Exception:
+                return []
+            if isinstance(live, dict):
+                return [("", tuple(k), float(v)) for k, v in sorted(live.items())]
+            return [("", (), float(live))]
+        with self._lock:
+            return [("", k, v) for k, v in sorted(self._values.items())]
+
+
+# Seconds; spans cache hits (ms) through full supervisor runs (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (`_bucket{le=...}`, `_sum`, `_count`), e.g. latencies in seconds."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def summary(self, **labels) -> Tuple[int, float]:
+        """(count, sum) of the observations with these labels."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels), ([0], [0.0]))
+            return sum(counts), total[0]
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            items = sorted((k, list(c), t[0]) for k, (c, t) in self._values.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_fmt_labels(names, key + (_fmt_value(bound),))} {cumulative}")
+            labels = _fmt_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, cls, name: str, help: str, labelnames: Iterable[str] = (), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.get_or_create(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.get_or_create(Gauge, name, help, labelnames)
+
+
+def histogram(name: str, help: str, labelnames: Iterable[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.get_or_create(Histogram, name, help, labelnames, buckets=buckets)
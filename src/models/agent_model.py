@@ -1,13 +1,24 @@
 # src/models/agent_model.py
 
+import json
+import os
+import re
+import time
 import uuid
-from typing import Dict, Any, Literal, Optional
+from contextlib import contextmanager, nullcontext
+from typing import AsyncContextManager, AsyncIterator, Callable, Dict, Any, List, Literal, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 from deepagents import create_deep_agent
 from langgraph.types import Command
-from langgraph.checkpoint.memory import MemorySaver
-from src.llms import GoogleGenAILLM
-from src.tools import internet_search, get_weather, icd10_query, icd10pcs_procedure_query, icd10pcs_guidelines_query
-from src.prompts import SUPERVISOR_PROMPT, DIAGNOSIS_PROMPT, EVAL_PROMPT, PROCEDURES_PROMPT
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from app.config import settings
+from src.llms import LLM
+from src.tools import _PERSIST_DIR, prefetching, internet_search, get_weather, icd10_query, icd10pcs_procedure_query, icd10pcs_guidelines_query
+import src.prompts as prompts_module
+from src.prompts import SUPERVISOR_PROMPT, DIAGNOSIS_PROMPT, EVAL_PROMPT, EVAL_PROMPT_SEQUENTIAL, PROCEDURES_PROMPT
+from src.cache import ResponseCache, make_response_cache, source_fingerprint
+from src.store import SessionStore, make_checkpointer, make_session_store
+from src.usage import TokenBudgetExceeded, TokenLedger, merge_usage, metered
 
 def coerce_text(v: Any) -> str:
     """Flatten common LangChain/LangGraph/Gemini shapes into a plain string."""
@@ -55,13 +66,67 @@ def coerce_text(v: Any) -> str:
     return str(v)
 
 
+_PCS_CODE_RE = re.compile(r"\b[0-9A-Z]{7}\b")
+_CM_CODE_RE = re.compile(r"\b[A-Z][0-9][0-9A-Z](?:\.[0-9A-Z]{1,4})?\b")
+
+
+def extract_codes(text: str) -> Dict[str, List[str]]:
+    """Pull ICD-10-CM and ICD-10-PCS codes out of a final answer, in order of appearance."""
+    pcs = []
+    for m in _PCS_CODE_RE.findall(text or ""):
+        # PCS sections start with 0-9 or B,C,D,F,G,H,X and are never all digits
+        if m[0] in "0123456789BCDFGHX" and not m.isdigit() and m not in pcs:
+            pcs.append(m)
+    cm = []
+    for m in _CM_CODE_RE.findall(text or ""):
+        if m not in cm:
+            cm.append(m)
+    return {"icd10_cm": cm, "icd10_pcs": pcs}
+
+
+def _update_messages(update: Any) -> List[Any]:
+    """Messages carried by one node update from `stream_mode="updates"`."""
+    if not isinstance(update, dict):
+        return []
+    msgs = update.get("messages")
+    msgs = getattr(msgs, "value", msgs)  # Overwrite(...) wrappers
+    if msgs is None:
+        return []
+    return msgs if isinstance(msgs, list) else [msgs]
+
+
 class AgentManager:
-    def __init__(self, llm: GoogleGenAILLM):
+    def __init__(self, llm: LLM, checkpointer: Optional[BaseCheckpointSaver] = None,
+                 sessions: Optional[SessionStore] = None, response_cache: Optional[ResponseCache] = None,
+                 usage: Optional[SessionStore] = None):
         self.llm = llm
-        self.checkpointer = MemorySaver()
+        self.supervisor_prompt = EVAL_PROMPT if settings.SUBAGENT_DISPATCH == "parallel" else EVAL_PROMPT_SEQUENTIAL
+        # Interrupt/resume state lives in these two stores. With STATE_BACKEND=sqlite both are
+        # shared by every worker process, so /chat/decision can land on any of them.
+        self.sessions = sessions if sessions is not None else make_session_store()
+        # Running token totals per thread, checked against TOKEN_BUDGET_PER_THREAD
+        self.usage = usage if usage is not None else make_session_store("thread_usage")
+        self.checkpointer = (checkpointer if checkpointer is not None
+                             else make_checkpointer(on_evict=self._discard_threads))
+        # Answers depend on the message, the model, prompts, tool schemas and the Chroma data;
+        # a change to any of them makes every cached answer stale.
+        self.response_cache = (response_cache if response_cache is not None
+                               else make_response_cache(self._cache_fingerprint()))
         self.supervisor_agent = self._build_supervisor_agent()
         self.diagnosis_agent = self._build_diagnosis_agent()
 
+    def _discard_threads(self, thread_ids) -> None:
+        self.sessions.discard(thread_ids)
+        self.usage.discard(thread_ids)
+
+    def _cache_fingerprint(self):
+        tools = [get_weather, icd10_query, icd10pcs_procedure_query, icd10pcs_guidelines_query]
+        static = [getattr(self.llm, "model_name", ""), str(getattr(self.llm, "temperature", "")),
+                  SUPERVISOR_PROMPT, DIAGNOSIS_PROMPT, self.supervisor_prompt, PROCEDURES_PROMPT,
+                  settings.TOOL_OUTPUT_FORMAT]
+        static += [f"{t.name}|{t.description}|{json.dumps(t.args, sort_keys=True)}" for t in tools]
+        return source_fingerprint(static, [prompts_module.__file__, os.path.join(_PERSIST_DIR, "chroma.sqlite3")])
+
     def _build_supervisor_agent(self):
         subagents = [
             {
@@ -69,14 +134,14 @@ class AgentManager:
                 "description": "Handles ICD-10-CM diagnosis code lookups for medical conditions",
                 "system_prompt": DIAGNOSIS_PROMPT,
                 "tools": [icd10_query],
-                "model": self.llm.llm  # uses same LLM by default
+                "model": self.llm.for_agent("diagnosis_agent")  # same LLM, own metrics
             },
             {
                 "name": "procedures_agent",
                 "description": "Handles ICD-10-PCS procedure code lookups for medical procedures",
                 "system_prompt": PROCEDURES_PROMPT,
                 "tools": [icd10pcs_procedure_query, icd10pcs_guidelines_query],
-                "model": self.llm.llm
+                "model": self.llm.for_agent("procedures_agent")
             },
 
         ]
@@ -85,8 +150,8 @@ class AgentManager:
             interrupt_on={
             "get_weather": {"allowed_decisions": ["approve", "edit", "reject"]}
              },
-            system_prompt=EVAL_PROMPT,
-            model=self.llm.llm,
+            system_prompt=self.supervisor_prompt,
+            model=self.llm.for_agent("supervisor"),
             checkpointer=self.checkpointer,
             subagents=subagents
         )
@@ -97,32 +162,225 @@ class AgentManager:
         agent = create_deep_agent(
             tools=[icd10_query],
             system_prompt=DIAGNOSIS_PROMPT,
-            model=self.llm.llm,
+            model=self.llm.for_agent("diagnosis_agent"),
             checkpointer=self.checkpointer
         )
         return agent
     
 
-    def chat(self, user_message: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    def chat(self, user_message: str, thread_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+        cache_key = self._cache_lookup_key(user_message, thread_id)
+        if cache_key and use_cache:
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                return {**self.fork_thread(user_message, cached), "cache": "hit"}
         if thread_id is None:
             thread_id = str(uuid.uuid4())
         config = {"configurable": {"thread_id": thread_id}}
-        result = self.supervisor_agent.invoke(
-            {"messages": [{"role": "user", "content": user_message}]},
-            config=config
-        )
-        return self._handle_result(result, thread_id, config)
-    
+        with self._metered(thread_id) as ledger, prefetching(user_message):
+            try:
+                result = self.supervisor_agent.invoke(
+                    {"messages": [{"role": "user", "content": user_message}]},
+                    config=config
+                )
+            except TokenBudgetExceeded as e:
+                result = e
+        return self._cache_store(cache_key, use_cache, self._finish(result, thread_id, config, ledger))
+
+    async def achat(self, user_message: str, thread_id: Optional[str] = None, use_cache: bool = True,
+                    admit: Optional[Callable[[], AsyncContextManager[None]]] = None) -> Dict[str, Any]:
+        """
+        Async variant of `chat`; keeps the event loop free while Gemini and the tools run.
+        `admit()` (an admission slot) is entered only around the agent run, never for a cache hit.
+        """
+        cache_key = self._cache_lookup_key(user_message, thread_id)
+        if cache_key and use_cache:
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                return {**await self.afork_thread(user_message, cached), "cache": "hit"}
+        if thread_id is None:
+            thread_id = str(uuid.uuid4())
+        config = {"configurable": {"thread_id": thread_id}}
+        async with admit() if admit is not None else nullcontext():
+            with self._metered(thread_id) as ledger, prefetching(user_message):
+                try:
+                    result = await self.supervisor_agent.ainvoke(
+                        {"messages": [{"role": "user", "content": user_message}]},
+                        config=config
+                    )
+                except TokenBudgetExceeded as e:
+                    result = e
+        return self._cache_store(cache_key, use_cache, self._finish(result, thread_id, config, ledger))
+
+    @contextmanager
+    def _metered(self, thread_id: str):
+        """Ledger for one request on `thread_id`; its totals are added to the thread's when the block exits."""
+        before = self.usage.get(thread_id)
+        with metered((before or {}).get("total_tokens", 0)) as ledger:
+            try:
+                yield ledger  # the first model call fails fast if the thread's budget is already spent
+            finally:
+                self.usage[thread_id] = merge_usage(before, ledger)
+
+    def _usage(self, thread_id: str, ledger: TokenLedger) -> Dict[str, Any]:
+        return {"request": ledger.to_dict(), "thread": self.usage.get(thread_id)}
+
+    def _finish(self, result: Any, thread_id: str, config: Dict[str, Any], ledger: TokenLedger) -> Dict[str, Any]:
+        if isinstance(result, TokenBudgetExceeded):
+            return {"status": "budget_exceeded", "thread_id": thread_id, "answer": str(result),
+                    "usage": self._usage(thread_id, ledger)}
+        return {**self._handle_result(result, thread_id, config), "usage": self._usage(thread_id, ledger)}
+
+    def _cache_lookup_key(self, user_message: str, thread_id: Optional[str]) -> Optional[str]:
+        # Only new conversations are cacheable; a follow-up's answer depends on the thread history
+        if self.response_cache is None or thread_id is not None:
+            return None
+        return self.response_cache.key(user_message)
+
+    def _cache_store(self, cache_key: Optional[str], use_cache: bool, result: Dict[str, Any]) -> Dict[str, Any]:
+        if not cache_key:
+            return result
+        if not use_cache:
+            self.response_cache.bypass()
+        if result["status"] == "completed":
+            self.response_cache.put(cache_key, {"status": "completed", "answer": result["answer"]})
+        return {**result, "cache": "bypass" if not use_cache else "miss"}
+
+    def fork_thread(self, user_message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Hand a completed answer out on a fresh thread, seeded with the question and answer so follow-ups keep their context."""
+        thread_id = str(uuid.uuid4())
+        self.supervisor_agent.update_state(*self._seed_state(user_message, result["answer"], thread_id))
+        return {**self._without_usage(result), "thread_id": thread_id}
+
+    async def afork_thread(self, user_message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        thread_id = str(uuid.uuid4())
+        await self.supervisor_agent.aupdate_state(*self._seed_state(user_message, result["answer"], thread_id))
+        return {**self._without_usage(result), "thread_id": thread_id}
+
+    @staticmethod
+    def _without_usage(result: Dict[str, Any]) -> Dict[str, Any]:
+        # A forked answer cost nothing on its new thread
+        return {k: v for k, v in result.items() if k != "usage"}
+
+    @staticmethod
+    def _seed_state(user_message: str, answer: str, thread_id: str):
+        config = {"configurable": {"thread_id": thread_id}}
+        return config, {"messages": [HumanMessage(content=user_message), AIMessage(content=answer)]}
+
+    async def astream(self, user_message: str, thread_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the supervisor graph and yield progress events as they happen:
+          start, subagent_start, subagent_end, tool_start, tool_end, token, and finally
+          `final` (completed, with extracted codes), `interrupt` (pending approval) or
+          `budget_exceeded`; all three carry the token usage.
+        Each event is {"event": name, "data": {...}} with `elapsed_ms` since the request started.
+        """
+        if thread_id is None:
+            thread_id = str(uuid.uuid4())
+        config = {"configurable": {"thread_id": thread_id}}
+        t0 = time.perf_counter()
+
+        def _event(name: str, **data) -> Dict[str, Any]:
+            data["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            return {"event": name, "data": data}
+
+        yield _event("start", thread_id=thread_id)
+
+        pending_tools: Dict[str, Dict[str, Any]] = {}   # tool_call_id -> {name, agent, t}
+        pending_tasks: Dict[str, Dict[str, Any]] = {}   # task tool_call_id -> {agent, description, t}
+        ns_agents: Dict[str, str] = {}                  # subgraph namespace -> subagent name
+        interrupt = None
+
+        def _agent_for(ns: tuple) -> str:
+            return ns_agents.get(ns[0], "subagent") if ns else "supervisor"
+
+        with self._metered(thread_id) as ledger, prefetching(user_message):
+            try:
+                async for ns, mode, chunk in self.supervisor_agent.astream(
+                    {"messages": [{"role": "user", "content": user_message}]},
+                    config=config,
+                    stream_mode=["updates", "messages"],
+                    subgraphs=True,
+                ):
+                    if mode == "messages":
+                        msg, meta = chunk
+                        if isinstance(msg, (AIMessageChunk, AIMessage)) and meta.get("langgraph_node") == "model":
+                            text = coerce_text(msg.content)
+                            if text:
+                                yield _event("token", agent=_agent_for(ns), text=text)
+                        continue
+
+                    if not ns and "__interrupt__" in chunk:
+                        interrupt = chunk["__interrupt__"]
+                        continue
+
+                    for update in chunk.values():
+                        for msg in _update_messages(update):
+                            if isinstance(msg, HumanMessage) and ns and ns[0] not in ns_agents:
+                                # A subgraph's first message is the task description the supervisor sent it
+                                for task in pending_tasks.values():
+                                    if task["description"] == coerce_text(msg.content) and not task.get("ns"):
+                                        task["ns"] = ns[0]
+                                        ns_agents[ns[0]] = task["agent"]
+                                        break
+                            elif isinstance(msg, AIMessage):
+                                for call in msg.tool_calls or []:
+                                    if call["name"] == "task":
+                                        agent = call["args"].get("subagent_type", "general-purpose")
+                                        pending_tasks[call["id"]] = {
+                                            "agent": agent,
+                                            "description": call["args"].get("description", ""),
+                                            "t": time.perf_counter(),
+                                        }
+                                        yield _event("subagent_start", agent=agent, tool_call_id=call["id"],
+                                                     description=call["args"].get("description", ""))
+                                    else:
+                                        pending_tools[call["id"]] = {
+                                            "name": call["name"], "agent": _agent_for(ns), "t": time.perf_counter(),
+                                        }
+                                        yield _event("tool_start", agent=_agent_for(ns), tool=call["name"],
+                                                     tool_call_id=call["id"], args=call["args"])
+                            elif isinstance(msg, ToolMessage):
+                                if msg.tool_call_id in pending_tasks:
+                                    task = pending_tasks.pop(msg.tool_call_id)
+                                    yield _event("subagent_end", agent=task["agent"], tool_call_id=msg.tool_call_id,
+                                                 duration_ms=round((time.perf_counter() - task["t"]) * 1000, 1))
+                                elif msg.tool_call_id in pending_tools:
+                                    call = pending_tools.pop(msg.tool_call_id)
+                                    yield _event("tool_end", agent=call["agent"], tool=call["name"],
+                                                 tool_call_id=msg.tool_call_id,
+                                                 duration_ms=round((time.perf_counter() - call["t"]) * 1000, 1),
+                                                 output_chars=len(coerce_text(msg.content)))
+            except TokenBudgetExceeded as e:
+                budget_error = e
+            else:
+                budget_error = None
+
+        if budget_error is not None:
+            yield _event("budget_exceeded", **self._finish(budget_error, thread_id, config, ledger))
+            return
+
+        if interrupt:
+            result = self._handle_result({"__interrupt__": interrupt}, thread_id, config)
+            yield _event("interrupt", **result, usage=self._usage(thread_id, ledger))
+            return
+
+        state = await self.supervisor_agent.aget_state(config)
+        result = self._finish(state.values, thread_id, config, ledger)
+        yield _event("final", codes=extract_codes(result["answer"]), **result)
+
 
     def _handle_result(self, result: Any, thread_id: str, config: Dict[str, Any]) -> Dict[str, Any]:
         # Interrupt path
         if isinstance(result, dict) and result.get("__interrupt__"):
             interrupts = result["__interrupt__"][0].value
-            return {
+            pending = {
                 "status": "pending_approval",
                 "thread_id": thread_id,
                 "actions": interrupts.get("action_requests", []),
             }
+            self.sessions[thread_id] = pending
+            return pending
 
         # Completed path – extract last message content if present
         answer = None
@@ -149,17 +407,70 @@ class AgentManager:
 
     
 
-    def decide(self, thread_id: str, action_name: str, decision: Literal["approve","edit","reject"], args: Optional[Dict[str, Any]],config) -> Dict[str, Any]:
+    def decide(self, thread_id: str, action_name: str, decision: Literal["approve","edit","reject"], args: Optional[Dict[str, Any]] = None, config=None) -> Dict[str, Any]:
+        session, error = self._claim_session(thread_id, action_name)
+        if error:
+            return {"status": "failed", "error": error}
+        with self._metered(thread_id) as ledger:
+            try:
+                result = self.supervisor_agent.invoke(
+                    self._resume_command(action_name, decision, args),
+                    config=config or {"configurable": {"thread_id": thread_id}}
+                )
+            except TokenBudgetExceeded as e:
+                result = e  # the approved step ran; the thread is past the interrupt
+            except Exception:
+                self.sessions[thread_id] = session  # keep the thread resumable
+                raise
+        if isinstance(result, TokenBudgetExceeded):
+            return self._finish(result, thread_id, {}, ledger)
+        return {**self._handle_decision(result, thread_id), "usage": self._usage(thread_id, ledger)}
+
+    async def adecide(self, thread_id: str, action_name: str, decision: Literal["approve","edit","reject"], args: Optional[Dict[str, Any]] = None, config=None) -> Dict[str, Any]:
+        session, error = self._claim_session(thread_id, action_name)
+        if error:
+            return {"status": "failed", "error": error}
+        with self._metered(thread_id) as ledger:
+            try:
+                result = await self.supervisor_agent.ainvoke(
+                    self._resume_command(action_name, decision, args),
+                    config=config or {"configurable": {"thread_id": thread_id}}
+                )
+            except TokenBudgetExceeded as e:
+                result = e  # the approved step ran; the thread is past the interrupt
+            except Exception:
+                self.sessions[thread_id] = session  # keep the thread resumable
+                raise
+        if isinstance(result, TokenBudgetExceeded):
+            return self._finish(result, thread_id, {}, ledger)
+        return {**self._handle_decision(result, thread_id), "usage": self._usage(thread_id, ledger)}
+
+    def _claim_session(self, thread_id: str, action_name: str):
+        """Take the pending session for `thread_id`; the store's atomic pop lets exactly one worker resume it."""
+        session = self.sessions.get(thread_id)
+        if not session:
+            return None, "invalid thread_id"
+        names = {a.get("name") for a in session.get("actions") or [] if isinstance(a, dict)}
+        if names and action_name not in names:
+            return None, f"unknown action {action_name!r} for thread; expected one of {sorted(names)}"
+        session = self.sessions.pop(thread_id)
+        if not session:
+            return None, "invalid thread_id"  # another worker resumed it first
+        return session, None
+
+    def _resume_command(self, action_name: str, decision: str, args: Optional[Dict[str, Any]]) -> Command:
         decision_obj = {"type": decision}
         if decision == "edit":
             decision_obj = {
                 "type": "edit",
                 "edited_action": {"name": action_name, "args": args or {}}
             }
-        result = self.supervisor_agent.invoke(
-            Command(resume={"decisions": [decision_obj]}),
-            config=config
-        )
+        return Command(resume={"decisions": [decision_obj]})
+
+    def _handle_decision(self, result: Any, thread_id: str) -> Dict[str, Any]:
+        if isinstance(result, dict) and result.get("__interrupt__"):
+            # The resumed run stopped on another approval; re-arm the session for it
+            return self._handle_result(result, thread_id, {"configurable": {"thread_id": thread_id}})
         answer = None
         if hasattr(result, "content"):
             answer = result.content
@@ -172,4 +483,4 @@ class AgentManager:
                 elif isinstance(last, dict):
                     answer = last.get("content")
 
-        return {"status": "completed", "thread_id": thread_id, "answer": answer or str(result)}
+        return {"status": "completed", "thread_id": thread_id, "answer": answer or str(result)}
\ No newline at end of file
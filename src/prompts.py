@@ -10,6 +10,21 @@ You are the *Supervisor Agent*. Your job is to:
 """
 
 
+# Section 3 of EVAL_PROMPT: how a note with both diagnoses and procedures is delegated.
+# The two lookups are independent, so both `task` calls go out in one turn and run concurrently.
+PARALLEL_DISPATCH = """   When a message contains BOTH diagnoses AND procedures:
+   - Delegate to BOTH subagents in parallel: call `diagnosis_agent` and `procedures_agent` in the SAME response (two `task` tool calls in one turn); the lookups are independent
+   - Give each subagent only its part of the case: the conditions to `diagnosis_agent`, the procedures to `procedures_agent`
+   - Wait for both results, then combine and present them in the combined-case format below
+"""
+
+SEQUENTIAL_DISPATCH = """   When a message contains BOTH diagnoses AND procedures:
+   - Delegate to BOTH subagents sequentially
+   - First get diagnosis codes from `diagnosis_agent`
+   - Then get procedure codes from `procedures_agent`
+   - Combine and present all results clearly
+"""
+
 EVAL_PROMPT="""
 You are the *Supervisor Agent* for medical coding. Your job is to analyze clinical cases and coordinate appropriate subagents.
 
@@ -36,12 +51,7 @@ You are the *Supervisor Agent* for medical coding. Your job is to analyze clinic
    - Handle yourself using available tools or knowledge
 
 ### 3. HANDLE COMPLEX CASES:
-   When a message contains BOTH diagnoses AND procedures:
-   - Delegate to BOTH subagents sequentially
-   - First get diagnosis codes from `diagnosis_agent`
-   - Then get procedure codes from `procedures_agent`
-   - Combine and present all results clearly
-
+""" + PARALLEL_DISPATCH + """
 ### 4. CODE VALIDATION & COMPLETION:
    
    **ICD-10-CM (Diagnosis Codes):**
@@ -100,6 +110,9 @@ You are the *Supervisor Agent* for medical coding. Your job is to analyze clinic
 - If uncertain, ask clarifying questions before delegating
 """
 
+# SUBAGENT_DISPATCH=sequential (the original behaviour, kept for latency A/B runs)
+EVAL_PROMPT_SEQUENTIAL = EVAL_PROMPT.replace(PARALLEL_DISPATCH, SEQUENTIAL_DISPATCH)
+
 DIAGNOSIS_PROMPT = """
     You are the *Diagnosis Agent*. You have a tool `icd10_query(full_condition)` which looks up the ICD-10 code for a given the full condition provided by the supervisor agent.
     When the superclass (supervisor) sends you a task, use the tool to lookup the correct code.
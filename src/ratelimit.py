@@ -0,0 +1,178 @@
+# src/ratelimit.py
+
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from app.config import settings
+from src.store import _open_sqlite
+
+# (requests, tokens, updated_at) — what is left of the per-minute budgets
+BucketState = Tuple[float, float, float]
+
+
+class TokenBucketLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for every model call in the process.
+    A call takes one request plus its estimated tokens up front; `charge` settles the
+    difference once the real usage is known, so the token budget may briefly go negative
+    and later callers wait it out. A budget of 0 is unlimited.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._state: BucketState = (float(rpm), float(tpm), time.time())
+
+    def try_acquire(self, tokens: int) -> float:
+        """Take the budget if available and return 0, else return the seconds to wait."""
+        return self._transact(self._take(tokens))
+
+    async def atry_acquire(self, tokens: int) -> float:
+        return await self._atransact(self._take(tokens))
+
+    def charge(self, tokens: int) -> None:
+        """Adjust the token budget by `tokens` (positive = more were used than estimated, negative = refund)."""
+        if self.tpm and tokens:
+            self._transact(self._settle(tokens))
+
+    async def acharge(self, tokens: int) -> None:
+        if self.tpm and tokens:
+            await self._atransact(self._settle(tokens))
+
+    def acquire(self, tokens: int) -> float:
+        """Block until the budget allows the call; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def aacquire(self, tokens: int) -> float:
+        waited = 0.0
+        while True:
+            delay = await self.atry_acquire(tokens)
+            if delay <= 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def _take(self, tokens: int) -> Callable[[BucketState], Tuple[BucketState, float]]:
+        def _apply(state: BucketState) -> Tuple[BucketState, float]:
+            req, tok, now = self._refill(state)
+            need_req = req - 1 if self.rpm else req
+            # a single call larger than the whole budget only waits for a full bucket
+            need_tok = tok - min(tokens, self.tpm) if self.tpm else tok
+            if need_req >= 0 and need_tok >= 0:
+                return (need_req, tok - tokens if self.tpm else tok, now), 0.0
+            wait_req = -need_req / (self.rpm / 60.0) if need_req < 0 else 0.0
+            wait_tok = -need_tok / (self.tpm / 60.0) if need_tok < 0 else 0.0
+            return (req, tok, now), max(wait_req, wait_tok, 0.01)
+        return _apply
+
+    def _settle(self, tokens: int) -> Callable[[BucketState], Tuple[BucketState, None]]:
+        def _apply(state: BucketState) -> Tuple[BucketState, None]:
+            req, tok, now = self._refill(state)
+            return (req, min(float(self.tpm), tok - tokens), now), None
+        return _apply
+
+    def _refill(self, state: BucketState) -> BucketState:
+        req, tok, updated = state
+        now = time.time()
+        elapsed = max(0.0, now - updated) / 60.0
+        return min(float(self.rpm), req + elapsed * self.rpm), min(float(self.tpm), tok + elapsed * self.tpm), now
+
+    def _transact(self, fn: Callable[[BucketState], Tuple[BucketState, object]]):
+        with self._lock:
+            self._state, result = fn(self._state)
+            return result
+
+    async def _atransact(self, fn: Callable[[BucketState], Tuple[BucketState, object]]):
+        return self._transact(fn)  # in memory: a short critical section, fine on the event loop
+
+
+class SqliteTokenBucketLimiter(TokenBucketLimiter):
+    """The same budgets kept in a SQLite row, so every worker process on the host shares them."""
+
+    def __init__(self, rpm: int, tpm: int, path: str, name: str = "gemini"):
+        super().__init__(rpm, tpm)
+        self.name = name
+        self.conn = _open_sqlite(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " name TEXT PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO rate_buckets(name, requests, tokens, updated_at) VALUES (?,?,?,?)",
+            (name, float(rpm), float(tpm), time.time()),
+        )
+
+    def _transact(self, fn):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")  # the file lock serializes all processes
+            try:
+                row = self.conn.execute(
+                    "SELECT requests, tokens, updated_at FROM rate_buckets WHERE name=?", (self.name,)
+                ).fetchone()
+                state, result = fn(tuple(row))
+                self.conn.execute(
+                    "UPDATE rate_buckets SET requests=?, tokens=?, updated_at=? WHERE name=?", (*state, self.name)
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    async def _atransact(self, fn):
+        # BEGIN IMMEDIATE can wait up to the busy timeout on another process: keep it off the event loop
+        return await asyncio.to_thread(self._transact, fn)
+
+
+# Status names in the messages of errors that carry no numeric code
+_RETRYABLE_TEXT = re.compile(r"RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED")
+
+
+def retry_reason(exc: BaseException) -> Optional[str]:
+    """"rate_limited" for 429, "server_error" for 5xx, else None; looks through wrapped causes."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+        if isinstance(code, int):
+            if code == 429:
+                return "rate_limited"
+            if 500 <= code < 600:
+                return "server_error"
+        match = _RETRYABLE_TEXT.search(str(exc))
+        if match:
+            return "rate_limited" if match.group(0) == "RESOURCE_EXHAUSTED" else "server_error"
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+_LIMITER: Optional[TokenBucketLimiter] = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def shared_rate_limiter() -> TokenBucketLimiter:
+    """The process-wide limiter from settings (SQLite-backed when LLM_RATE_LIMIT_PATH is set)."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            if settings.LLM_RATE_LIMIT_PATH:
+                _LIMITER = SqliteTokenBucketLimiter(settings.LLM_RPM, settings.LLM_TPM, settings.LLM_RATE_LIMIT_PATH)
+            else:
+                _LIMITER = TokenBucketLimiter(settings.LLM_RPM, settings.LLM_TPM)
+        return _LIMITER
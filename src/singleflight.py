@@ -0,0 +1,77 @@
+# src/singleflight.py
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from src.metrics import counter
+
+_coalesced = counter(
+    "agent_coalesced_requests_total", "Requests that joined an identical in-flight execution", ["api"]
+)
+
+
+class SingleFlight:
+    """Threaded callers with the same key share one execution of `fn` (sync `chat`)."""
+
+    def __init__(self, name: str = "sync"):
+        self.name = name
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); `shared` is True for callers that joined someone else's run."""
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if not leader:
+            _coalesced.inc(api=self.name)
+            return fut.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return result, False
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Coroutines with the same key share one task. The task is detached from the caller that
+    started it, so a client disconnecting does not cancel the run for everyone else.
+    """
+
+    def __init__(self, name: str = "async"):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            _coalesced.inc(api=self.name)
+        else:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved even if every caller went away
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
@@ -0,0 +1,734 @@
+# src/store.py
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.config import settings
+from src.metrics import counter
+
+EvictCallback = Callable[[List[str]], None]
+
+_evictions = counter(
+    "agent_state_evictions_total", "Threads/sessions dropped from the state stores", ["store", "reason"]
+)
+
+
+def _open_sqlite(path: str) -> sqlite3.Connection:
+    """Autocommit connection in WAL mode so several processes can share one state file."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Pending-approval sessions (replaces the module-level SESSIONS dict)
+# ---------------------------------------------------------------------------
+
+class SessionStore(ABC):
+    """Dict-like store of pending human-in-the-loop sessions keyed by thread_id."""
+
+    @abstractmethod
+    def get(self, thread_id: str, default: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    def pop(self, thread_id: str, default: Any = None) -> Any:
+        """Atomically remove and return a session (a resume claims it exactly once)."""
+
+    @abstractmethod
+    def __setitem__(self, thread_id: str, value: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """{"sessions": live entries, "bytes": serialized size}"""
+
+    def __delitem__(self, thread_id: str) -> None:
+        self.pop(thread_id)
+
+    def __contains__(self, thread_id: str) -> bool:
+        return self.get(thread_id) is not None
+
+    def discard(self, thread_ids: Iterable[str]) -> None:
+        for t in thread_ids:
+            self.pop(t)
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU with TTL and a cap on entry count and serialized bytes."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int, name: str = "sessions"):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(thread_id)
+            if entry is None:
+                return default
+            self._data.move_to_end(thread_id)
+            return entry[2]
+
+    def pop(self, thread_id: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._live(thread_id)
+            if entry is None:
+                return default
+            self._remove(thread_id)
+            return entry[2]
+
+    def __setitem__(self, thread_id: str, value: Dict[str, Any]) -> None:
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            if thread_id in self._data:
+                self._remove(thread_id)
+            self._data[thread_id] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._evict()
+            return {"sessions": len(self._data), "bytes": self._bytes}
+
+    def _live(self, thread_id: str):
+        entry = self._data.get(thread_id)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(thread_id)
+            _evictions.inc(store=self.name, reason="ttl")
+            return None
+        return entry
+
+    def _remove(self, thread_id: str) -> None:
+        _, size, _ = self._data.pop(thread_id)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._data:
+            thread_id, (expires, _, _) = next(iter(self._data.items()))
+            if expires < now:
+                reason = "ttl"
+            elif len(self._data) > self.max_entries:
+                reason = "lru"
+            elif self._bytes > self.max_bytes:
+                reason = "memory"
+            else:
+                break
+            self._remove(thread_id)
+            _evictions.inc(store=self.name, reason=reason)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a SQLite table: survive restarts and are visible to every worker process."""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int, max_bytes: int, name: str = "sessions"):
+        self.name = name  # also the table name
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = _open_sqlite(path)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            " thread_id TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_last_access ON {name}(last_access)")
+
+    @contextmanager
+    def _tx(self, mode: str = "IMMEDIATE"):
+        """A transaction on the shared connection; "DEFERRED" reads without the database write lock."""
+        with self._lock:
+            self.conn.execute(f"BEGIN {mode}")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def get(self, thread_id: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._tx() as c:
+            row = c.execute(
+                f"SELECT value FROM {self.name} WHERE thread_id=? AND expires_at>=?", (thread_id, now)
+            ).fetchone()
+            if row is None:
+                return default
+            c.execute(f"UPDATE {self.name} SET last_access=? WHERE thread_id=?", (now, thread_id))
+        return json.loads(row[0])
+
+    def pop(self, thread_id: str, default: Any = None) -> Any:
+        with self._tx() as c:
+            row = c.execute(
+                f"SELECT value, expires_at FROM {self.name} WHERE thread_id=?", (thread_id,)
+            ).fetchone()
+            if row is None:
+                return default
+            c.execute(f"DELETE FROM {self.name} WHERE thread_id=?", (thread_id,))
+        if row[1] < time.time():
+            return default
+        return json.loads(row[0])
+
+    def __setitem__(self, thread_id: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._tx() as c:
+            c.execute(
+                f"INSERT OR REPLACE INTO {self.name}(thread_id, value, expires_at, last_access) VALUES (?,?,?,?)",
+                (thread_id, json.dumps(value, default=str), now + self.ttl_seconds, now),
+            )
+            self._evict(c, now)
+
+    def __len__(self) -> int:
+        return self.stats()["sessions"]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            n, size = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)),0) FROM {self.name} WHERE expires_at>=?", (time.time(),)
+            ).fetchone()
+        return {"sessions": n, "bytes": size}
+
+    def _evict(self, c: sqlite3.Connection, now: float) -> None:
+        expired = c.execute(f"DELETE FROM {self.name} WHERE expires_at<?", (now,)).rowcount
+        if expired > 0:
+            _evictions.inc(expired, store=self.name, reason="ttl")
+        n, size = c.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)),0) FROM {self.name}").fetchone()
+        if n <= self.max_entries and size <= self.max_bytes:
+            return
+        for thread_id, length in c.execute(
+            f"SELECT thread_id, LENGTH(value) FROM {self.name} ORDER BY last_access"
+        ).fetchall():
+            if n <= self.max_entries and size <= self.max_bytes:
+                break
+            c.execute(f"DELETE FROM {self.name} WHERE thread_id=?", (thread_id,))
+            _evictions.inc(store=self.name, reason="lru" if n > self.max_entries else "memory")
+            n -= 1
+            size -= length
+
+
+# ---------------------------------------------------------------------------
+# Checkpointers (replace the unbounded MemorySaver)
+# ---------------------------------------------------------------------------
+
+def _next_version(current: Optional[str]) -> str:
+    # Same scheme as InMemorySaver: zero-padded counter + random tiebreak, sortable as str.
+    if current is None:
+        current_v = 0
+    elif isinstance(current, int):
+        current_v = current
+    else:
+        current_v = int(current.split(".")[0])
+    return f"{current_v + 1:032}.{random.random():016}"
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    InMemorySaver that keeps only the last `max_checkpoints_per_thread` checkpoints of each
+    namespace (plus the channel blobs they reference) and evicts whole threads by TTL, LRU
+    count and total serialized bytes.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_threads: int, max_bytes: int,
+                 max_checkpoints_per_thread: int = 4, on_evict: Optional[EvictCallback] = None, serde=None):
+        super().__init__(serde=serde)
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self.on_evict = on_evict
+        self._lock = threading.RLock()
+        self._access: "OrderedDict[str, float]" = OrderedDict()
+        self._thread_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._blob_keys: Dict[Tuple[str, str], set] = {}
+
+    # -- reads ---------------------------------------------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id not in self.storage:
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config and config["configurable"]["thread_id"] not in self.storage:
+                return iter(())
+            return iter(list(super().list(config, **kwargs)))
+
+    # -- writes --------------------------------------------------------------
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            ck, meta, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            added = len(ck[1]) + len(meta[1])
+            keys = self._blob_keys.setdefault((thread_id, checkpoint_ns), set())
+            for k, v in new_versions.items():
+                keys.add((k, v))
+                added += len(self.blobs[(thread_id, checkpoint_ns, k, v)][1])
+            self._account(thread_id, added)
+            self._prune_history(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            evicted = self._evict(exclude=thread_id)
+        self._notify(evicted)
+        return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        outer_key = (thread_id, config["configurable"].get("checkpoint_ns", ""),
+                     config["configurable"]["checkpoint_id"])
+        with self._lock:
+            before = self._writes_size(self.writes.get(outer_key))
+            super().put_writes(config, writes, task_id, task_path)
+            self._account(thread_id, self._writes_size(self.writes.get(outer_key)) - before)
+            self._touch(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+            self._access.pop(thread_id, None)
+            for key in [k for k in self._blob_keys if k[0] == thread_id]:
+                del self._blob_keys[key]
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return _next_version(current)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            evicted = self._evict()
+        self._notify(evicted)
+        return {"threads": len(self._access), "bytes": self._total_bytes}
+
+    # -- internals -----------------------------------------------------------
+    @staticmethod
+    def _writes_size(writes: Optional[Dict[Any, Any]]) -> int:
+        return sum(len(w[2][1]) for w in writes.values()) if writes else 0
+
+    def _account(self, thread_id: str, delta: int) -> None:
+        self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + delta
+        self._total_bytes += delta
+
+    def _touch(self, thread_id: str) -> None:
+        self._access[thread_id] = time.monotonic()
+        self._access.move_to_end(thread_id)
+
+    def _prune_history(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_checkpoints_per_thread:
+            return
+        freed = 0
+        for checkpoint_id in sorted(checkpoints)[:-self.max_checkpoints_per_thread]:
+            ck, meta, _ = checkpoints.pop(checkpoint_id)
+            freed += len(ck[1]) + len(meta[1])
+            freed += self._writes_size(self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None))
+        # Drop channel blobs no retained checkpoint points at any more
+        referenced = set()
+        for ck, _, _ in checkpoints.values():
+            referenced.update(self.serde.loads_typed(ck)["channel_versions"].items())
+        keys = self._blob_keys.get((thread_id, checkpoint_ns), set())
+        for channel, version in list(keys - referenced):
+            blob = self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+            if blob is not None:
+                freed += len(blob[1])
+            keys.discard((channel, version))
+        self._account(thread_id, -freed)
+
+    def _evict(self, exclude: Optional[str] = None) -> List[str]:
+        evicted = []
+        now = time.monotonic()
+        while self._access:
+            thread_id, last = next(iter(self._access.items()))
+            if thread_id == exclude:
+                break  # only the thread being written is left
+            if now - last > self.ttl_seconds:
+                reason = "ttl"
+            elif len(self._access) > self.max_threads:
+                reason = "lru"
+            elif self._total_bytes > self.max_bytes:
+                reason = "memory"
+            else:
+                break
+            self.delete_thread(thread_id)
+            _evictions.inc(store="checkpoints", reason=reason)
+            evicted.append(thread_id)
+        return evicted
+
+    def _notify(self, evicted: List[str]) -> None:
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """
+    On-disk checkpointer. Checkpoints and writes are stored as serde-typed msgpack, zlib
+    compressed above `compress_min_bytes`; only the last `max_checkpoints_per_thread` per
+    namespace are kept, and threads are evicted by TTL, LRU count and total bytes. The caps are
+    enforced on every put; only the TTL sweep is throttled to one per `ttl_sweep_interval_seconds`.
+    Reads never take the write lock: a read bumps its thread's `last_access` at most once per
+    `touch_interval_seconds`, as a separate write.
+    """
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_threads: int, max_bytes: int,
+                 max_checkpoints_per_thread: int = 4, on_evict: Optional[EvictCallback] = None,
+                 compress_min_bytes: int = 512, ttl_sweep_interval_seconds: float = 1.0,
+                 touch_interval_seconds: float = 5.0, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self.on_evict = on_evict
+        self.compress_min_bytes = compress_min_bytes
+        self.ttl_sweep_interval_seconds = ttl_sweep_interval_seconds
+        self._next_ttl_sweep = 0.0
+        self.touch_interval_seconds = touch_interval_seconds
+        self._touched: Dict[str, float] = {}  # thread_id -> monotonic time of its last last_access write
+        self._touched_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.conn = _open_sqlite(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT,
+                type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, idx INTEGER NOT NULL,
+                channel TEXT NOT NULL, type TEXT, value BLOB, task_path TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY, last_access REAL NOT NULL, bytes INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS threads_last_access ON threads(last_access);
+            """
+        )
+
+    # -- serialization -------------------------------------------------------
+    def _dumps(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= self.compress_min_bytes:
+            return "z+" + type_, zlib.compress(data, 6)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_.startswith("z+"):
+            type_, data = type_[2:], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    @contextmanager
+    def _tx(self, mode: str = "IMMEDIATE"):
+        """A transaction on the shared connection; "DEFERRED" reads without the database write lock."""
+        with self._lock:
+            self.conn.execute(f"BEGIN {mode}")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _touch(self, c: sqlite3.Connection, thread_id: str, recount: bool = False) -> None:
+        if recount:
+            size = c.execute(
+                "SELECT (SELECT COALESCE(SUM(LENGTH(checkpoint)+LENGTH(metadata)),0) FROM checkpoints WHERE thread_id=?)"
+                " + (SELECT COALESCE(SUM(LENGTH(value)),0) FROM writes WHERE thread_id=?)",
+                (thread_id, thread_id),
+            ).fetchone()[0]
+            c.execute(
+                "INSERT INTO threads(thread_id, last_access, bytes) VALUES (?,?,?)"
+                " ON CONFLICT(thread_id) DO UPDATE SET last_access=excluded.last_access, bytes=excluded.bytes",
+                (thread_id, time.time(), size),
+            )
+        else:
+            c.execute("UPDATE threads SET last_access=? WHERE thread_id=?", (time.time(), thread_id))
+
+    @staticmethod
+    def _writes(c: sqlite3.Connection, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        return c.execute(
+            "SELECT task_id, channel, type, value FROM writes"
+            " WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row, writes) -> CheckpointTuple:
+        """Deserialize a checkpoint row and its writes (outside the lock: it is the slow part)."""
+        checkpoint_id, parent_id, type_, ck, meta_type, meta = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self._loads(type_, ck),
+            metadata=self._loads(meta_type, meta),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                  "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self._loads(t, v)) for task_id, channel, t, v in writes],
+        )
+
+    # -- BaseCheckpointSaver -------------------------------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        cols = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._tx("DEFERRED") as c:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = c.execute(
+                    f"SELECT {cols} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = c.execute(
+                    f"SELECT {cols} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=?"
+                    " ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            writes = self._writes(c, thread_id, checkpoint_ns, row[0])
+        self._touch_read(thread_id)
+        return self._tuple(thread_id, checkpoint_ns, row, writes)
+
+    def _touch_read(self, thread_id: str) -> None:
+        """Refresh a read thread's LRU position, throttled so reads stay off the write lock."""
+        if time.monotonic() - self._touched.get(thread_id, float("-inf")) < self.touch_interval_seconds:
+            return
+        self._touched_now(thread_id)
+        with self._tx() as c:
+            self._touch(c, thread_id)
+
+    def _touched_now(self, thread_id: str) -> None:
+        with self._touched_lock:
+            self._touched.pop(thread_id, None)
+            if len(self._touched) >= self.max_threads:
+                self._touched.pop(next(iter(self._touched)))  # forget the longest-untouched thread
+            self._touched[thread_id] = time.monotonic()
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        where, params = [], []
+        if config:
+            where.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns=?")
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            params.append(before_id)
+        sql = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,"
+               " metadata_type, metadata FROM checkpoints")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY checkpoint_id DESC"
+        if limit is not None and not filter:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._tx("DEFERRED") as c:
+            rows = [(thread_id, checkpoint_ns, row, self._writes(c, thread_id, checkpoint_ns, row[0]))
+                    for thread_id, checkpoint_ns, *row in c.execute(sql, params).fetchall()]
+        out = []
+        for thread_id, checkpoint_ns, row, writes in rows:
+            if limit is not None and len(out) >= limit:
+                break
+            item = self._tuple(thread_id, checkpoint_ns, row, writes)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            out.append(item)
+        return iter(out)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, data = self._dumps(checkpoint)
+        meta_type, meta = self._dumps(get_checkpoint_metadata(config, metadata))
+        with self._tx() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?,?,?,?,?,?,?,?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, data, meta_type, meta),
+            )
+            keep = ("SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=?"
+                    " ORDER BY checkpoint_id DESC LIMIT ?")
+            args = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints_per_thread)
+            c.execute(f"DELETE FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id NOT IN ({keep})", args)
+            c.execute(f"DELETE FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id NOT IN ({keep})", args)
+            self._touch(c, thread_id, recount=True)
+            evicted = self._evict(c, exclude=thread_id)
+        self._touched_now(thread_id)
+        self._notify(evicted)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        verb = "INSERT OR REPLACE" if all(w[0] in WRITES_IDX_MAP for w in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+        with self._tx() as c:
+            c.executemany(f"{verb} INTO writes VALUES (?,?,?,?,?,?,?,?,?)", rows)
+            self._touch(c, thread_id, recount=True)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._tx() as c:
+            self._delete(c, thread_id)
+
+    @staticmethod
+    def _delete(c: sqlite3.Connection, thread_id: str) -> None:
+        c.execute("DELETE FROM checkpoints WHERE thread_id=?", (thread_id,))
+        c.execute("DELETE FROM writes WHERE thread_id=?", (thread_id,))
+        c.execute("DELETE FROM threads WHERE thread_id=?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return _next_version(current)
+
+    # Async API: SQLite calls go to a worker thread so they never block the event loop
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # -- eviction / stats ----------------------------------------------------
+    def _evict(self, c: sqlite3.Connection, exclude: Optional[str] = None, sweep: bool = False) -> List[str]:
+        """Drop expired threads (when a sweep is due, or `sweep`), then LRU threads until under the caps."""
+        evicted: List[Tuple[str, str]] = []
+        now = time.monotonic()
+        if sweep or now >= self._next_ttl_sweep:
+            self._next_ttl_sweep = now + self.ttl_sweep_interval_seconds
+            cutoff = time.time() - self.ttl_seconds
+            for (thread_id,) in c.execute(
+                "SELECT thread_id FROM threads WHERE last_access<? AND thread_id!=?", (cutoff, exclude or "")
+            ).fetchall():
+                evicted.append((thread_id, "ttl"))
+            for thread_id, _ in evicted:
+                self._delete(c, thread_id)
+        n, size = c.execute("SELECT COUNT(*), COALESCE(SUM(bytes),0) FROM threads").fetchone()
+        if n > self.max_threads or size > self.max_bytes:
+            for thread_id, thread_bytes in c.execute(
+                "SELECT thread_id, bytes FROM threads WHERE thread_id!=? ORDER BY last_access", (exclude or "",)
+            ).fetchall():
+                if n <= self.max_threads and size <= self.max_bytes:
+                    break
+                evicted.append((thread_id, "lru" if n > self.max_threads else "memory"))
+                self._delete(c, thread_id)
+                n -= 1
+                size -= thread_bytes
+        for _, reason in evicted:
+            _evictions.inc(store="checkpoints", reason=reason)
+        return [t for t, _ in evicted]
+
+    def _notify(self, evicted: List[str]) -> None:
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._tx() as c:
+            evicted = self._evict(c, sweep=True)
+        self._notify(evicted)
+        with self._lock:
+            n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes),0) FROM threads").fetchone()
+            pages, page_size = (self.conn.execute("PRAGMA page_count").fetchone()[0],
+                                self.conn.execute("PRAGMA page_size").fetchone()[0])
+        return {"threads": n, "bytes": size, "file_bytes": pages * page_size}
+
+
+# ---------------------------------------------------------------------------
+# Factories (driven by STATE_* settings)
+# ---------------------------------------------------------------------------
+
+def make_session_store(name: str = "sessions") -> SessionStore:
+    if settings.STATE_BACKEND == "sqlite":
+        return SqliteSessionStore(settings.STATE_SQLITE_PATH, settings.STATE_TTL_SECONDS,
+                                  settings.STATE_MAX_THREADS, settings.STATE_MAX_BYTES, name=name)
+    return MemorySessionStore(settings.STATE_TTL_SECONDS, settings.STATE_MAX_THREADS, settings.STATE_MAX_BYTES,
+                              name=name)
+
+
+def make_checkpointer(on_evict: Optional[EvictCallback] = None) -> BaseCheckpointSaver:
+    kwargs = dict(
+        ttl_seconds=settings.STATE_TTL_SECONDS,
+        max_threads=settings.STATE_MAX_THREADS,
+        max_bytes=settings.STATE_MAX_BYTES,
+        max_checkpoints_per_thread=settings.STATE_MAX_CHECKPOINTS_PER_THREAD,
+        on_evict=on_evict,
+    )
+    if settings.STATE_BACKEND == "sqlite":
+        return SqliteCheckpointSaver(settings.STATE_SQLITE_PATH, **kwargs)
+    return BoundedMemorySaver(**kwargs)
@@ -1,10 +1,26 @@
 # src/tools.py
 
 import os
-from typing import Literal, Optional, Dict, Any
+import asyncio
+import contextvars
+import functools
+import glob
+import hashlib
+import inspect
+import math
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Literal, NamedTuple, Optional, Dict, Any
 from tavily import TavilyClient
-from langchain_core.tools import tool
+from langchain_core.tools import tool, StructuredTool
 from app.config import settings
+from src.cache import normalize_message
+from src.embed_cache import EmbeddingCache, make_embedding_cache
+from src.http_pool import httpx_client_args, requests_session
+from src.metrics import counter, histogram
+from src.usage import fit_tool_output
 import os
 from typing import List
 import logging
@@ -19,42 +35,82 @@ if not logger.handlers:
     )
 
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; concurrent exports then write the same file twice
+    fcntl = None
+
 from llama_index.core import VectorStoreIndex, Settings, StorageContext
+from llama_index.core.base.base_retriever import BaseRetriever
 from llama_index.vector_stores.chroma import ChromaVectorStore
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
 
-from llama_index.llms.google_genai import GoogleGenAI  # for answer generation
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding  # matching the collection embeddings
 from dotenv import load_dotenv
 load_dotenv()
-# Set up the LLM
-# ------------ Eager inits (wrapped with logs so failures are clear) ------------
-try:
-    logger.info("Initializing GoogleGenAI LLM for LlamaIndex...")
-    api_key = settings.GOOGLE_GENAI_API_KEY
-    if not api_key:
-        logger.warning("GOOGLE_GENAI_API_KEY is not set (env missing). LLM init may fail later.")
-    Settings.llm = GoogleGenAI(
-        model_name="gemini-2.5-flash",
-        temperature=0.0,
-        api_key=api_key,
-    )
-    logger.info("LLM initialized.")
-except Exception as e:
-    logger.exception("Failed to initialize GoogleGenAI LLM: %s", e)
-    # Re-raise so you see this as the top error if it’s the cause
-    raise
 
-try:
-    logger.info("Initializing HuggingFace embedding model (all-MiniLM-L6-v2) to match Chroma collections...")
-    Settings.embed_model = HuggingFaceEmbedding(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    logger.info("Embedding model initialized (384 dimensions).")
-except Exception as e:
-    logger.exception("Failed to initialize HuggingFace embedding: %s", e)
-    raise
+# ------------ Lazy inits (first retrieval or warm_up(); wrapped with logs so failures are clear) ------------
+# Importing this module stays cheap: the Gemini LLM, the MiniLM embedder (torch) and the Tavily
+# client are built on first use, or up front by the API's lifespan warm-up.
+__MODELS_READY = False
+__TAVILY_CLIENT: Optional[TavilyClient] = None
+__EMBED_CACHE: Optional[EmbeddingCache] = None
+
+
+def _init_models() -> None:
+    """Configure the LlamaIndex LLM and embedding model once per process."""
+    global __MODELS_READY, __EMBED_CACHE
+    if __MODELS_READY:
+        return
+    with __INIT_LOCK:
+        if __MODELS_READY:
+            return
+        from llama_index.llms.google_genai import GoogleGenAI  # for answer generation
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding  # matching the collection embeddings
+
+        if settings.LLM_PROVIDER == "scripted":
+            logger.info("LLM_PROVIDER=scripted: skipping the GoogleGenAI LLM (retrieval only needs embeddings).")
+        else:
+            try:
+                logger.info("Initializing GoogleGenAI LLM for LlamaIndex...")
+                api_key = settings.GOOGLE_GENAI_API_KEY
+                if not api_key:
+                    logger.warning("GOOGLE_GENAI_API_KEY is not set (env missing). LLM init may fail later.")
+                client_args = httpx_client_args("gemini")
+                Settings.llm = GoogleGenAI(
+                    model_name="gemini-2.5-flash",
+                    temperature=0.0,
+                    api_key=api_key,
+                    http_options={"client_args": client_args, "async_client_args": client_args},
+                )
+                logger.info("LLM initialized.")
+            except Exception as e:
+                logger.exception("Failed to initialize GoogleGenAI LLM: %s", e)
+                # Re-raise so you see this as the top error if it’s the cause
+                raise
+
+        try:
+            logger.info("Initializing HuggingFace embedding model (all-MiniLM-L6-v2) to match Chroma collections...")
+            Settings.embed_model = HuggingFaceEmbedding(
+                model_name="sentence-transformers/all-MiniLM-L6-v2"
+            )
+            logger.info("Embedding model initialized (384 dimensions).")
+        except Exception as e:
+            logger.exception("Failed to initialize HuggingFace embedding: %s", e)
+            raise
+        __EMBED_CACHE = make_embedding_cache(Settings.embed_model.model_name)
+        __MODELS_READY = True
+
+
+def _get_tavily_client() -> TavilyClient:
+    global __TAVILY_CLIENT
+    if __TAVILY_CLIENT is None:
+        with __INIT_LOCK:
+            if __TAVILY_CLIENT is None:
+                __TAVILY_CLIENT = TavilyClient(api_key=settings.TAVILY_API_KEY, session=requests_session("tavily"))
+    return __TAVILY_CLIENT
+
 
 _PERSIST_DIR = "chroma_store"
 _COLLECTION_NAME = "icd10_tabular"
@@ -65,9 +121,27 @@ _COLLECTION_NAME_PCS_GUIDELINES = "icd10pcs_guidelines"
 
 __CHROMA_CLIENT: Optional[chromadb.PersistentClient] = None
 __INDICES: dict[str, VectorStoreIndex] = {}  # cache indices per collection
-
-# Initialize Tavily client once
-tavily_client = TavilyClient(api_key=settings.TAVILY_API_KEY)
+__ENGINES: dict[str, "RetrievalEngine"] = {}  # search engines per collection, over the cached indices
+__INIT_LOCK = threading.RLock()  # tools run on several executor threads at once
+
+_tool_latency = histogram("tool_duration_seconds", "Retrieval tool end-to-end time", ["tool"])
+_tool_stage = histogram(
+    "tool_stage_duration_seconds", "Retrieval tool time by stage (queue_wait, embedding, search, format)",
+    ["tool", "stage"],
+)
+
+# Bounded pool for the CPU-bound query embedding + Chroma search done by the retrieval
+# tools, so async callers never block the event loop and never oversubscribe the CPU.
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="retrieval",
+)
+# Side searches a tool fans out from its retrieval thread (e.g. icd10_query's parents collection).
+# Kept apart from the pool above: a task waiting on a subtask in its own pool could deadlock it.
+_SEARCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=settings.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="retrieval-search",
+)
 
 @tool
 def get_weather(city: str) -> str:
@@ -82,7 +156,7 @@ def internet_search(
     include_raw_content: bool = False,
 ):
     """Run a web search."""
-    return tavily_client.search(
+    return _get_tavily_client().search(
         query,
         max_results=max_results,
         include_raw_content=include_raw_content,
@@ -92,19 +166,22 @@ def internet_search(
 
 def _get_chroma_client() -> chromadb.PersistentClient:
     global __CHROMA_CLIENT
-    if __CHROMA_CLIENT is None:
-        logger.info("_get_chroma_client: opening Chroma PersistentClient at %s", _PERSIST_DIR)
-        if not os.path.isdir(_PERSIST_DIR):
-            msg = (f"Chroma persist dir not found: {_PERSIST_DIR} "
-                   f"(ensure you built the indexes first).")
-            logger.error(msg)
-            raise FileNotFoundError(msg)
-        __CHROMA_CLIENT = chromadb.PersistentClient(
-            path=_PERSIST_DIR,
-            settings=ChromaSettings(allow_reset=False),
-        )
-        names = [c.name for c in __CHROMA_CLIENT.list_collections()]
-        logger.info("_get_chroma_client: collections present: %s", names)
+    if __CHROMA_CLIENT is not None:
+        return __CHROMA_CLIENT
+    with __INIT_LOCK:
+        if __CHROMA_CLIENT is None:
+            logger.info("_get_chroma_client: opening Chroma PersistentClient at %s", _PERSIST_DIR)
+            if not os.path.isdir(_PERSIST_DIR):
+                msg = (f"Chroma persist dir not found: {_PERSIST_DIR} "
+                       f"(ensure you built the indexes first).")
+                logger.error(msg)
+                raise FileNotFoundError(msg)
+            __CHROMA_CLIENT = chromadb.PersistentClient(
+                path=_PERSIST_DIR,
+                settings=ChromaSettings(allow_reset=False),
+            )
+            names = [c.name for c in __CHROMA_CLIENT.list_collections()]
+            logger.info("_get_chroma_client: collections present: %s", names)
     return __CHROMA_CLIENT
 
 
@@ -113,50 +190,330 @@ def _get_index_for_collection(collection_name: str) -> VectorStoreIndex:
     if collection_name in __INDICES:
         return __INDICES[collection_name]
 
-    client = _get_chroma_client()
-    # strict: do NOT create
-    logger.info("_get_index_for_collection: getting collection '%s'...", collection_name)
-    collection = client.get_collection(collection_name)
-    logger.info("_get_index_for_collection: collection found. (name=%s)", collection.name)
+    with __INIT_LOCK:
+        if collection_name in __INDICES:
+            return __INDICES[collection_name]
 
-    vector_store = ChromaVectorStore(chroma_collection=collection)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    index = VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
-    __INDICES[collection_name] = index
-    return index
+        _init_models()
+        client = _get_chroma_client()
+        # strict: do NOT create
+        logger.info("_get_index_for_collection: getting collection '%s'...", collection_name)
+        collection = client.get_collection(collection_name)
+        logger.info("_get_index_for_collection: collection found. (name=%s)", collection.name)
 
+        vector_store = ChromaVectorStore(chroma_collection=collection)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, storage_context=storage_context)
+        __INDICES[collection_name] = index
+        return index
 
-def _node_text(n) -> str:
+
+class Hit(NamedTuple):
+    """One search result as plain data (no LlamaIndex node objects)."""
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+    score: float  # exp(-distance), the similarity LlamaIndex's Chroma store reports
+
+
+# Bookkeeping LlamaIndex writes next to each node's own metadata in Chroma
+_NODE_BOOKKEEPING_KEYS = frozenset({"_node_content", "_node_type", "document_id", "doc_id", "ref_doc_id"})
+
+
+class RetrievalEngine:
     """
-    Robustly extract the text content from a NodeWithScore or a BaseNode
-    across LlamaIndex versions.
+    Search over one collection. `search` sends a ready query vector straight to the Chroma
+    collection and returns `Hit` tuples, skipping the retriever, QueryBundle and node
+    deserialization a LlamaIndex retrieve() pays per call. `retriever(top_k)` hands out a
+    prebuilt LlamaIndex retriever for callers that do want nodes.
     """
-    # If it's NodeWithScore, unwrap to the underlying node
-    node_obj = getattr(n, "node", n)
 
-    # Preferred: get_content (newer API)
-    try:
-        if hasattr(node_obj, "get_content"):
-            return node_obj.get_content(metadata_mode="none")
-    except Exception:
-        pass
+    def __init__(self, name: str, index: VectorStoreIndex):
+        self.name = name
+        self.index = index
+        self.collection = index.vector_store.client
+        self._retrievers: Dict[int, BaseRetriever] = {}
+
+    def retriever(self, top_k: int) -> BaseRetriever:
+        retriever = self._retrievers.get(top_k)
+        if retriever is None:
+            # a race builds two equivalent retrievers; either one is fine to keep
+            retriever = self._retrievers[top_k] = self.index.as_retriever(similarity_top_k=top_k)
+        return retriever
+
+    def search(self, query_vec: List[float], k: int, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Top `k` hits for `query_vec`, optionally narrowed by a Chroma `where` filter on metadata."""
+        res = self.collection.query(
+            query_embeddings=[query_vec], n_results=k, where=filters or None,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            Hit(hit_id, text or "", {key: v for key, v in (meta or {}).items() if key not in _NODE_BOOKKEEPING_KEYS},
+                math.exp(-distance))
+            for hit_id, text, meta, distance in zip(
+                res["ids"][0], res["documents"][0], res["metadatas"][0], res["distances"][0])
+        ]
+
+
+def _collection_space(collection) -> str:
+    """Distance function of a Chroma collection: "l2" (squared, Chroma's default), "cosine" or "ip"."""
+    config = getattr(collection, "configuration", None) or {}
+    space = (config.get("hnsw") or {}).get("space") if isinstance(config, dict) else None
+    return space or (collection.metadata or {}).get("hnsw:space") or "l2"
+
+
+def _where_matches(meta: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evaluate a Chroma `where` filter ($and/$or, $eq/$ne/$in/$nin, or plain field: value) on one row."""
+    for key, cond in where.items():
+        if key == "$and":
+            ok = all(_where_matches(meta, c) for c in cond)
+        elif key == "$or":
+            ok = any(_where_matches(meta, c) for c in cond)
+        elif isinstance(cond, dict):
+            (op, value), = cond.items()
+            if op not in _WHERE_OPS:
+                raise ValueError(f"unsupported filter operator for the numpy backend: {op}")
+            ok = _WHERE_OPS[op](meta.get(key), value)
+        else:
+            ok = meta.get(key) == cond
+        if not ok:
+            return False
+    return True
+
+
+_WHERE_OPS = {
+    "$eq": lambda v, x: v == x,
+    "$ne": lambda v, x: v != x,
+    "$in": lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+}
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Exclusive advisory lock on `path` across processes (a no-op where fcntl is unavailable)."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _spill(name: str, matrix: np.ndarray) -> np.ndarray:
+    """
+    Map `matrix` read-only from RETRIEVAL_VECTORS_DIR (shared page cache, not heap). The file is
+    named after a hash of the vectors, so only the first worker to export them writes it; every
+    other worker, and later restarts, map the same file and share one copy in the page cache.
+    """
+    os.makedirs(settings.RETRIEVAL_VECTORS_DIR, exist_ok=True)
+    digest = hashlib.sha256(str(matrix.shape).encode())
+    digest.update(matrix)
+    path = os.path.join(settings.RETRIEVAL_VECTORS_DIR, f"{name}.{digest.hexdigest()[:16]}.f32.npy")
+    with _file_lock(os.path.join(settings.RETRIEVAL_VECTORS_DIR, f"{name}.lock")):
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp, path)
+            # Older exports of this collection: workers still mapping one keep it until they unmap
+            for stale in glob.glob(os.path.join(settings.RETRIEVAL_VECTORS_DIR, f"{glob.escape(name)}.*.f32.npy")):
+                if stale != path:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass  # still mapped by a worker on a platform that won't unlink open files
+    return np.load(path, mmap_mode="r")
+
+
+class NumpyRetrievalEngine(RetrievalEngine):
+    """
+    Exact search over a collection exported once into memory: a contiguous float32 matrix plus
+    id/text/metadata arrays in the same row order. One matrix-vector product yields every
+    distance (in the collection's own space, so scores match Chroma's) and argpartition picks
+    the top k, with no index or sqlite work per query.
+
+    With `quantization` ("float16" or "int8", default RETRIEVAL_QUANTIZATION) only the compact
+    copy stays on the heap and is scanned; the float32 matrix is memory-mapped from disk and
+    read just for the RETRIEVAL_RESCORE_FACTOR * k best candidates, which are rescored exactly.
+    """
 
-    # Fallback: get_text (older API)
-    try:
-        if hasattr(node_obj, "get_text"):
-            return node_obj.get_text()
-    except Exception:
-        pass
+    _EXPORT_BATCH = 5000
+    _SCAN_BLOCK = 1024  # rows upcast to float32 at a time: stays in cache, never a full-size copy
+
+    def __init__(self, name: str, index: VectorStoreIndex, quantization: Optional[str] = None):
+        super().__init__(name, index)
+        t0 = time.perf_counter()
+        self.space = _collection_space(self.collection)
+        self.quantization = quantization or settings.RETRIEVAL_QUANTIZATION
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        blocks = []
+        for offset in range(0, self.collection.count(), self._EXPORT_BATCH):
+            batch = self.collection.get(include=["embeddings", "documents", "metadatas"],
+                                        limit=self._EXPORT_BATCH, offset=offset)
+            self.ids.extend(batch["ids"])
+            self.texts.extend(text or "" for text in batch["documents"])
+            self.metadata.extend({k: v for k, v in (meta or {}).items() if k not in _NODE_BOOKKEEPING_KEYS}
+                                 for meta in batch["metadatas"])
+            blocks.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        matrix = np.ascontiguousarray(np.concatenate(blocks)) if blocks else np.zeros((0, 0), np.float32)
+        if self.space == "cosine":
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        self.scale: Optional[np.ndarray] = None  # per-dimension int8 step: x ~= codes * scale
+        if self.quantization == "int8":
+            self.scale = np.abs(matrix).max(axis=0) / 127.0 if len(matrix) else np.ones(matrix.shape[1], np.float32)
+            self.scale[self.scale == 0] = 1.0
+            self.codes = np.round(matrix / self.scale).astype(np.int8)
+        elif self.quantization == "float16":
+            self.codes = matrix.astype(np.float16)
+        else:
+            self.codes = matrix
+        self.matrix = matrix if self.codes is matrix else _spill(name, matrix)
+        logger.info("NumpyRetrievalEngine: exported %s (%d x %d, %s, %s, %.1f MB resident) in %.0f ms",
+                    name, *matrix.shape, self.space, self.quantization, self.resident_bytes() / 2**20,
+                    (time.perf_counter() - t0) * 1000)
+
+    @property
+    def quantized(self) -> bool:
+        return self.codes is not self.matrix
+
+    def resident_bytes(self) -> int:
+        """Heap taken by the vectors (the memory-mapped float32 copy lives in the shared page cache)."""
+        return self.codes.nbytes + self.sq_norms.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def _distance(self, dots: np.ndarray, q: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        if self.space == "cosine":
+            return 1.0 - dots / max(float(np.linalg.norm(q)), 1e-12)
+        if self.space == "ip":
+            return 1.0 - dots
+        return np.maximum(sq_norms - 2.0 * dots + float(q @ q), 0.0)
+
+    def _scan(self, q: np.ndarray) -> np.ndarray:
+        """Dot products of `q` with every row, from the quantized copy when there is one."""
+        if not self.quantized:
+            return self.matrix @ q
+        qs = q * self.scale if self.scale is not None else q  # (codes * scale) . q == codes . (scale * q)
+        dots = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self._SCAN_BLOCK):
+            block = self.codes[start:start + self._SCAN_BLOCK]
+            dots[start:start + len(block)] = block.astype(np.float32) @ qs
+        return dots
+
+    def distances(self, query_vec: List[float]) -> np.ndarray:
+        """Distance to every row (approximate when quantized)."""
+        if not self.ids:
+            return np.zeros(0, dtype=np.float32)
+        q = np.asarray(query_vec, dtype=np.float32)
+        return self._distance(self._scan(q), q, self.sq_norms)
+
+    def search(self, query_vec: List[float], k: int, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        if not self.ids:
+            return []  # an empty export has no dimension to multiply against
+        q = np.asarray(query_vec, dtype=np.float32)
+        dist = self._distance(self._scan(q), q, self.sq_norms)
+        rows = np.arange(len(dist))
+        if filters:
+            rows = np.flatnonzero([_where_matches(meta, filters) for meta in self.metadata])
+            dist = dist[rows]
+        k = min(k, len(dist))
+        if k <= 0:
+            return []
+        n = min(len(dist), k * settings.RETRIEVAL_RESCORE_FACTOR) if self.quantized else k
+        top = np.argpartition(dist, n - 1)[:n]
+        if self.quantized:
+            top = top[np.argsort(rows[top])]  # read the mapped rows in file order
+            exact_rows = rows[top]
+            dist = np.empty_like(dist)
+            dist[top] = self._distance(self.matrix[exact_rows] @ q, q, self.sq_norms[exact_rows])
+        top = top[np.argsort(dist[top], kind="stable")][:k]
+        return [Hit(self.ids[rows[i]], self.texts[rows[i]], self.metadata[rows[i]], math.exp(-float(dist[i])))
+                for i in top]
+
+
+_ENGINE_BACKENDS = {"chroma": RetrievalEngine, "numpy": NumpyRetrievalEngine}
+
+
+def _get_engine(collection_name: str) -> RetrievalEngine:
+    """
+    The cached engine for a collection (opened strictly, like _get_index_for_collection),
+    of the RETRIEVAL_BACKEND class; the numpy backend exports the collection on first use.
+    """
+    engine = __ENGINES.get(collection_name)
+    if engine is None:
+        index = _get_index_for_collection(collection_name)
+        with __INIT_LOCK:
+            engine = __ENGINES.get(collection_name)
+            if engine is None:
+                engine = __ENGINES[collection_name] = _ENGINE_BACKENDS[settings.RETRIEVAL_BACKEND](collection_name, index)
+    return engine
 
-    # Fallback: .text attr
-    txt = getattr(node_obj, "text", None)
-    if isinstance(txt, str):
-        return txt
+# Compact output: one pipe-separated line per hit with only what the agent codes from.
+# Section is implied by the code; "No Device"/"No Qualifier" (Z) print as "-".
+_PCS_COMPACT_FIELDS = ("body_system", "operation", "body_part", "approach", "device", "qualifier")
+_PCS_NONE_VALUES = {"No Device", "No Qualifier", "None", ""}
 
-    return ""
 
-@tool
-def icd10_query(query: str) -> str:
+def _compact_table(header: str, rows: List[List[str]]) -> str:
+    if not rows:
+        return f"{header}\n - (no results)"
+    # Pipes separate fields; newlines separate rows
+    clean = lambda v: " ".join(str(v).replace("|", "/").split())
+    return "\n".join([header] + ["|".join(clean(v) for v in row) for row in rows])
+
+
+def _pcs_value(value: Any) -> str:
+    return "-" if value is None or str(value) in _PCS_NONE_VALUES else str(value)
+
+
+def _cm_description(text: str, code: Optional[str]) -> str:
+    """The title out of an embedded ICD-10-CM document ("<code> — <title>. Chapter ...")."""
+    text = " ".join(text.split())
+    if code and text.startswith(f"{code} — "):
+        text = text[len(code) + 3:]
+    for stop in (". Chapter ", ". Section:", ". Also known as:"):
+        if stop in text:
+            return text.split(stop, 1)[0]
+    return text[:160]
+
+
+def _embed(tool_name: str, query: str) -> List[float]:
+    _init_models()
+    with _tool_stage.time(tool=tool_name, stage="embedding"):
+        if __EMBED_CACHE is None:
+            return Settings.embed_model.get_query_embedding(query)
+        return __EMBED_CACHE.get_or_embed(query, Settings.embed_model.get_query_embedding)
+
+
+def _search(tool_name: str, engine: RetrievalEngine, embedding: List[float], top_k: int) -> List[Hit]:
+    with _tool_stage.time(tool=tool_name, stage="search"):
+        return engine.search(embedding, top_k)
+
+
+def _retrieve(tool_name: str, engine: RetrievalEngine, query: str, top_k: int) -> List[Hit]:
+    """Embed `query` and search `engine`, with the query embedding and the vector search timed apart."""
+    return _search(tool_name, engine, _embed(tool_name, query), top_k)
+
+
+def _icd10_parent_hits(embedding: List[float]) -> List[Hit]:
+    # Parents/top-level collection is optional
+    try:
+        hits = _search("icd10_query", _get_engine(_COLLECTION_NAME_PARENTS), embedding, 3)
+        logger.info("icd10_query: parents retrieval ok; hits=%d", len(hits))
+        return hits
+    except Exception as e:
+        logger.warning("icd10_query: parents retrieval skipped/failed: %s", e)
+        return []
+
+
+# The docstrings of the three retrieval functions are the tool descriptions the agents see.
+# `fmt` ("verbose" | "compact", default TOOL_OUTPUT_FORMAT) picks the output layout; it is for
+# benchmarks/tool_tokens.py and is not part of the tool schema (see _retrieval_tool).
+def _icd10_query(query: str, fmt: Optional[str] = None) -> str:
     """
     Search two ICD-10 collections and return the TEXT content for each hit:
       - Top 3 from parents/top-level collection
@@ -166,63 +523,63 @@ def icd10_query(query: str) -> str:
     logger.info("icd10_query called | query=%r", query)
     t0 = time.perf_counter()
 
-    parents_hits = []
-    main_hits = []
-
-    # Try parents/top-level (optional)
-    try:
-        parents_index = _get_index_for_collection(_COLLECTION_NAME_PARENTS)
-        parents_hits = parents_index.as_retriever(similarity_top_k=3).retrieve(query)
-        logger.info("icd10_query: parents retrieval ok; hits=%d", len(parents_hits))
-    except Exception as e:
-        logger.warning("icd10_query: parents retrieval skipped/failed: %s", e)
+    # Embed once for both collections; search the parents on the side while the main one runs here
+    embedding = _embed("icd10_query", query)
+    parents = _SEARCH_EXECUTOR.submit(contextvars.copy_context().run, _icd10_parent_hits, embedding)
 
     # Main (required)
-    main_index = _get_index_for_collection(_COLLECTION_NAME)
-    main_hits = main_index.as_retriever(similarity_top_k=5).retrieve(query)
+    main_hits = _search("icd10_query", _get_engine(_COLLECTION_NAME), embedding, 5)
     logger.info("icd10_query: main retrieval ok; hits=%d", len(main_hits))
+    parents_hits = parents.result()
 
     dt = (time.perf_counter() - t0) * 1000
     logger.info("icd10_query: total retrieval time %.1f ms", dt)
 
-    # Merge with dedup by metadata['code']
-    merged = []
-    seen_codes = set()
-
-    def _add_hits(hits, label):
-        for n in hits:
-            meta = dict((getattr(n, "metadata", None) or getattr(getattr(n, "node", None), "metadata", None) or {}) )
-            code = meta.get("code") or meta.get("name")
-            if code and code in seen_codes:
-                continue
-            merged.append((label, n, code))
+    with _tool_stage.time(tool="icd10_query", stage="format"):
+        # Merge with dedup by metadata['code']
+        merged = []
+        seen_codes = set()
+
+        def _add_hits(hits, label):
+            for hit in hits:
+                code = hit.metadata.get("code") or hit.metadata.get("name")
+                if code and code in seen_codes:
+                    continue
+                merged.append((label, hit, code))
+                if code:
+                    seen_codes.add(code)
+
+        _add_hits(parents_hits, _COLLECTION_NAME_PARENTS)
+        _add_hits(main_hits, _COLLECTION_NAME)
+
+        if (fmt or settings.TOOL_OUTPUT_FORMAT) == "compact":
+            return _compact_table(
+                "ICD-10-CM candidates (code|description|level):",
+                [[code or "", _cm_description(hit.text, code),
+                  "category" if label == _COLLECTION_NAME_PARENTS else "code"]
+                 for label, hit, code in merged],
+            )
+
+        out: List[str] = ["🔍 Retrieved passages (top 3 parents + top 5 main):"]
+        if not merged:
+            out.append(" - (no results)")
+            return "\n".join(out)
+
+        for i, (label, hit, code) in enumerate(merged, start=1):
+            header_bits = [f"{i:>2}. [{label}]"]
             if code:
-                seen_codes.add(code)
-
-    _add_hits(parents_hits, _COLLECTION_NAME_PARENTS)
-    _add_hits(main_hits, _COLLECTION_NAME)
+                header_bits.append(f"Code: {code}")
+            out.append(" ".join(header_bits))
+            text = hit.text.strip()
+            if text:
+                out.append(text)
+            else:
+                out.append("(no text content found)")
 
-    out: List[str] = ["🔍 Retrieved passages (top 3 parents + top 5 main):"]
-    if not merged:
-        out.append(" - (no results)")
         return "\n".join(out)
 
-    for i, (label, node, code) in enumerate(merged, start=1):
-        header_bits = [f"{i:>2}. [{label}]"]
-        if code:
-            header_bits.append(f"Code: {code}")
-        out.append(" ".join(header_bits))
-        text = _node_text(node).strip()
-        if text:
-            out.append(text)
-        else:
-            out.append("(no text content found)")
-
-    return "\n".join(out)
 
-
-@tool
-def icd10pcs_procedure_query(query: str) -> str:
+def _icd10pcs_procedure_query(query: str, fmt: Optional[str] = None) -> str:
     """
     Retrieve ICD-10-PCS procedure codes from PCS tables using semantic search.
     Returns top candidate full codes with their components.
@@ -230,43 +587,55 @@ def icd10pcs_procedure_query(query: str) -> str:
     logger.info("icd10pcs_procedure_query called | query=%r", query)
     t0 = time.perf_counter()
 
-    index = _get_index_for_collection(_COLLECTION_NAME_PCS)
+    engine = _get_engine(_COLLECTION_NAME_PCS)
 
-    hits = index.as_retriever(similarity_top_k=15).retrieve(query)
+    hits = _retrieve("icd10pcs_procedure_query", engine, query, 15)
 
     dt = (time.perf_counter() - t0) * 1000
     logger.info("PCS retrieval time %.1f ms", dt)
 
-    if not hits:
-        return "❌ No ICD-10-PCS procedure codes found."
-
-    out = ["🧠 ICD-10-PCS candidate procedure codes:\n"]
-
-    seen = set()
-    for i, n in enumerate(hits, start=1):
-        meta = getattr(n.node, "metadata", {}) or {}
-
-        full_code = meta.get("full_code")
-        if not full_code or full_code in seen:
-            continue
-        seen.add(full_code)
-
-        out.append(
-            f"{i}. ✅ Code: {full_code}\n"
-            f"   Section: {meta.get('section')}\n"
-            f"   Body System: {meta.get('body_system')}\n"
-            f"   Operation: {meta.get('operation')}\n"
-            f"   Body Part: {meta.get('body_part')}\n"
-            f"   Approach: {meta.get('approach')}\n"
-            f"   Device: {meta.get('device')}\n"
-            f"   Qualifier: {meta.get('qualifier')}\n"
-        )
+    with _tool_stage.time(tool="icd10pcs_procedure_query", stage="format"):
+        if not hits:
+            return "❌ No ICD-10-PCS procedure codes found."
+
+        if (fmt or settings.TOOL_OUTPUT_FORMAT) == "compact":
+            rows, seen = [], set()
+            for hit in hits:
+                meta = hit.metadata
+                if not meta.get("full_code") or meta["full_code"] in seen:
+                    continue
+                seen.add(meta["full_code"])
+                rows.append([meta["full_code"]] + [_pcs_value(meta.get(k)) for k in _PCS_COMPACT_FIELDS])
+            return _compact_table(
+                f"ICD-10-PCS candidates (code|{'|'.join(_PCS_COMPACT_FIELDS)}; - = none):", rows
+            )
+
+        out = ["🧠 ICD-10-PCS candidate procedure codes:\n"]
+
+        seen = set()
+        for i, hit in enumerate(hits, start=1):
+            meta = hit.metadata
+
+            full_code = meta.get("full_code")
+            if not full_code or full_code in seen:
+                continue
+            seen.add(full_code)
+
+            out.append(
+                f"{i}. ✅ Code: {full_code}\n"
+                f"   Section: {meta.get('section')}\n"
+                f"   Body System: {meta.get('body_system')}\n"
+                f"   Operation: {meta.get('operation')}\n"
+                f"   Body Part: {meta.get('body_part')}\n"
+                f"   Approach: {meta.get('approach')}\n"
+                f"   Device: {meta.get('device')}\n"
+                f"   Qualifier: {meta.get('qualifier')}\n"
+            )
 
-    return "\n".join(out)
+        return "\n".join(out)
 
 
-@tool
-def icd10pcs_guidelines_query(query: str) -> str:
+def _icd10pcs_guidelines_query(query: str, fmt: Optional[str] = None) -> str:
     """
     Retrieve passages from the ICD-10-PCS Official Guidelines collection.
     Returns top 5 snippets with marker/title when available.
@@ -275,26 +644,209 @@ def icd10pcs_guidelines_query(query: str) -> str:
     t0 = time.perf_counter()
 
     try:
-        index = _get_index_for_collection(_COLLECTION_NAME_PCS_GUIDELINES)
+        engine = _get_engine(_COLLECTION_NAME_PCS_GUIDELINES)
     except Exception as e:
         logger.warning("Guidelines collection not available: %s", e)
         return "❌ Guidelines collection not found. Run embeddings/guidelines_to_chroma.py first."
 
-    hits = index.as_retriever(similarity_top_k=5).retrieve(query)
+    hits = _retrieve("icd10pcs_guidelines_query", engine, query, 5)
     dt = (time.perf_counter() - t0) * 1000
     logger.info("Guidelines retrieval time %.1f ms", dt)
 
-    if not hits:
-        return "(no guideline passages found)"
-
-    out = ["📘 ICD-10-PCS Guidelines hits:"]
-    for i, n in enumerate(hits, start=1):
-        meta = getattr(n.node, "metadata", {}) or {}
-        marker = meta.get("marker") or ""
-        title = meta.get("title") or ""
-        header = f"{i}. {marker} — {title}".strip(" —")
-        out.append(header)
-        text = _node_text(n).strip()
-        if text:
-            out.append(text)
-    return "\n".join(out)
\ No newline at end of file
+    with _tool_stage.time(tool="icd10pcs_guidelines_query", stage="format"):
+        if not hits:
+            return "(no guideline passages found)"
+
+        if (fmt or settings.TOOL_OUTPUT_FORMAT) == "compact":
+            return _compact_table(
+                "ICD-10-PCS guidelines (marker|title|text):",
+                [[hit.metadata.get("marker") or "", hit.metadata.get("title") or "", hit.text] for hit in hits],
+            )
+
+        out = ["📘 ICD-10-PCS Guidelines hits:"]
+        for i, hit in enumerate(hits, start=1):
+            meta = hit.metadata
+            marker = meta.get("marker") or ""
+            title = meta.get("title") or ""
+            header = f"{i}. {marker} — {title}".strip(" —")
+            out.append(header)
+            text = hit.text.strip()
+            if text:
+                out.append(text)
+        return "\n".join(out)
+
+
+_COLLECTIONS = (
+    _COLLECTION_NAME,
+    _COLLECTION_NAME_PARENTS,
+    _COLLECTION_NAME_PCS,
+    _COLLECTION_NAME_PCS_GUIDELINES,
+)
+
+
+def warm_up(query: str = "warm-up") -> Dict[str, float]:
+    """
+    Load the models, open every collection and run one dummy embedding plus one dummy
+    retrieval per collection, so the first real tool call pays none of it.
+    Returns a timing breakdown in ms; a missing required collection raises.
+    """
+    timings: Dict[str, float] = {}
+
+    def _timed(label, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        timings[label] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    _timed("models", _init_models)
+    _timed("chroma_client", _get_chroma_client)
+    embedding = _timed("embed_query", Settings.embed_model.get_query_embedding, query)
+    for name in _COLLECTIONS:
+        try:
+            engine = _timed(f"open:{name}", _get_engine, name)
+            _timed(f"retrieve:{name}", engine.search, embedding, 1)
+        except Exception as e:
+            if name == _COLLECTION_NAME:
+                raise
+            # Same policy as the tools: parents and guidelines are optional
+            logger.warning("warm_up: optional collection %s unavailable: %s", name, e)
+    return timings
+
+
+async def _run_in_retrieval_executor(func, *args):
+    """Run a blocking retrieval function on the bounded retrieval pool."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_RETRIEVAL_EXECUTOR, functools.partial(ctx.run, func, *args))
+
+
+# ------------ Speculative prefetch (RETRIEVAL_PREFETCH) ------------
+# The supervisor spends a whole model turn deciding to delegate before any subagent searches.
+# `prefetching(message)` starts the CM and PCS retrievals for the raw message on the retrieval
+# pool meanwhile; the tools serve a matching query from those results instead of searching again.
+_PREFETCH_TOOLS = ("icd10_query", "icd10pcs_procedure_query")
+_prefetch_lookups = counter(
+    "retrieval_prefetch_total", "Retrieval tool calls by prefetch outcome (hit, miss) and prefetches never used",
+    ["tool", "result"],
+)
+
+
+def _query_words(query: str) -> frozenset:
+    return frozenset(re.findall(r"\w+", normalize_message(query)))
+
+
+class RetrievalPrefetch:
+    """Retrieval results started for one request's message, keyed by tool name."""
+
+    def __init__(self, query: str, futures: Dict[str, Future]):
+        self.query = query
+        self.words = _query_words(query)
+        self.futures = futures
+        self.used: set = set()
+
+    def match(self, tool_name: str, query: str) -> Optional[Future]:
+        """
+        The prefetched result when `query` is the same search, give or take case, punctuation and
+        a few words. The caller counts the hit once the result turns out usable.
+        """
+        fut = self.futures.get(tool_name)
+        if fut is None:
+            return None
+        words = _query_words(query)
+        overlap = len(words & self.words) / len(words | self.words) if words | self.words else 1.0
+        if overlap < settings.RETRIEVAL_PREFETCH_MIN_OVERLAP or fut.cancelled():
+            _prefetch_lookups.inc(tool=tool_name, result="miss")
+            return None
+        self.used.add(tool_name)
+        return fut
+
+    def close(self) -> None:
+        for tool_name, fut in self.futures.items():
+            if tool_name not in self.used:
+                fut.cancel()  # still queued behind real tool calls: drop it
+                _prefetch_lookups.inc(tool=tool_name, result="unused")
+
+
+_PREFETCH: contextvars.ContextVar[Optional[RetrievalPrefetch]] = contextvars.ContextVar("retrieval_prefetch", default=None)
+
+
+@contextmanager
+def prefetching(message: str) -> Iterator[Optional[RetrievalPrefetch]]:
+    """
+    Start the prefetch retrievals for `message` and serve matching tool calls made inside the block
+    (on any thread or task that inherits this context) from them. A no-op unless RETRIEVAL_PREFETCH is on.
+    """
+    if not settings.RETRIEVAL_PREFETCH:
+        yield None
+        return
+    funcs = {"icd10_query": _icd10_query, "icd10pcs_procedure_query": _icd10pcs_procedure_query}
+    prefetch = RetrievalPrefetch(message, {
+        name: _RETRIEVAL_EXECUTOR.submit(contextvars.copy_context().run, funcs[name], message)
+        for name in _PREFETCH_TOOLS
+    })
+    token = _PREFETCH.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _PREFETCH.reset(token)
+        prefetch.close()
+
+
+def _prefetched(name: str, query: str) -> Optional[Future]:
+    prefetch = _PREFETCH.get()
+    return prefetch.match(name, query) if prefetch is not None else None
+
+
+def _retrieval_tool(name: str, func) -> StructuredTool:
+    """
+    Expose a retrieval function as a tool with both sync and async entry points. The schema is
+    built from `_run` (just `query`), never from `func`, whose extra `fmt` parameter is internal.
+    """
+    def _search(query: str) -> str:
+        with _tool_latency.time(tool=name):
+            return fit_tool_output(name, func(query))
+
+    def _served(result: str, started: float) -> str:
+        output = fit_tool_output(name, result)
+        _prefetch_lookups.inc(tool=name, result="hit")
+        _tool_latency.observe(time.perf_counter() - started, tool=name)
+        return output
+
+    def _prefetch_failed() -> None:
+        # Speculative work must never fail a call that would have worked: search again
+        _prefetch_lookups.inc(tool=name, result="miss")
+        logger.warning("Prefetched %s search failed; running it again", name, exc_info=True)
+
+    def _run(query: str) -> str:
+        prefetched = _prefetched(name, query)
+        if prefetched is not None:
+            started = time.perf_counter()
+            try:
+                return _served(prefetched.result(), started)
+            except Exception:
+                _prefetch_failed()
+        return _search(query)
+
+    async def _arun(query: str) -> str:
+        prefetched = _prefetched(name, query)
+        if prefetched is not None:
+            started = time.perf_counter()
+            try:
+                # awaited here, not on the pool: a worker blocked on it could starve the prefetch itself
+                return _served(await asyncio.wrap_future(prefetched), started)
+            except Exception:
+                _prefetch_failed()
+        submitted = time.perf_counter()
+
+        def _timed(q: str) -> str:
+            _tool_stage.observe(time.perf_counter() - submitted, tool=name, stage="queue_wait")
+            return _search(q)
+
+        return await _run_in_retrieval_executor(_timed, query)
+
+    return StructuredTool.from_function(func=_run, coroutine=_arun, name=name, description=inspect.getdoc(func))
+
+
+icd10_query = _retrieval_tool("icd10_query", _icd10_query)
+icd10pcs_procedure_query = _retrieval_tool("icd10pcs_procedure_query", _icd10pcs_procedure_query)
+icd10pcs_guidelines_query = _retrieval_tool("icd10pcs_guidelines_query", _icd10pcs_guidelines_query)
@@ -0,0 +1,169 @@
+# src/usage.py
+
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from app.config import settings
+from src.metrics import counter, histogram
+
+_request_tokens = histogram(
+    "agent_request_tokens", "Model tokens used by one request (all agents and turns)", ["direction"],
+    buckets=(500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000),
+)
+_budget_exceeded = counter("agent_token_budget_exceeded_total", "Runs stopped by a token budget", ["scope"])
+_tool_tokens = counter("tool_output_tokens_total", "Estimated tokens of tool results handed to the model", ["tool"])
+_truncations = counter("tool_output_truncations_total", "Tool results cut to fit the token budget", ["tool"])
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token, the same heuristic the rate limiter reserves with."""
+    return len(text) // 4
+
+
+class TokenBudgetExceeded(Exception):
+    """The next model call would take the request or thread past its token budget."""
+
+    def __init__(self, scope: str, budget: int, used: int):
+        super().__init__(f"{scope} token budget of {budget} would be exceeded ({used} already used)")
+        self.scope = scope
+        self.budget = budget
+        self.used = used
+
+
+class TokenLedger:
+    """
+    Tokens used by one request, per agent and per tool, with the request and thread budgets it
+    runs under (0 = unlimited). `thread_before` is what earlier requests on the thread spent.
+    """
+
+    def __init__(self, request_budget: int = 0, thread_budget: int = 0, thread_before: int = 0):
+        self.request_budget = request_budget
+        self.thread_budget = thread_budget
+        self.thread_before = thread_before
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self.by_agent: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "input": 0, "output": 0})
+        self.tool_tokens: Dict[str, int] = defaultdict(int)
+        self.truncated = 0
+
+    @property
+    def total(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def remaining(self) -> Optional[int]:
+        """Tokens left under the tighter of the two budgets, or None when neither is set."""
+        left = []
+        if self.request_budget:
+            left.append(self.request_budget - self.total)
+        if self.thread_budget:
+            left.append(self.thread_budget - self.thread_before - self.total)
+        return min(left) if left else None
+
+    def check(self, estimate: int = 0) -> None:
+        """Raise before a call of ~`estimate` prompt tokens that would overrun a budget."""
+        if self.request_budget and self.total + estimate > self.request_budget:
+            self._exceeded("request", self.request_budget, self.total)
+        if self.thread_budget and self.thread_before + self.total + estimate > self.thread_budget:
+            self._exceeded("thread", self.thread_budget, self.thread_before + self.total)
+
+    def record_call(self, agent: str, input_tokens: int, output_tokens: int) -> None:
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        entry = self.by_agent[agent]
+        entry["calls"] += 1
+        entry["input"] += input_tokens
+        entry["output"] += output_tokens
+
+    def record_tool(self, tool: str, tokens: int, truncated: bool) -> None:
+        self.tool_tokens[tool] += tokens
+        self.truncated += truncated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total,
+            "by_agent": dict(self.by_agent),
+            "tool_output_tokens": dict(self.tool_tokens),
+            "truncated_tool_outputs": self.truncated,
+        }
+
+    @staticmethod
+    def _exceeded(scope: str, budget: int, used: int) -> None:
+        _budget_exceeded.inc(scope=scope)
+        raise TokenBudgetExceeded(scope, budget, used)
+
+
+_CURRENT: contextvars.ContextVar[Optional[TokenLedger]] = contextvars.ContextVar("token_ledger", default=None)
+
+
+def current_ledger() -> Optional[TokenLedger]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def metered(thread_before: int = 0) -> Iterator[TokenLedger]:
+    """
+    Collect the token usage of everything run inside the block (model calls of every agent,
+    on any thread or task that inherits this context) into a new ledger under the configured budgets.
+    """
+    ledger = TokenLedger(settings.TOKEN_BUDGET_PER_REQUEST, settings.TOKEN_BUDGET_PER_THREAD, thread_before)
+    token = _CURRENT.set(ledger)
+    try:
+        yield ledger
+    finally:
+        try:
+            _CURRENT.reset(token)
+        except ValueError:
+            pass  # an async generator closed from another context; that context never saw the ledger
+        _request_tokens.observe(ledger.input_tokens, direction="input")
+        _request_tokens.observe(ledger.output_tokens, direction="output")
+
+
+def merge_usage(before: Optional[Dict[str, Any]], ledger: TokenLedger) -> Dict[str, Any]:
+    """A thread's running totals after one more request."""
+    totals = dict(before or {"requests": 0, "calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0})
+    totals["requests"] += 1
+    for key, value in (("calls", ledger.calls), ("input_tokens", ledger.input_tokens),
+                       ("output_tokens", ledger.output_tokens), ("total_tokens", ledger.total)):
+        totals[key] += value
+    return totals
+
+
+def fit_tool_output(tool: str, text: str) -> str:
+    """
+    Cut a tool result at a line boundary when it is longer than TOOL_OUTPUT_MAX_TOKENS, or than
+    TOOL_OUTPUT_BUDGET_SHARE of what is left of the current budget: every later turn of the
+    agent re-sends it. Records the (possibly cut) size in the current ledger.
+    """
+    ledger = current_ledger()
+    limits = [settings.TOOL_OUTPUT_MAX_TOKENS] if settings.TOOL_OUTPUT_MAX_TOKENS else []
+    remaining = ledger.remaining() if ledger is not None else None
+    if remaining is not None:
+        limits.append(max(0, int(remaining * settings.TOOL_OUTPUT_BUDGET_SHARE)))
+    tokens = estimate_tokens(text)
+    truncated = bool(limits) and tokens > min(limits)
+    if truncated:
+        text = _cut(text, min(limits) * 4)
+        tokens = estimate_tokens(text)
+        _truncations.inc(tool=tool)
+    _tool_tokens.inc(tokens, tool=tool)
+    if ledger is not None:
+        ledger.record_tool(tool, tokens, truncated)
+    return text
+
+
+def _cut(text: str, max_chars: int) -> str:
+    lines = text.splitlines()
+    kept, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept) + f"\n… [truncated: {len(lines) - len(kept)} of {len(lines)} lines omitted to fit the token budget]"
@@ -12,7 +12,7 @@ from test_cases import TEST_CASES
 # Adicionar o diretório raiz ao path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.llms import GoogleGenAILLM
+from src.llms import make_llm
 from src.models.agent_model import AgentManager
 import logging
 
@@ -85,7 +85,7 @@ print("="*70)
 
 # Inicializar o modelo
 print("\n[1/3] Inicializando o modelo...")
-llm = GoogleGenAILLM(model_name="gemini-2.5-flash", temperature=0.0)
+llm = make_llm(model_name="gemini-2.5-flash", temperature=0.0)  # LLM_PROVIDER=scripted: offline dry run
 agent_manager = AgentManager(llm=llm)
 print("✓ Modelo inicializado com sucesso")
 
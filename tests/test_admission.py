@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from src.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs) -> AdmissionController:
+    kwargs = {"max_concurrency": 2, "per_client": 2, "batch_max_concurrency": 1, "queue_size": 2,
+              "max_wait_seconds": 0.05, **kwargs}
+    return AdmissionController(**kwargs)
+
+
+def test_slots_are_released_after_the_body():
+    async def scenario():
+        admission = _controller()
+        async with admission.slot("interactive", "a"):
+            assert admission.stats()["interactive"]["active"] == 1
+        assert admission.stats()["interactive"]["active"] == 0
+        assert admission._active == 0
+
+    asyncio.run(scenario())
+
+
+def test_waiter_times_out_with_retry_after():
+    async def scenario():
+        admission = _controller(max_concurrency=1)
+        await admission.acquire("interactive", "a")
+        with pytest.raises(AdmissionRejected) as e:
+            await admission.acquire("interactive", "b")
+        assert e.value.reason == "wait_timeout" and e.value.retry_after >= 1
+        assert admission.stats()["interactive"]["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_shed_immediately():
+    async def scenario():
+        admission = _controller(max_concurrency=1, queue_size=1, max_wait_seconds=5)
+        await admission.acquire("interactive", "a")
+        waiter = asyncio.ensure_future(admission.acquire("interactive", "b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await admission.acquire("interactive", "c")
+        assert e.value.reason == "queue_full"
+        admission.release("interactive", "a")
+        await waiter  # the queued request gets the freed slot
+        assert admission._by_client == {"b": 1}
+
+    asyncio.run(scenario())
+
+
+def test_interactive_waiters_go_before_batch_and_batch_is_capped():
+    async def scenario():
+        admission = _controller(max_wait_seconds=5)
+        await admission.acquire("batch", "jobs")
+        probe = asyncio.ensure_future(admission.acquire("batch", "jobs2"))
+        await asyncio.sleep(0.01)
+        assert not probe.done()  # the batch lane holds at most one slot
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        await admission.acquire("interactive", "a")  # global cap reached
+        order = []
+
+        async def wait(lane, client):
+            await admission.acquire(lane, client, patient=True)
+            order.append(lane)
+
+        batch = asyncio.ensure_future(wait("batch", "jobs3"))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(wait("interactive", "b"))
+        await asyncio.sleep(0)
+        admission.release("batch", "jobs")
+        await interactive
+        assert order == ["interactive"]
+        admission.release("interactive", "a")
+        await batch
+        assert order == ["interactive", "batch"]
+
+    asyncio.run(scenario())
+
+
+def test_per_client_cap():
+    async def scenario():
+        admission = _controller(max_concurrency=4, per_client=1)
+        await admission.acquire("interactive", "a")
+        await admission.acquire("interactive", "b")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("interactive", "a")
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def scenario():
+        admission = _controller(max_concurrency=1, max_wait_seconds=5)
+        await admission.acquire("interactive", "a")
+        waiter = asyncio.ensure_future(admission.acquire("interactive", "b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        admission.release("interactive", "a")
+        assert admission._active == 0
+        assert admission.stats()["interactive"]["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+class _FakeManager:
+    """Answers repeated messages from a cache; runs the 'agent' (holding `admit()`) otherwise."""
+
+    def __init__(self):
+        self.cache, self.runs, self.release = {}, 0, asyncio.Event()
+
+    async def achat(self, user_message, thread_id=None, use_cache=True, admit=None):
+        if use_cache and user_message in self.cache:
+            return {**self.cache[user_message], "cache": "hit"}
+        async with admit():
+            self.runs += 1
+            await self.release.wait()
+        result = {"status": "completed", "thread_id": "leader", "answer": user_message, "cache": "miss"}
+        self.cache[user_message] = result
+        return result
+
+    async def afork_thread(self, user_message, result):
+        return {**result, "thread_id": "fork"}
+
+
+def test_only_agent_runs_hold_admission_slots(monkeypatch):
+    from src import main
+
+    async def scenario():
+        admission, manager = _controller(max_concurrency=1, per_client=1, queue_size=0), _FakeManager()
+        monkeypatch.setattr(main, "get_agent_manager", lambda: manager)
+
+        def admit():
+            return admission.slot("interactive", "a")
+
+        requests = [asyncio.ensure_future(main.achat("same note", admit=admit)) for _ in range(5)]
+        while manager.runs == 0:
+            await asyncio.sleep(0)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert admission.stats()["interactive"]["active"] == 1  # the leader only; followers wait slot-free
+        manager.release.set()
+        results = await asyncio.gather(*requests)
+        assert manager.runs == 1
+        assert sorted(bool(r.get("coalesced")) for r in results) == [False] + [True] * 4
+        await admission.acquire("interactive", "b")  # the only slot is busy: admit() would be shed
+        hit = await main.achat("same note", admit=admit)
+        assert hit["cache"] == "hit"
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from src.batch import AsyncRateLimiter, run_batch
+
+
+async def _collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_run_batch_bounds_concurrency_and_reports_every_item():
+    in_flight, peak = 0, 0
+
+    async def run(message):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if message == "bad":
+            raise ValueError("boom")
+        return {"thread_id": f"t-{message}", "answer": message.upper()}
+
+    items = asyncio.run(_collect(run_batch(run, ["a", "bad", "c", "d", "e"], concurrency=2)))
+    assert peak == 2
+    assert sorted(i["index"] for i in items) == [0, 1, 2, 3, 4]
+    by_index = {i["index"]: i for i in items}
+    assert by_index[1]["status"] == "failed" and by_index[1]["error"] == "boom"
+    assert by_index[2]["status"] == "completed" and by_index[2]["answer"] == "C"
+    assert all("latency_ms" in i for i in items)
+
+
+def test_closing_the_stream_cancels_remaining_work():
+    started = []
+
+    async def run(message):
+        started.append(message)
+        await asyncio.sleep(0 if message == "0" else 10)
+        return {}
+
+    async def scenario():
+        stream = run_batch(run, [str(i) for i in range(10)], concurrency=2)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    t0 = time.perf_counter()
+    assert asyncio.run(scenario())["index"] == 0
+    assert time.perf_counter() - t0 < 5
+    assert len(started) <= 3
+
+
+def test_rate_limiter_spaces_starts_after_the_burst():
+    async def scenario():
+        limiter = AsyncRateLimiter(rate=50, burst=2)
+        return [await limiter.acquire() for _ in range(4)]
+
+    waits = asyncio.run(scenario())
+    assert waits[:2] == [0.0, 0.0]
+    assert all(w > 0 for w in waits[2:])
+
+
+def test_rate_limiter_disabled_at_zero_rate():
+    assert asyncio.run(AsyncRateLimiter(rate=0).acquire()) == 0.0
@@ -0,0 +1,55 @@
+import time
+
+from src.cache import ResponseCache, normalize_message, source_fingerprint
+
+
+def test_normalize_message_ignores_case_width_and_spacing():
+    assert normalize_message("  Acute \t MI ") == normalize_message("acute mi")
+    assert normalize_message("ＡＢＣ  def") == "abc def"
+
+
+def test_keys_match_for_equivalent_messages():
+    cache = ResponseCache(lambda: "fp", ttl_seconds=60, max_entries=10)
+    assert cache.key("Type 2 Diabetes") == cache.key("type 2   diabetes")
+    assert cache.key("type 2 diabetes") != cache.key("type 1 diabetes")
+
+
+def test_lru_and_ttl():
+    cache = ResponseCache(lambda: "fp", ttl_seconds=60, max_entries=2)
+    for m in ("a", "b", "c"):
+        cache.put(cache.key(m), {"answer": m})
+    assert cache.get(cache.key("a")) is None
+    assert cache.get(cache.key("c")) == {"answer": "c"}
+
+    cache = ResponseCache(lambda: "fp", ttl_seconds=0.05, max_entries=2)
+    cache.put(cache.key("a"), {"answer": "a"})
+    time.sleep(0.1)
+    assert cache.get(cache.key("a")) is None
+
+
+def test_fingerprint_change_invalidates_both_tiers(tmp_path):
+    fp = ["v1"]
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(lambda: fp[0], ttl_seconds=60, max_entries=10, path=path)
+    cache.put(cache.key("a"), {"answer": "a"})
+    fp[0] = "v2"
+    assert cache.get(cache.key("a")) is None
+    assert cache.stats() == {"entries": 0, "disk_entries": 0}
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    writer = ResponseCache(lambda: "fp", ttl_seconds=60, max_entries=10, path=path)
+    writer.put(writer.key("a"), {"answer": "a"})
+    reader = ResponseCache(lambda: "fp", ttl_seconds=60, max_entries=10, path=path)
+    assert reader.get(reader.key("a")) == {"answer": "a"}
+
+
+def test_source_fingerprint_tracks_file_changes(tmp_path):
+    prompts = tmp_path / "prompts.py"
+    prompts.write_text("A = 1")
+    fingerprint = source_fingerprint(["model"], [str(prompts)])
+    before = fingerprint()
+    assert fingerprint() == before
+    prompts.write_text("A = 22")
+    assert fingerprint() != before
@@ -0,0 +1,76 @@
+from src.embed_cache import EmbeddingCache, normalize_query
+
+
+class _CountingEmbed:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, query):
+        self.calls.append(query)
+        return [float(len(self.calls)), 0.5, -1.0]
+
+
+def test_normalize_query_ignores_case_whitespace_and_punctuation():
+    assert normalize_query("  What is   HbA1c?? ") == normalize_query("what is hba1c")
+
+
+def test_equivalent_queries_share_one_embedding():
+    cache, embed = EmbeddingCache("m", max_entries=4), _CountingEmbed()
+    first = cache.get_or_embed("Chest pain?", embed)
+    assert cache.get_or_embed("chest   PAIN", embed) == first
+    assert embed.calls == ["Chest pain?"]
+    assert cache.stats() == {"entries": 1, "disk_entries": 0, "bytes": 4 * 3 * 4}
+
+
+def test_keys_are_per_model():
+    assert EmbeddingCache("a", 4).key("q") != EmbeddingCache("b", 4).key("q")
+
+
+def test_lru_reuses_the_least_recently_used_row():
+    cache, embed = EmbeddingCache("m", max_entries=2), _CountingEmbed()
+    cache.get_or_embed("a", embed)
+    cache.get_or_embed("b", embed)
+    cache.get_or_embed("a", embed)  # "b" is now least recently used
+    cache.get_or_embed("c", embed)
+    assert cache.stats()["entries"] == 2
+    cache.get_or_embed("a", embed)
+    assert embed.calls == ["a", "b", "c"]
+    cache.get_or_embed("b", embed)
+    assert embed.calls == ["a", "b", "c", "b"]
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "embed.sqlite")
+    embed = _CountingEmbed()
+    vector = EmbeddingCache("m", max_entries=2, path=path).get_or_embed("q", embed)
+    warm = EmbeddingCache("m", max_entries=2, path=path)
+    assert warm.get_or_embed("Q!", embed) == vector
+    assert embed.calls == ["q"]
+    assert warm.stats()["entries"] == 1
+
+
+def test_disk_tier_is_capped(tmp_path):
+    cache = EmbeddingCache("m", max_entries=2, path=str(tmp_path / "e.sqlite"), max_disk_entries=10)
+    embed = _CountingEmbed()
+    for i in range(64):
+        cache.get_or_embed(f"query {i}", embed)
+    assert cache.stats()["disk_entries"] == 10
+
+
+def test_clear_drops_both_tiers(tmp_path):
+    cache, embed = EmbeddingCache("m", max_entries=2, path=str(tmp_path / "e.sqlite")), _CountingEmbed()
+    cache.get_or_embed("q", embed)
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and cache.stats()["disk_entries"] == 0
+    cache.get_or_embed("q", embed)
+    assert embed.calls == ["q", "q"]
+
+
+def test_miss_and_hit_return_the_same_vector(tmp_path):
+    def embed(query):
+        return [0.1, 1 / 3, 2 / 7]  # not representable in float32
+
+    cache = EmbeddingCache("m", max_entries=2, path=str(tmp_path / "e.sqlite"))
+    miss = cache.get_or_embed("q", embed)
+    assert cache.get_or_embed("q", embed) == miss
+    assert EmbeddingCache("m", max_entries=2, path=str(tmp_path / "e.sqlite")).get_or_embed("q", embed) == miss
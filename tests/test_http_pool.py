@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from src import http_pool
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    srv.daemon_threads = True
+    srv.connections = 0
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+
+
+def _url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def test_short_lived_httpx_clients_share_one_connection(server):
+    name = "test-httpx-sync"
+    for _ in range(5):
+        with httpx.Client(**http_pool.httpx_client_args(name)) as client:  # closing must not drop the pool
+            assert client.get(_url(server)).text == "ok"
+    assert server.connections == 1
+    assert http_pool.pool_stats()[name] == {"requests": 5, "connections_opened": 1, "http2": False}
+
+
+def test_async_clients_share_the_pool_of_their_event_loop(server):
+    name = "test-httpx-async"
+
+    async def scenario():
+        for _ in range(5):
+            async with httpx.AsyncClient(**http_pool.httpx_client_args(name)) as client:
+                assert (await client.get(_url(server))).text == "ok"
+        await http_pool.pooled_transport(name).shutdown()
+
+    asyncio.run(scenario())
+    assert server.connections == 1
+
+
+def test_requests_sessions_share_one_adapter(server):
+    name = "test-requests"
+    for _ in range(5):
+        assert http_pool.requests_session(name).get(_url(server)).text == "ok"
+    assert server.connections == 1
+    assert http_pool.pool_stats()[name]["requests"] == 5
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from src.jobs import InProcessJobQueue, JobWorkerPool, RedisJobQueue
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def _redis_queue(**kwargs) -> RedisJobQueue:
+    return RedisJobQueue(fakeredis.FakeAsyncRedis(decode_responses=True), **kwargs)
+
+
+def _record(job_id: str, status: str = "queued") -> dict:
+    return {"job_id": job_id, "status": status, "message": "m", "thread_id": None,
+            "submitted_at": 0.0, "started_at": None, "finished_at": None, "result": None, "error": None}
+
+
+async def _wait_for_status(queue, job_id: str, status: str, timeout: float = 5.0) -> dict:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        record = await queue.get(job_id)
+        if record and record["status"] == status:
+            return record
+        assert asyncio.get_running_loop().time() < deadline, record
+        await asyncio.sleep(0.01)
+
+
+def test_redis_records_expire_only_once_finished():
+    async def scenario():
+        queue = _redis_queue(result_ttl_seconds=60)
+        await queue.put(_record("a"))
+        assert await queue.client.ttl(queue._key("a")) == -1  # waiting jobs never expire
+        await queue.save(_record("a", "running"))
+        assert await queue.client.ttl(queue._key("a")) == -1
+        await queue.save(_record("a", "completed"))
+        assert 0 < await queue.client.ttl(queue._key("a")) <= 60
+
+    asyncio.run(scenario())
+
+
+def test_redis_orphaned_job_is_requeued():
+    async def scenario():
+        queue = _redis_queue()
+        await queue.put(_record("a"))
+        assert await queue.next(1) == "a"
+        await queue.save(_record("a", "running"))
+        assert await queue.requeue_orphans() == 0  # lease still held
+
+        await queue.client.delete(queue._lease_key("a"))  # the worker died
+        assert await queue.requeue_orphans() == 0  # first sweep without a lease only marks it
+        assert await queue.requeue_orphans() == 1
+        assert (await queue.get("a"))["status"] == "queued"
+        assert await queue.depth() == 1
+        assert await queue.next(1) == "a"
+
+    asyncio.run(scenario())
+
+
+def test_redis_acked_job_is_not_requeued():
+    async def scenario():
+        queue = _redis_queue()
+        await queue.put(_record("a"))
+        await queue.next(1)
+        await queue.ack("a")
+        assert await queue.client.llen(queue._processing_key) == 0
+        assert await queue.requeue_orphans() == 0
+        assert await queue.requeue_orphans() == 0
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("make_queue", [InProcessJobQueue, _redis_queue])
+def test_pool_completes_jobs(make_queue):
+    async def run(message, thread_id):
+        return {"response": message.upper(), "thread_id": "t1"}
+
+    async def scenario():
+        pool = JobWorkerPool(make_queue(), run, workers=2, poll_seconds=1)
+        pool.start()
+        record = await pool.submit("hello")
+        done = await _wait_for_status(pool.queue, record["job_id"], "completed")
+        assert done["result"]["response"] == "HELLO"
+        assert done["thread_id"] == "t1"
+        assert done["finished_at"] >= done["started_at"]
+        if isinstance(pool.queue, RedisJobQueue):
+            assert await pool.queue.client.llen(pool.queue._processing_key) == 0
+        await pool.stop()
+
+    asyncio.run(scenario())
+
+
+def _stop_while_running(queue):
+    started = asyncio.Event()
+
+    async def run(message, thread_id):
+        started.set()
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        pool = JobWorkerPool(queue, run, workers=1, poll_seconds=1)
+        pool.start()
+        record = await pool.submit("slow")
+        await asyncio.wait_for(started.wait(), 5)
+        await pool.stop()
+        return await queue.get(record["job_id"])
+
+    return asyncio.run(scenario())
+
+
+def test_pool_stop_marks_in_process_job_cancelled():
+    cancelled = _stop_while_running(InProcessJobQueue())
+    assert cancelled["status"] == "cancelled"
+    assert cancelled["finished_at"] is not None
+
+
+def test_pool_stop_requeues_redis_job():
+    queue = _redis_queue()
+    requeued = _stop_while_running(queue)
+    assert requeued["status"] == "queued"
+    assert requeued["started_at"] is None and requeued["finished_at"] is None
+
+    async def check():
+        assert await queue.client.lrange(queue._queue_key, 0, -1) == [requeued["job_id"]]
+        assert await queue.client.llen(queue._processing_key) == 0
+        assert await queue.client.ttl(queue._key(requeued["job_id"])) == -1
+
+    asyncio.run(check())
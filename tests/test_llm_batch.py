@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.llms import LLM
+from src.ratelimit import TokenBucketLimiter
+from src.usage import current_ledger, metered
+
+
+class _EchoLLM(LLM):
+    def __init__(self):
+        super().__init__("echo", rate_limiter=TokenBucketLimiter(0, 0))
+        self.in_flight = 0
+        self.peak = 0
+        self.ledgers = []
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        self.ledgers.append(current_ledger())
+        time.sleep(0.02)
+        with self._lock:
+            self.in_flight -= 1
+        if messages == ["bad"]:
+            raise ValueError("boom")
+        return {"echo": messages}
+
+
+def test_batch_keeps_order_and_bounds_concurrency():
+    llm = _EchoLLM()
+    inputs = [[str(i)] for i in range(6)]
+    assert llm.batch(inputs, max_concurrency=2) == [{"echo": m} for m in inputs]
+    assert llm.peak == 2
+
+
+def test_batch_propagates_the_callers_context():
+    llm = _EchoLLM()
+    with metered() as ledger:
+        llm.batch([["a"], ["b"]], max_concurrency=2)
+    assert llm.ledgers == [ledger, ledger]
+
+
+def test_batch_errors_raise_or_are_returned():
+    llm = _EchoLLM()
+    with pytest.raises(ValueError):
+        llm.batch([["ok"], ["bad"]], max_concurrency=2)
+    results = llm.batch([["ok"], ["bad"]], max_concurrency=2, return_exceptions=True)
+    assert results[0] == {"echo": ["ok"]} and isinstance(results[1], ValueError)
+
+
+def test_abatch_bounds_concurrency():
+    llm = _EchoLLM()
+    inputs = [[str(i)] for i in range(6)]
+    assert asyncio.run(llm.abatch(inputs, max_concurrency=3)) == [{"echo": m} for m in inputs]
+    assert llm.peak == 3
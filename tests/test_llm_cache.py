@@ -0,0 +1,58 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.llms import GuardedChatModel, SqliteLLMCache
+
+
+class _CountingModel(BaseChatModel):
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(f"answer {self.calls}"))])
+
+
+def _prompt(message_id: str) -> str:
+    return dumps([HumanMessage("hi", id=message_id)])
+
+
+def test_key_ignores_message_ids_but_not_the_model():
+    assert SqliteLLMCache.key(_prompt("a"), "m1") == SqliteLLMCache.key(_prompt("b"), "m1")
+    assert SqliteLLMCache.key(_prompt("a"), "m1") != SqliteLLMCache.key(_prompt("a"), "m2")
+
+
+def test_generations_round_trip_across_instances(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    generations = [ChatGeneration(message=AIMessage("cached"))]
+    SqliteLLMCache(path, max_bytes=1 << 20).update(_prompt("a"), "m", generations)
+    cache = SqliteLLMCache(path, max_bytes=1 << 20)
+    assert cache.lookup(_prompt("b"), "m")[0].message.content == "cached"
+    assert cache.lookup(_prompt("b"), "other") is None
+
+
+def test_least_recently_used_rows_are_evicted_over_max_bytes(tmp_path):
+    cache = SqliteLLMCache(str(tmp_path / "llm.sqlite"), max_bytes=1, evict_every=1)
+    cache.update(_prompt("a"), "m", [ChatGeneration(message=AIMessage("x"))])
+    assert cache.stats()["entries"] == 0
+    cache.max_bytes = 1 << 20
+    for i in range(3):
+        cache.update(_prompt("a"), f"m{i}", [ChatGeneration(message=AIMessage("x"))])
+    assert cache.stats()["entries"] == 3
+    cache.clear()
+    assert cache.stats() == {"entries": 0, "bytes": 0}
+
+
+def test_guarded_model_replays_from_the_cache(tmp_path):
+    cache = SqliteLLMCache(str(tmp_path / "llm.sqlite"), max_bytes=1 << 20)
+    inner = _CountingModel()
+    model = GuardedChatModel(inner=inner, cache=cache)
+    first = model.invoke([HumanMessage("hi", id="run-1")])
+    second = model.invoke([HumanMessage("hi", id="run-2")])
+    assert first.content == second.content == "answer 1"
+    assert inner.calls == 1
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from app.config import settings
+from src.llms import DEFAULT_SCRIPT, ScriptedChatModel, ScriptedLLM, parse_latency, script_from_messages
+from src.prompts import EVAL_PROMPT, EVAL_PROMPT_SEQUENTIAL
+
+MIXED_NOTE = "Acute appendicitis diagnosis; laparoscopic appendectomy performed"
+
+
+def _tools(*names):
+    return [{"type": "function", "function": {"name": n}} for n in names]
+
+
+def _model(script=DEFAULT_SCRIPT, **kwargs) -> ScriptedChatModel:
+    return ScriptedChatModel(script=script, **kwargs)
+
+
+def _calls(message):
+    return [(c["name"], c["args"]) for c in message.tool_calls]
+
+
+@pytest.mark.parametrize("spec, low, high", [
+    ("fixed:0.5", 0.5, 0.5), ("uniform:0.2,0.4", 0.2, 0.4), ("exponential:0.1", 0.0, float("inf")),
+    ("lognormal:0.8,0.5", 0.0, float("inf")), ("normal:-5,0.1", 0.0, 0.0),  # never negative
+])
+def test_parse_latency_samples_within_bounds(spec, low, high):
+    sample, rng = parse_latency(spec), random.Random(1)
+    assert all(low <= sample(rng) <= high for _ in range(50))
+
+
+@pytest.mark.parametrize("spec", ["bogus:1", "uniform:1", "fixed:x", "fixed", "normal:1,2,3"])
+def test_parse_latency_rejects_bad_specs(spec):
+    with pytest.raises(ValueError, match="Invalid latency spec"):
+        parse_latency(spec)
+
+
+def test_same_seed_gives_the_same_delays():
+    def delays(seed):
+        llm = ScriptedLLM(latency="lognormal:0.5,0.5", token_seconds=0.01, seed=seed)
+        return [llm.llm._reply([HumanMessage("chest pain")], None)[1] for _ in range(5)]
+
+    assert delays(3) == delays(3)
+    assert delays(3) != delays(4)
+
+
+def test_default_script_routes_by_bound_tools():
+    model = _model()
+    reply, _ = model._reply([HumanMessage("type 2 diabetes")], _tools("icd10_query"))
+    assert _calls(reply) == [("icd10_query", {"query": "type 2 diabetes"})]
+    reply, _ = model._reply([HumanMessage("hip replacement surgery")], _tools("task"))
+    assert _calls(reply) == [("task", {"subagent_type": "procedures_agent", "description": "hip replacement surgery"})]
+    # calls to tools that are not bound are dropped
+    reply, _ = model._reply([HumanMessage("stent")], _tools("icd10pcs_procedure_query"))
+    assert [name for name, _ in _calls(reply)] == ["icd10pcs_procedure_query"]
+
+
+def test_tool_placeholder_joins_every_result_since_the_user_message():
+    messages = [
+        HumanMessage("old question"), ToolMessage("stale", tool_call_id="0"),
+        HumanMessage("stent"),
+        AIMessage("", tool_calls=[{"name": "a", "args": {}, "id": "1"}, {"name": "b", "args": {}, "id": "2"}]),
+        ToolMessage("result A", tool_call_id="1"), ToolMessage("result B", tool_call_id="2"),
+    ]
+    reply, _ = _model()._reply(messages, None)
+    assert reply.content == "result A\n\nresult B"
+
+
+def test_rules_match_on_the_human_message_and_system_prompt():
+    script = [
+        {"match": {"last": "tool", "human": "(?i)cholera", "system": "diagnosis"}, "reply": {"content": "CM: {human}"}},
+        {"match": {"last": "tool"}, "reply": {"content": "other"}},
+    ]
+    messages = [SystemMessage("You are the diagnosis agent"), HumanMessage("Cholera"), ToolMessage("r", tool_call_id="1")]
+    assert _model(script)._reply(messages, None)[0].content == "CM: Cholera"
+    messages[0] = SystemMessage("You are the procedures agent")
+    assert _model(script)._reply(messages, None)[0].content == "other"
+    # nothing matches: the default catch-all rule
+    assert _model([])._reply([HumanMessage("hi")], None)[0].content == "No scripted reply matched: hi"
+
+
+def test_recorded_conversation_replays_after_the_exact_message():
+    recorded = [HumanMessage("code E11.9"), AIMessage("E11.9 is type 2 diabetes")]
+    model = _model(script_from_messages(recorded) + DEFAULT_SCRIPT)
+    assert model._reply([HumanMessage(" code E11.9 ")], None)[0].content == "E11.9 is type 2 diabetes"
+
+
+def test_parallel_prompt_dispatches_both_subagents_in_one_turn():
+    reply, _ = _model()._reply([SystemMessage(EVAL_PROMPT), HumanMessage(MIXED_NOTE)], _tools("task"))
+    assert [args["subagent_type"] for _, args in _calls(reply)] == ["diagnosis_agent", "procedures_agent"]
+
+
+def test_sequential_prompt_dispatches_one_subagent_per_turn():
+    model = _model()
+    messages = [SystemMessage(EVAL_PROMPT_SEQUENTIAL), HumanMessage(MIXED_NOTE)]
+    first, _ = model._reply(messages, _tools("task"))
+    assert [args["subagent_type"] for _, args in _calls(first)] == ["diagnosis_agent"]
+    messages += [first, ToolMessage("ICD-10-CM candidates: K35.80", tool_call_id=first.tool_calls[0]["id"])]
+    second, _ = model._reply(messages, _tools("task"))
+    assert _calls(second) == [("task", {"subagent_type": "procedures_agent", "description": MIXED_NOTE})]
+
+
+def test_subagent_dispatch_setting_selects_the_prompt_and_cache_fingerprint(monkeypatch):
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from src.models.agent_model import AgentManager
+
+    managers = {}
+    for mode in ("parallel", "sequential"):
+        monkeypatch.setattr(settings, "SUBAGENT_DISPATCH", mode)
+        managers[mode] = AgentManager(ScriptedLLM(latency="fixed:0"), checkpointer=InMemorySaver())
+    assert managers["parallel"].supervisor_prompt == EVAL_PROMPT
+    assert managers["sequential"].supervisor_prompt == EVAL_PROMPT_SEQUENTIAL
+    assert managers["parallel"]._cache_fingerprint()() != managers["sequential"]._cache_fingerprint()()
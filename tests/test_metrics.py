@@ -0,0 +1,67 @@
+import pytest
+
+from src.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_render_and_value():
+    c = Counter("requests_total", "Requests", ["route"])
+    c.inc(route="/chat")
+    c.inc(2, route="/chat")
+    c.inc(route="/jobs")
+    assert c.value(route="/chat") == 3
+    assert c.render() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/chat"} 3',
+        'requests_total{route="/jobs"} 1',
+    ]
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    g, live = Gauge("depth", "Queue depth"), [1]
+    g.set_function(lambda: live[0])
+    live[0] = 7
+    assert g.render()[-1] == "depth 7"
+
+
+def test_gauge_function_errors_drop_the_sample():
+    g = Gauge("broken", "Raises")
+    g.set_function(lambda: 1 / 0)
+    assert g.render() == ["# HELP broken Raises", "# TYPE broken gauge"]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v, stage="llm")
+    assert h.render()[2:] == [
+        'latency_seconds_bucket{stage="llm",le="0.1"} 2',
+        'latency_seconds_bucket{stage="llm",le="1"} 3',
+        'latency_seconds_bucket{stage="llm",le="+Inf"} 4',
+        'latency_seconds_sum{stage="llm"} 3.65',
+        'latency_seconds_count{stage="llm"} 4',
+    ]
+
+
+def test_histogram_time_observes_on_error():
+    h = Histogram("op_seconds", "Op")
+    with pytest.raises(RuntimeError):
+        with h.time():
+            raise RuntimeError
+    assert h.render()[-1] == "op_seconds_count 1"
+
+
+def test_registry_reuses_metrics_and_rejects_kind_clashes():
+    r = Registry()
+    assert r.get_or_create(Counter, "x", "X") is r.get_or_create(Counter, "x", "X")
+    with pytest.raises(ValueError):
+        r.get_or_create(Gauge, "x", "X")
+    assert r.render().startswith("# HELP x X\n# TYPE x counter\n")
+
+
+def test_histogram_summary_is_count_and_sum_per_label_set():
+    h = Histogram("stage_seconds", "Stage", ["stage"], buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v, stage="llm")
+    assert h.summary(stage="llm") == (4, pytest.approx(3.65))
+    assert h.summary(stage="other") == (0, 0.0)
@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import Future
+
+from app.config import settings
+from src import tools
+
+
+def _done(value: str) -> Future:
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+
+def _patch(monkeypatch, calls):
+    def fake(name):
+        def search(query: str, fmt=None) -> str:
+            """Fake retrieval."""
+            calls.append((name, query))
+            return f"{name}:{query}"
+        return search
+
+    monkeypatch.setattr(settings, "RETRIEVAL_PREFETCH", True)
+    monkeypatch.setattr(settings, "RETRIEVAL_PREFETCH_MIN_OVERLAP", 0.6)
+    monkeypatch.setattr(tools, "_icd10_query", fake("cm"))
+    monkeypatch.setattr(tools, "_icd10pcs_procedure_query", fake("pcs"))
+
+
+def test_match_tolerates_case_punctuation_and_small_rewrites(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_PREFETCH_MIN_OVERLAP", 0.6)
+    prefetch = tools.RetrievalPrefetch("Acute appendicitis with perforation", {"icd10_query": _done("hit")})
+    assert prefetch.match("icd10_query", "acute appendicitis, with perforation!").result() == "hit"
+    assert prefetch.match("icd10_query", "acute appendicitis perforation") is not None
+    assert prefetch.match("icd10_query", "laparoscopic appendectomy") is None
+    assert prefetch.match("icd10pcs_procedure_query", "Acute appendicitis with perforation") is None
+
+
+def test_close_cancels_unused_prefetches():
+    used, unused = Future(), Future()
+    prefetch = tools.RetrievalPrefetch("q", {"icd10_query": used, "icd10pcs_procedure_query": unused})
+    prefetch.match("icd10_query", "q")
+    prefetch.close()
+    assert unused.cancelled() and not used.cancelled()
+
+
+def test_tools_inside_the_block_reuse_the_prefetched_search(monkeypatch):
+    calls = []
+    _patch(monkeypatch, calls)
+    tool = tools._retrieval_tool("icd10_query", tools._icd10_query)
+    with tools.prefetching("Type 2 diabetes with neuropathy") as prefetch:
+        for fut in prefetch.futures.values():
+            fut.result()
+        assert tool.invoke({"query": "type 2 diabetes with neuropathy"}) == "cm:Type 2 diabetes with neuropathy"
+        assert asyncio.run(tool.ainvoke({"query": "Type 2 diabetes, neuropathy"})) == "cm:Type 2 diabetes with neuropathy"
+        assert tool.invoke({"query": "hip replacement"}) == "cm:hip replacement"
+    assert sorted(calls) == [("cm", "Type 2 diabetes with neuropathy"), ("cm", "hip replacement"),
+                             ("pcs", "Type 2 diabetes with neuropathy")]
+    assert tool.invoke({"query": "type 2 diabetes with neuropathy"}) == "cm:type 2 diabetes with neuropathy"
+
+
+def test_prefetching_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_PREFETCH", False)
+    with tools.prefetching("anything") as prefetch:
+        assert prefetch is None
+
+
+def test_failed_prefetch_falls_back_to_a_fresh_search(monkeypatch):
+    calls = []
+    _patch(monkeypatch, calls)
+    tool = tools._retrieval_tool("icd10_query", tools._icd10_query)
+    failed = Future()
+    failed.set_exception(RuntimeError("chroma unavailable"))
+    misses = tools._prefetch_lookups.value(tool="icd10_query", result="miss")
+    token = tools._PREFETCH.set(tools.RetrievalPrefetch("sepsis", {"icd10_query": failed}))
+    try:
+        assert tool.invoke({"query": "sepsis"}) == "cm:sepsis"
+        assert asyncio.run(tool.ainvoke({"query": "sepsis"})) == "cm:sepsis"
+    finally:
+        tools._PREFETCH.reset(token)
+    assert calls == [("cm", "sepsis"), ("cm", "sepsis")]
+    assert tools._prefetch_lookups.value(tool="icd10_query", result="miss") == misses + 2
+
+
+def test_prefetch_hits_are_timed():
+    def unused(query: str) -> str:
+        """Never called: the prefetch serves the query."""
+        raise AssertionError(query)
+
+    tool = tools._retrieval_tool("icd10pcs_procedure_query", unused)
+    timed = tools._tool_latency.summary(tool="icd10pcs_procedure_query")[0]
+    token = tools._PREFETCH.set(tools.RetrievalPrefetch("stent", {"icd10pcs_procedure_query": _done("pcs:stent")}))
+    try:
+        assert tool.invoke({"query": "stent"}) == "pcs:stent"
+        assert asyncio.run(tool.ainvoke({"query": "stent"})) == "pcs:stent"
+    finally:
+        tools._PREFETCH.reset(token)
+    assert tools._tool_latency.summary(tool="icd10pcs_procedure_query")[0] == timed + 2
+
+
+def test_stream_closed_early_unwinds_the_prefetch_block(monkeypatch):
+    from app.routers.chat import _sse
+
+    _patch(monkeypatch, [])
+    unused = tools._prefetch_lookups.value(tool="icd10_query", result="unused")
+    closed = []
+
+    async def events():
+        try:
+            with tools.prefetching("renal colic"):
+                yield {"event": "start", "data": {}}
+                await asyncio.sleep(3600)
+        finally:
+            closed.append(tools._PREFETCH.get())
+
+    async def scenario():
+        stream = _sse(events())
+        assert (await stream.__anext__()).startswith("event: start")
+        await stream.aclose()
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert closed == [None]
+    assert tools._prefetch_lookups.value(tool="icd10_query", result="unused") == unused + 1
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.llms import GuardedChatModel
+from src.ratelimit import SqliteTokenBucketLimiter, TokenBucketLimiter, backoff_delay, retry_reason
+
+
+class _RateLimited(Exception):
+    code = 429
+
+
+class _FlakyModel(BaseChatModel):
+    """Answers after `failures` 429s, reporting `used` tokens."""
+
+    failures: int = 2
+    used: int = 500
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "flaky"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise _RateLimited("429 RESOURCE_EXHAUSTED")
+        usage = {"input_tokens": self.used - 10, "output_tokens": 10, "total_tokens": self.used}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage("ok", usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+
+def _tokens_left(limiter: TokenBucketLimiter) -> float:
+    return limiter._transact(lambda state: (state, limiter._refill(state)[1]))
+
+
+def test_bucket_waits_when_empty_and_charges_the_difference():
+    limiter = TokenBucketLimiter(rpm=2, tpm=1000)
+    assert limiter.try_acquire(100) == 0
+    assert limiter.try_acquire(100) == 0
+    assert limiter.try_acquire(100) > 0  # out of requests
+    limiter.charge(500)  # the calls used more than estimated
+    assert _tokens_left(limiter) < 400
+
+
+def test_refund_never_overfills_the_bucket():
+    limiter = TokenBucketLimiter(rpm=0, tpm=1000)
+    limiter.charge(-5000)
+    assert _tokens_left(limiter) == 1000
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    path = str(tmp_path / "rate.sqlite3")
+    a = SqliteTokenBucketLimiter(1, 0, path)
+    b = SqliteTokenBucketLimiter(1, 0, path)
+    assert a.try_acquire(1) == 0
+    assert b.try_acquire(1) > 0
+
+
+def test_sqlite_async_path_stays_off_the_event_loop(tmp_path):
+    limiter = SqliteTokenBucketLimiter(10, 1000, str(tmp_path / "rate.sqlite3"))
+    threads = []
+    transact = limiter._transact
+
+    def spy(fn):
+        threads.append(threading.current_thread())
+        return transact(fn)
+
+    limiter._transact = spy
+
+    async def scenario():
+        await limiter.aacquire(10)
+        await limiter.acharge(5)
+
+    asyncio.run(scenario())
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_retries_refund_the_tokens_of_failed_attempts():
+    prompt = [HumanMessage("x" * 4000)]  # ~1000 estimated tokens
+    for call in ("invoke", "ainvoke"):
+        limiter = TokenBucketLimiter(rpm=0, tpm=100_000)
+        inner = _FlakyModel()
+        model = GuardedChatModel(inner=inner, limiter=limiter, retry_base_seconds=0.0)
+        result = model.invoke(prompt) if call == "invoke" else asyncio.run(model.ainvoke(prompt))
+        assert result.content == "ok" and inner.calls == 3
+        # only the successful call's real usage stays charged, not 3 estimates
+        assert _tokens_left(limiter) > 100_000 - 600
+
+
+def test_retry_classification_and_backoff():
+    assert retry_reason(_RateLimited()) == "rate_limited"
+    assert retry_reason(RuntimeError("503 UNAVAILABLE")) == "server_error"
+    assert retry_reason(ValueError("bad request")) is None
+    wrapped = RuntimeError("wrapper")
+    wrapped.__cause__ = _RateLimited()
+    assert retry_reason(wrapped) == "rate_limited"
+    assert all(0 <= backoff_delay(attempt, 1.0, 4.0) <= 4.0 for attempt in range(10))
@@ -0,0 +1,10 @@
+from app.schemas.chat import DecisionResponse, StartResponse
+
+
+def test_decision_response_carries_the_next_approval():
+    # A resume that hits another interrupt returns the same shape as /chat/start
+    result = {"status": "pending_approval", "thread_id": "t1",
+              "actions": [{"name": "icd10_query", "args": {"query": "cholera"}}], "usage": {}}
+    decision = DecisionResponse.model_validate(result).model_dump(exclude_none=True)
+    assert decision == StartResponse.model_validate(result).model_dump(exclude_none=True)
+    assert decision["actions"][0]["name"] == "icd10_query"
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_threads_with_the_same_key_share_one_call():
+    flight, calls, results = SingleFlight("test"), [], []
+    gate = threading.Event()
+
+    def fn():
+        calls.append(1)
+        gate.wait(5)
+        return {"answer": 42}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while len(flight) == 0:
+        time.sleep(0.001)
+    time.sleep(0.05)  # let the followers join
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert len(flight) == 0
+
+
+def test_leader_error_reaches_every_caller_and_clears_the_key():
+    flight = SingleFlight("test")
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+def test_coroutines_share_one_task_and_survive_the_leader_cancelling():
+    async def scenario():
+        flight, calls = AsyncSingleFlight("test"), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()  # the leader's client went away
+        assert await follower == ("done", True)
+        assert calls == [1]
+        assert len(flight) == 0
+        assert await flight.do("other", fn) == ("done", False)
+
+    asyncio.run(scenario())
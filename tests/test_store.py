@@ -0,0 +1,122 @@
+import sqlite3
+import time
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from src.store import BoundedMemorySaver, MemorySessionStore, SqliteCheckpointSaver, SqliteSessionStore
+
+
+def _put(saver, thread_id: str) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": [f"hello from {thread_id}"]}
+    checkpoint["channel_versions"] = {"messages": "1"}
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    return saver.put(config, checkpoint, {"source": "input", "step": 0}, {"messages": "1"})
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_saver(request, tmp_path):
+    def make(**kwargs):
+        kwargs = {"ttl_seconds": 3600, "max_threads": 100, "max_bytes": 10**9, **kwargs}
+        if request.param == "sqlite":
+            return SqliteCheckpointSaver(str(tmp_path / "state.sqlite3"), **kwargs)
+        return BoundedMemorySaver(**kwargs)
+    return make
+
+
+def test_saver_round_trip(make_saver):
+    saver = make_saver()
+    config = _put(saver, "t1")
+    item = saver.get_tuple({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}})
+    assert item.checkpoint["id"] == config["configurable"]["checkpoint_id"]
+    assert item.checkpoint["channel_values"] == {"messages": ["hello from t1"]}
+
+
+def test_saver_enforces_max_threads_on_every_put(make_saver):
+    evicted = []
+    saver = make_saver(max_threads=3, on_evict=evicted.extend)
+    for i in range(5):
+        _put(saver, f"t{i}")
+    assert saver.stats()["threads"] == 3
+    assert evicted == ["t0", "t1"]  # least recently used first
+    assert saver.get_tuple({"configurable": {"thread_id": "t0", "checkpoint_ns": ""}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "t4", "checkpoint_ns": ""}}) is not None
+
+
+def test_saver_stats_drops_expired_threads(make_saver):
+    saver = make_saver(ttl_seconds=0.05)
+    _put(saver, "t1")
+    time.sleep(0.1)
+    assert saver.stats()["threads"] == 0
+
+
+def test_saver_keeps_last_checkpoints_per_thread(make_saver):
+    saver = make_saver(max_checkpoints_per_thread=2)
+    for _ in range(5):
+        _put(saver, "t1")
+    assert len(list(saver.list({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}))) == 2
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_sessions(request, tmp_path):
+    def make(**kwargs):
+        kwargs = {"ttl_seconds": 3600, "max_entries": 100, "max_bytes": 10**9, **kwargs}
+        if request.param == "sqlite":
+            return SqliteSessionStore(str(tmp_path / "state.sqlite3"), **kwargs)
+        return MemorySessionStore(**kwargs)
+    return make
+
+
+def test_sessions_round_trip_and_pop(make_sessions):
+    sessions = make_sessions()
+    sessions["t1"] = {"actions": [{"name": "icd10_query"}]}
+    assert "t1" in sessions
+    assert sessions.get("t1") == {"actions": [{"name": "icd10_query"}]}
+    assert sessions.pop("t1") == {"actions": [{"name": "icd10_query"}]}
+    assert sessions.get("t1") is None
+
+
+def test_sessions_evict_lru_and_expired(make_sessions):
+    sessions = make_sessions(max_entries=2)
+    for i in range(3):
+        sessions[f"t{i}"] = {"i": i}
+    assert "t0" not in sessions and "t2" in sessions
+
+    sessions = make_sessions(ttl_seconds=0.05)
+    sessions["t1"] = {}
+    time.sleep(0.1)
+    assert sessions.get("t1") is None
+
+
+def test_sqlite_reads_do_not_take_the_write_lock(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    saver = SqliteCheckpointSaver(path, ttl_seconds=3600, max_threads=100, max_bytes=10**9)
+    _put(saver, "t1")
+    saver.conn.execute("PRAGMA busy_timeout=100")
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")  # another worker mid-put
+    try:
+        item = saver.get_tuple({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}})
+        assert item.checkpoint["channel_values"] == {"messages": ["hello from t1"]}
+        assert len(list(saver.list({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}))) == 1
+    finally:
+        writer.execute("ROLLBACK")
+
+
+def test_sqlite_reads_refresh_lru_at_most_once_per_interval(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "state.sqlite3"), ttl_seconds=3600, max_threads=2,
+                                  max_bytes=10**9, touch_interval_seconds=0)
+    _put(saver, "t0")
+    _put(saver, "t1")
+    saver.get_tuple({"configurable": {"thread_id": "t0", "checkpoint_ns": ""}})  # t1 is now the LRU thread
+    _put(saver, "t2")
+    assert saver.get_tuple({"configurable": {"thread_id": "t0", "checkpoint_ns": ""}}) is not None
+    assert saver.get_tuple({"configurable": {"thread_id": "t1", "checkpoint_ns": ""}}) is None
+
+    writes = []
+    saver.touch_interval_seconds = 3600
+    saver.conn.set_trace_callback(lambda sql: writes.append(sql) if sql.startswith("UPDATE threads") else None)
+    for _ in range(3):
+        saver.get_tuple({"configurable": {"thread_id": "t2", "checkpoint_ns": ""}})
+    assert writes == []  # just written by its put
@@ -0,0 +1,22 @@
+import asyncio
+
+from src import tools
+
+
+def _fake_search(query: str, fmt=None) -> str:
+    """Look up `query` in the fake index."""
+    return f"{query}|{fmt or 'default'}"
+
+
+def test_retrieval_tools_expose_only_query():
+    for tool in (tools.icd10_query, tools.icd10pcs_procedure_query, tools.icd10pcs_guidelines_query):
+        assert set(tool.args) == {"query"}, tool.name
+        assert "fmt" not in tool.description
+        assert "TOOL_OUTPUT_FORMAT" not in tool.description
+
+
+def test_retrieval_tool_runs_with_the_default_format():
+    tool = tools._retrieval_tool("fake_query", _fake_search)
+    assert tool.description == "Look up `query` in the fake index."
+    assert tool.invoke({"query": "appendix"}) == "appendix|default"
+    assert asyncio.run(tool.ainvoke({"query": "appendix"})) == "appendix|default"
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from src.usage import TokenBudgetExceeded, TokenLedger, current_ledger, fit_tool_output, merge_usage, metered
+
+
+def test_ledger_totals_by_agent():
+    ledger = TokenLedger()
+    ledger.record_call("supervisor", 100, 20)
+    ledger.record_call("procedures_agent", 50, 5)
+    ledger.record_call("supervisor", 10, 1)
+    usage = ledger.to_dict()
+    assert usage["total_tokens"] == 186 and usage["calls"] == 3
+    assert usage["by_agent"]["supervisor"] == {"calls": 2, "input": 110, "output": 21}
+
+
+def test_request_and_thread_budgets():
+    ledger = TokenLedger(request_budget=100, thread_budget=250, thread_before=200)
+    ledger.record_call("a", 30, 0)
+    assert ledger.remaining() == 20  # the thread budget is the tighter one
+    ledger.check(20)
+    with pytest.raises(TokenBudgetExceeded) as e:
+        ledger.check(21)
+    assert e.value.scope == "thread" and e.value.used == 230
+
+
+def test_metered_ledger_reaches_tasks_and_is_reset(monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_PER_REQUEST", 0)
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_PER_THREAD", 0)
+
+    async def call_model():
+        current_ledger().record_call("diagnosis_agent", 7, 3)
+
+    async def scenario():
+        with metered() as ledger:
+            await asyncio.gather(call_model(), call_model())
+        return ledger
+
+    ledger = asyncio.run(scenario())
+    assert ledger.total == 20
+    assert current_ledger() is None
+
+
+def test_merge_usage_accumulates_per_thread():
+    ledger = TokenLedger()
+    ledger.record_call("a", 10, 5)
+    totals = merge_usage(merge_usage(None, ledger), ledger)
+    assert totals == {"requests": 2, "calls": 2, "input_tokens": 20, "output_tokens": 10, "total_tokens": 30}
+
+
+def test_fit_tool_output_cuts_at_a_line_boundary(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_OUTPUT_MAX_TOKENS", 10)  # ~40 chars
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_PER_REQUEST", 0)
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_PER_THREAD", 0)
+    text = "\n".join(f"line {i:02d}" for i in range(20))  # 7 chars + newline each
+    with metered() as ledger:
+        fitted = fit_tool_output("icd10_query", text)
+    kept = fitted.splitlines()[:-1]
+    assert kept == [f"line {i:02d}" for i in range(len(kept))] and len(kept) == 5
+    assert fitted.splitlines()[-1].startswith("… [truncated: 15 of 20 lines")
+    assert ledger.truncated == 1 and ledger.tool_tokens["icd10_query"] > 0
+
+
+def test_fit_tool_output_leaves_short_results_alone(monkeypatch):
+    monkeypatch.setattr(settings, "TOOL_OUTPUT_MAX_TOKENS", 1000)
+    assert fit_tool_output("icd10_query", "A00 — Cholera") == "A00 — Cholera"
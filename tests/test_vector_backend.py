@@ -0,0 +1,110 @@
+import os
+import uuid
+
+import chromadb
+import numpy as np
+import pytest
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.vector_stores.chroma import ChromaVectorStore
+
+from app.config import settings
+from src import tools
+
+DIM = 16
+
+
+def _index(name: str, vectors: np.ndarray, space: str = "l2") -> VectorStoreIndex:
+    # The in-process client is shared by every test: one fresh collection per index
+    collection = chromadb.EphemeralClient().create_collection(f"{name}-{uuid.uuid4().hex[:8]}",
+                                                              metadata={"hnsw:space": space})
+    if not len(vectors):
+        return VectorStoreIndex.from_vector_store(ChromaVectorStore(chroma_collection=collection),
+                                                  embed_model=MockEmbedding(embed_dim=DIM))
+    collection.add(
+        ids=[f"id{i}" for i in range(len(vectors))],
+        embeddings=vectors.tolist(),
+        documents=[f"doc {i}" for i in range(len(vectors))],
+        metadatas=[{"parity": "even" if i % 2 == 0 else "odd", "i": i} for i in range(len(vectors))],
+    )
+    return VectorStoreIndex.from_vector_store(ChromaVectorStore(chroma_collection=collection),
+                                              embed_model=MockEmbedding(embed_dim=DIM))
+
+
+@pytest.fixture(autouse=True)
+def vectors_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_VECTORS_DIR", str(tmp_path / "vectors"))
+    return tmp_path / "vectors"
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(7)
+    return rng.normal(size=(300, DIM)).astype(np.float32), rng.normal(size=(10, DIM)).astype(np.float32)
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+def test_numpy_engine_matches_exact_search(data, space):
+    vectors, queries = data
+    index = _index(f"exact_{space}", vectors, space)
+    engine = tools.NumpyRetrievalEngine(f"exact_{space}", index, quantization="none")
+    for q in queries:
+        hits = engine.search(q.tolist(), 5)
+        dist = engine.distances(q.tolist())
+        assert [h.id for h in hits] == [f"id{i}" for i in np.argsort(dist, kind="stable")[:5]]
+        assert hits[0].text.startswith("doc ") and "parity" in hits[0].metadata
+    # scores match Chroma's on the same collection
+    chroma = tools.RetrievalEngine(f"exact_{space}", index)
+    expected = chroma.search(queries[0].tolist(), 3)
+    got = engine.search(queries[0].tolist(), 3)
+    assert [h.id for h in got] == [h.id for h in expected]
+    assert np.allclose([h.score for h in got], [h.score for h in expected], rtol=1e-4)
+
+
+def test_numpy_engine_applies_where_filters(data):
+    vectors, queries = data
+    engine = tools.NumpyRetrievalEngine("filtered", _index("filtered", vectors), quantization="none")
+    hits = engine.search(queries[0].tolist(), 5, {"parity": "odd"})
+    assert len(hits) == 5 and all(h.metadata["parity"] == "odd" for h in hits)
+    hits = engine.search(queries[0].tolist(), 5, {"$and": [{"parity": "even"}, {"i": {"$in": [0, 2, 4]}}]})
+    assert sorted(h.metadata["i"] for h in hits) == [0, 2, 4]
+
+
+@pytest.mark.parametrize("mode", ["none", "int8", "float16"])
+def test_empty_collection_returns_no_hits(mode):
+    engine = tools.NumpyRetrievalEngine(f"empty_{mode}", _index(f"empty_{mode}", np.zeros((0, DIM))), quantization=mode)
+    q = np.ones(DIM).tolist()
+    assert engine.search(q, 5) == []
+    assert engine.search(q, 5, {"parity": "odd"}) == []
+    assert len(engine.distances(q)) == 0
+
+
+@pytest.mark.parametrize("mode", ["int8", "float16"])
+def test_quantized_engine_rescores_to_exact_results(data, mode):
+    vectors, queries = data
+    index = _index(f"quantized_{mode}", vectors)
+    exact = tools.NumpyRetrievalEngine(f"quantized_{mode}", index, quantization="none")
+    quantized = tools.NumpyRetrievalEngine(f"quantized_{mode}", index, quantization=mode)
+    assert quantized.quantized and quantized.resident_bytes() < exact.resident_bytes()
+    assert isinstance(quantized.matrix, np.memmap)
+    for q in queries:
+        want, got = exact.search(q.tolist(), 5), quantized.search(q.tolist(), 5)
+        assert [h.id for h in got] == [h.id for h in want]
+        assert np.allclose([h.score for h in got], [h.score for h in want])  # rescored in float32
+
+
+def test_spilled_vectors_are_written_once_and_shared(data, vectors_dir):
+    vectors, _ = data
+    index = _index("shared", vectors)
+    first = tools.NumpyRetrievalEngine("shared", index, quantization="int8")
+    files = os.listdir(vectors_dir)
+    mtime = os.stat(first.matrix.filename).st_mtime_ns
+    second = tools.NumpyRetrievalEngine("shared", index, quantization="int8")  # another worker
+    assert second.matrix.filename == first.matrix.filename
+    assert os.stat(second.matrix.filename).st_mtime_ns == mtime
+    assert os.listdir(vectors_dir) == files
+
+    # New vectors for the collection: a new file replaces the stale one
+    changed = tools.NumpyRetrievalEngine("shared", _index("shared", vectors * 2), quantization="int8")
+    assert changed.matrix.filename != first.matrix.filename
+    assert sorted(f for f in os.listdir(vectors_dir) if f.endswith(".npy")) == [os.path.basename(changed.matrix.filename)]